@@ -0,0 +1,48 @@
+import sys, os
+benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(benchmarkDir)) # This needs to work from the benchmarks subdirectory
+from txircd.ircbase import IRCBase
+from timeit import default_timer
+
+# Replays captured traffic through the line parser and reports how many lines per second it parses. Each traffic
+# file has one raw line per line, as received from a client or server. Capture files can be given on the command
+# line; by default, the sample client and server traffic next to this file is used.
+
+def readLines(fileName):
+	with open(fileName, "rb") as trafficFile:
+		return [line.rstrip("\r\n") for line in trafficFile if line.rstrip("\r\n")]
+
+def benchmark(parser, lines, minimumTime):
+	parseLine = parser._parseLine
+	rounds = 0
+	startTime = default_timer()
+	elapsed = 0
+	while elapsed < minimumTime:
+		for line in lines:
+			parseLine(line)
+		rounds += 1
+		elapsed = default_timer() - startTime
+	return rounds * len(lines), elapsed
+
+if __name__ == "__main__":
+	args = sys.argv[1:]
+	minimumTime = 2.0
+	if len(args) >= 2 and args[0] == "-t":
+		try:
+			minimumTime = float(args[1])
+		except ValueError:
+			print("Usage: {} [-t seconds] [traffic file ...]".format(__file__))
+			sys.exit(1)
+		args = args[2:]
+	if not args:
+		args = [os.path.join(benchmarkDir, "client-traffic.txt"), os.path.join(benchmarkDir, "server-traffic.txt")]
+	parser = IRCBase()
+	allLines = []
+	for fileName in args:
+		lines = readLines(fileName)
+		allLines.extend(lines)
+		lineCount, elapsed = benchmark(parser, lines, minimumTime)
+		print("{}: {} lines, {:.0f} lines/second".format(os.path.basename(fileName), len(lines), lineCount / elapsed))
+	if len(args) > 1:
+		lineCount, elapsed = benchmark(parser, allLines, minimumTime)
+		print("All traffic: {} lines, {:.0f} lines/second".format(len(allLines), lineCount / elapsed))
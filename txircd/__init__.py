@@ -1,2 +1,3 @@
 version = "0.4.4"
-protoVersion = "400"
\ No newline at end of file
+protoVersion = "401"
+protoFeatures = [ "BULKBURST" ]
\ No newline at end of file
@@ -1,6 +1,6 @@
 from twisted.words.protocols import irc
-from txircd.utils import CaseInsensitiveDictionary, isValidChannelName, isValidMetadataKey, ModeType, now
-from weakref import WeakKeyDictionary
+from txircd.utils import CaseInsensitiveDictionary, isValidChannelName, isValidMetadataKey, ModeType
+from weakref import WeakKeyDictionary, WeakSet
 
 class IRCChannel(object):
 	def __init__(self, ircd, name):
@@ -9,14 +9,68 @@ class IRCChannel(object):
 		self.ircd = ircd
 		self.name = name[:self.ircd.config.get("channel_name_length", 64)]
 		self.users = WeakKeyDictionary()
+		self.localUsers = WeakSet()
+		self.remoteUsersByLink = {}
+		self.capabilityCounts = {} # Capability bit -> number of local users in the channel with it
 		self.modes = {}
-		self.existedSince = now()
+		self.existedSince = self.ircd.clock.now()
 		self.topic = ""
 		self.topicSetter = ""
-		self.topicTime = now()
+		self.topicTime = self.ircd.clock.now()
 		self._metadata = CaseInsensitiveDictionary()
 		self.cache = {}
 	
+	def addUser(self, user):
+		"""
+		Adds a user to the channel's user list and membership indexes. This
+		only updates the membership data; use the user's joinChannel to
+		actually join a user to the channel.
+		"""
+		self.users[user] = { "status": "" }
+		if user.uuid[:3] == self.ircd.serverID:
+			self.localUsers.add(user)
+			self._countCapabilities(user.capabilityMask, 1)
+			return
+		linkServer = self.ircd.serverLink(user.uuid[:3])
+		if linkServer not in self.remoteUsersByLink:
+			self.remoteUsersByLink[linkServer] = WeakSet()
+		self.remoteUsersByLink[linkServer].add(user)
+	
+	def removeUser(self, user):
+		"""
+		Removes a user from the channel's user list and membership indexes.
+		This only updates the membership data; use the user's leaveChannel to
+		actually remove a user from the channel.
+		"""
+		del self.users[user]
+		if user in self.localUsers:
+			self.localUsers.discard(user)
+			self._countCapabilities(user.capabilityMask, -1)
+			return
+		for linkServer, linkUsers in self.remoteUsersByLink.iteritems():
+			if user in linkUsers:
+				linkUsers.discard(user)
+				if not linkUsers:
+					del self.remoteUsersByLink[linkServer]
+				return
+	
+	def _countCapabilities(self, capabilityMask, change):
+		while capabilityMask:
+			capabilityBit = capabilityMask & -capabilityMask # The lowest bit set
+			capabilityMask ^= capabilityBit
+			count = self.capabilityCounts.get(capabilityBit, 0) + change
+			if count:
+				self.capabilityCounts[capabilityBit] = count
+			else:
+				del self.capabilityCounts[capabilityBit]
+	
+	def capabilityUserCount(self, capabilityBit):
+		"""
+		Returns the number of local users in the channel with the capability
+		with the given bit.
+		"""
+		return self.capabilityCounts.get(capabilityBit, 0)
+	
 	def sendUserMessage(self, command, *params, **kw):
 		"""
 		Sends a message to all local users in a channel.
@@ -29,11 +83,11 @@ class IRCChannel(object):
 			kw["to"] = self.name
 		if kw["to"] is None:
 			del kw["to"]
-		userList = [u for u in self.users.iterkeys() if u.uuid[:3] == self.ircd.serverID]
 		if "skip" in kw:
-			for u in kw["skip"]:
-				if u in userList:
-					userList.remove(u)
+			skipUsers = set(kw["skip"])
+			userList = [u for u in self.localUsers if u not in skipUsers]
+		else:
+			userList = list(self.localUsers)
 		kw["users"] = userList
 		kw["channels"] = [self]
 		baseTags = {}
@@ -44,15 +98,36 @@ class IRCChannel(object):
 		if "conditionalTags" in kw:
 			conditionalTags = kw["conditionalTags"]
 			del kw["conditionalTags"]
+		lineCache = {} # Users getting the same message get the same built line
+		tagSets = {} # Users getting the same conditional tags share the same tag dict
+		tagBits = None
+		if conditionalTags:
+			# When every conditional tag depends only on a capability, users with the same of those capabilities get
+			# the same tags, so the tags are only filtered once for each combination.
+			tagBits = 0
+			for value, check in conditionalTags.itervalues():
+				if not isinstance(check, (int, long)):
+					tagBits = None
+					break
+				tagBits |= check
 		for user in userList:
-			if conditionalTags:
-				tags = baseTags.copy()
-				addTags = user.filterConditionalTags(conditionalTags)
-				tags.update(addTags)
+			userTags = None
+			if not conditionalTags:
+				tagSetKey = None
+			elif tagBits is not None:
+				tagSetKey = user.capabilityMask & tagBits
+				if tagSetKey not in tagSets:
+					userTags = user.filterConditionalTags(conditionalTags)
 			else:
-				tags = baseTags
-			kw["tags"] = tags
-			user.sendMessage(command, *params, **kw)
+				userTags = user.filterConditionalTags(conditionalTags)
+				tagSetKey = frozenset(userTags)
+			if tagSetKey not in tagSets:
+				tags = baseTags.copy()
+				if userTags:
+					tags.update(userTags)
+				tagSets[tagSetKey] = tags
+			kw["tags"] = tagSets[tagSetKey]
+			user.sendSharedMessage(lineCache, command, *params, **kw)
 	
 	def sendServerMessage(self, command, *params, **kw):
 		"""
@@ -64,19 +139,18 @@ class IRCChannel(object):
 		    after we've determined the closest hop of all the servers to which
 		    we're sending
 		"""
-		servers = set()
-		for user in self.users.iterkeys():
-			if user.uuid[:3] != self.ircd.serverID:
-				servers.add(self.ircd.servers[user.uuid[:3]])
 		if "skipall" in kw:
+			serverIDs = set()
+			for linkUsers in self.remoteUsersByLink.itervalues():
+				for user in linkUsers:
+					serverIDs.add(user.uuid[:3])
 			for s in kw["skipall"]:
-				servers.discard(s)
-		localServers = set()
-		for server in servers:
-			nearHop = server
-			while nearHop.nextClosest != self.ircd.serverID:
-				nearHop = self.ircd.servers[nearHop.nextClosest]
-			localServers.add(nearHop)
+				serverIDs.discard(s.serverID)
+			localServers = set()
+			for serverID in serverIDs:
+				localServers.add(self.ircd.serverLink(serverID))
+		else:
+			localServers = set(self.remoteUsersByLink.iterkeys())
 		if "skiplocal" in kw:
 			for s in kw["skiplocal"]:
 				localServers.discard(s)
@@ -100,7 +174,7 @@ class IRCChannel(object):
 		oldTopic = self.topic
 		self.topic = topic
 		self.topicSetter = source
-		self.topicTime = now()
+		self.topicTime = self.ircd.clock.now()
 		self.ircd.runActionStandard("topic", self, setter, oldTopic, channels=[self])
 		return True
 	
@@ -205,7 +279,7 @@ class IRCChannel(object):
 		defaultSourceName = self._sourceName(defaultSource)
 		if defaultSourceName is None:
 			raise ValueError ("Source must be a valid user or server ID.")
-		nowTime = now()
+		nowTime = self.ircd.clock.now()
 		for modeData in modes:
 			mode = modeData[1]
 			if mode not in self.ircd.channelModeTypes:
@@ -257,7 +331,7 @@ class IRCChannel(object):
 		adding = True
 		changes = []
 		setBy = self._sourceName(user.uuid)
-		setTime = now()
+		setTime = self.ircd.clock.now()
 		for mode in modes:
 			if len(changes) >= self.ircd.config.get("modes_per_line", 20):
 				break
@@ -412,10 +486,7 @@ class IRCChannel(object):
 	def _notifyModeChanges(self, modeChanges, source, sourceName):
 		if not modeChanges:
 			return
-		channelUsers = []
-		for user in self.users.iterkeys():
-			if user.uuid[:3] == self.ircd.serverID:
-				channelUsers.append(user)
+		channelUsers = list(self.localUsers)
 		for change in modeChanges:
 			self.ircd.runActionStandard("modechange-channel-{}".format(change[1]), self, change[3], change[0], change[2], channels=[self])
 		self.ircd.runActionProcessing("modemessage-channel", channelUsers, self, source, sourceName, modeChanges, users=channelUsers, channels=[self])
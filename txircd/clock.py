@@ -0,0 +1,58 @@
+from datetime import datetime
+from threading import Lock
+from time import time
+
+try:
+	from time import monotonic as monotonicTime
+except ImportError: # Python 2 has no monotonic clock
+	monotonicTime = None
+
+class Clock(object):
+	"""
+	Provides the current time for code that runs for every command or
+	message. The datetime for the current second is built once and then
+	reused until the second changes, instead of building a new one on every
+	call like txircd.utils.now().
+	"""
+	def __init__(self):
+		self._second = None
+		self._datetime = None
+		self._lastMonotonic = 0.0
+		self._monotonicOffset = 0.0
+		self._monotonicLock = Lock()
+	
+	def now(self):
+		"""
+		Returns the current time as a datetime with no microseconds, like
+		txircd.utils.now().
+		"""
+		second = int(time())
+		if second != self._second:
+			self._second = second
+			self._datetime = datetime.utcfromtimestamp(second)
+		return self._datetime
+	
+	def epoch(self):
+		"""
+		Returns the current time as an integer Unix timestamp, like
+		timestamp(now()).
+		"""
+		return int(time())
+	
+	def monotonic(self):
+		"""
+		Returns the current time in seconds as a float that never goes
+		backwards, for measuring intervals.
+		"""
+		if monotonicTime is not None:
+			return monotonicTime()
+		# Without a monotonic clock, use the wall clock, but when it steps backwards, add the step to an offset so
+		# that this keeps advancing from where it was instead of waiting for the wall clock to catch up. This can
+		# be called from other threads (e.g. by the stall detector), so the offset is updated under a lock.
+		with self._monotonicLock:
+			currentTime = time() + self._monotonicOffset
+			if currentTime < self._lastMonotonic:
+				self._monotonicOffset += self._lastMonotonic - currentTime
+				currentTime = self._lastMonotonic
+			self._lastMonotonic = currentTime
+			return currentTime
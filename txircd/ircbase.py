@@ -1,13 +1,101 @@
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
 from twisted.protocols.basic import LineOnlyReceiver
+from zope.interface import implements
+import re
+
+_tagEscapeSequence = re.compile(r"\\(.?)", re.DOTALL)
+_tagEscapeValues = {
+	"\\": "\\",
+	":": ";",
+	"r": "\r",
+	"n": "\n",
+	"s": " "
+}
+
+def _unescapeTagChar(match):
+	char = match.group(1)
+	return _tagEscapeValues.get(char, char)
+
+class TrafficCounters(object):
+	"""
+	Counts the data received and sent on one connection, or on all local
+	connections of one type. The commands dict counts the commands received
+	by command name.
+	"""
+	__slots__ = ("bytesIn", "bytesOut", "linesIn", "linesOut", "commands")
+	
+	def __init__(self):
+		self.bytesIn = 0
+		self.bytesOut = 0
+		self.linesIn = 0
+		self.linesOut = 0
+		self.commands = {}
 
 class IRCBase(LineOnlyReceiver):
+	implements(IPushProducer)
+	
 	delimiter = "\n" # Default to splitting by \n, and then we'll also split \r in the handler
+	connectionType = None
+	sendQueueFlushSize = 16384
+	
+	def connectionMade(self):
+		self._sendQueue = []
+		self._sendQueueSize = 0
+		self._sendQueueOpen = True
+		self._sendPaused = False
+		self.traffic = TrafficCounters()
+		self._trafficTotals = self.ircd.trafficTotals[self.connectionType]
+		self.transport.registerProducer(self, True)
+	
+	def connectionLost(self, reason):
+		self._sendQueueOpen = False
+		self._sendQueue = []
+		self.ircd.queuedSendBytes -= self._sendQueueSize
+		self._sendQueueSize = 0
+	
+	def dataReceived(self, data):
+		dataLength = len(data)
+		self.traffic.bytesIn += dataLength
+		self._trafficTotals.bytesIn += dataLength
+		LineOnlyReceiver.dataReceived(self, data)
 	
 	def lineReceived(self, data):
 		for line in data.split("\r"):
 			command, params, prefix, tags = self._parseLine(line)
 			if command:
-				self.handleCommand(command, params, prefix, tags)
+				statsCommand = self._commandStatsName(command)
+				traffic = self.traffic
+				traffic.linesIn += 1
+				traffic.commands[statsCommand] = traffic.commands.get(statsCommand, 0) + 1
+				traffic = self._trafficTotals
+				traffic.linesIn += 1
+				traffic.commands[statsCommand] = traffic.commands.get(statsCommand, 0) + 1
+				self.ircd.runningCommand = (self, command) # Lets the stall detector see what's running
+				try:
+					timing = self.ircd.timing
+					if timing is None:
+						self.handleCommand(command, params, prefix, tags)
+					else:
+						timing.timeCommand(self.connectionType, statsCommand, self.handleCommand, command, params, prefix, tags)
+				finally:
+					self.ircd.runningCommand = None
+				if self.ircd.commandReceivedHook is not None: # Lets the profiler count commands
+					self.ircd.commandReceivedHook()
+	
+	def _commandStatsName(self, command):
+		"""
+		Returns the name under which to count the given command. Commands no
+		module handles are all counted as "unknown", since anyone connecting
+		can send any number of made-up ones.
+		"""
+		if self.connectionType == "user":
+			knownCommands = self.ircd.userCommands
+		else:
+			knownCommands = self.ircd.serverCommands
+		if command in knownCommands:
+			return command
+		return "unknown"
 	
 	def _parseLine(self, line):
 		line = line.replace("\0", "")
@@ -18,6 +106,8 @@ class IRCBase(LineOnlyReceiver):
 			if " " not in line:
 				return None, None, None, None
 			tagLine, line = line.split(" ", 1)
+			if not line:
+				return None, None, None, None
 			tags = self._parseTags(tagLine[1:])
 		else:
 			tags = {}
@@ -39,12 +129,10 @@ class IRCBase(LineOnlyReceiver):
 		
 		if " " in linePart:
 			command, paramLine = linePart.split(" ", 1)
-			params = paramLine.split(" ")
+			params = [param for param in paramLine.split(" ") if param]
 		else:
 			command = linePart
 			params = []
-		while "" in params:
-			params.remove("")
 		if lastParam is not None:
 			params.append(lastParam)
 		return command.upper(), params, prefix, tags
@@ -55,30 +143,9 @@ class IRCBase(LineOnlyReceiver):
 			if not tagval:
 				continue
 			if "=" in tagval:
-				tag, escapedValue = tagval.split("=", 1)
-				escaped = False
-				valueChars = []
-				for char in escapedValue:
-					if char == "\\":
-						escaped = True
-						continue
-					if escaped:
-						if char == "\\":
-							valueChars.append("\\")
-						elif char == ":":
-							valueChars.append(";")
-						elif char == "r":
-							valueChars.append("\r")
-						elif char == "n":
-							valueChars.append("\n")
-						elif char == "s":
-							valueChars.append(" ")
-						else:
-							valueChars.append(char)
-						escaped = False
-						continue
-					valueChars.append(char)
-				value = "".join(valueChars)
+				tag, value = tagval.split("=", 1)
+				if "\\" in value:
+					value = _tagEscapeSequence.sub(_unescapeTagChar, value)
 			else:
 				tag = tagval
 				value = None
@@ -89,6 +156,13 @@ class IRCBase(LineOnlyReceiver):
 		pass
 	
 	def sendMessage(self, command, *params, **kw):
+		self.sendLine(self._buildMessageLine(command, params, kw))
+	
+	def _buildMessageLine(self, command, params, kw):
+		"""
+		Builds the line to send for the given message. Accepts the same keyword
+		arguments as sendMessage in the kw dict.
+		"""
 		if "tags" in kw:
 			tags = self._buildTagString(kw["tags"])
 		else:
@@ -118,7 +192,7 @@ class IRCBase(LineOnlyReceiver):
 		if prefix:
 			lineToSend += ":{} ".format(prefix)
 		lineToSend += "{} {}".format(command, " ".join(params))
-		self.sendLine(lineToSend.replace("\0", ""))
+		return lineToSend.replace("\0", "")
 	
 	def _buildTagString(self, tags):
 		tagList = []
@@ -136,4 +210,111 @@ class IRCBase(LineOnlyReceiver):
 		return ";".join(tagList)
 	
 	def sendLine(self, line):
-		return self.transport.write("{}\r\n".format(line))
\ No newline at end of file
+		if not self._sendQueueOpen:
+			return
+		line = "{}\r\n".format(line)
+		lineLength = len(line)
+		self._sendQueue.append(line)
+		self._sendQueueSize += lineLength
+		self.ircd.queuedSendBytes += lineLength
+		traffic = self.traffic
+		traffic.bytesOut += lineLength
+		traffic.linesOut += 1
+		traffic = self._trafficTotals
+		traffic.bytesOut += lineLength
+		traffic.linesOut += 1
+		sendQueueLimit = self.sendQueueLimit()
+		if sendQueueLimit and self._sendQueueSize > sendQueueLimit:
+			self._dropSendQueue()
+			return
+		if self._sendPaused:
+			return
+		if self._sendQueueSize >= self.sendQueueFlushSize:
+			self.flushSendQueue() # Don't hold large amounts of data until the end of the reactor turn
+		else:
+			self.ircd.scheduleSendQueueFlush(self)
+	
+	def flushSendQueue(self):
+		"""
+		Writes all lines waiting in the send queue to the transport, unless the
+		transport has asked us to stop sending for now.
+		"""
+		if self._sendPaused or not self._sendQueue:
+			return
+		sendQueue = self._sendQueue
+		self._sendQueue = []
+		self.ircd.queuedSendBytes -= self._sendQueueSize
+		self._sendQueueSize = 0
+		self.transport.writeSequence(sendQueue)
+	
+	def sendQueueSize(self):
+		"""
+		Returns the number of bytes waiting in the send queue.
+		"""
+		return self._sendQueueSize
+	
+	def transportBufferSize(self):
+		"""
+		Returns the number of bytes that have been given to the transport but
+		not yet sent, or 0 if the transport doesn't tell us.
+		"""
+		transport = self.transport
+		while transport is not None: # TLS transports wrap the TCP transport that holds the buffer
+			if hasattr(transport, "dataBuffer"):
+				return len(transport.dataBuffer) - getattr(transport, "offset", 0) + getattr(transport, "_tempDataLen", 0)
+			transport = getattr(transport, "transport", None)
+		return 0
+	
+	def isSendPaused(self):
+		"""
+		Returns whether the transport has asked us to stop sending data for
+		now. Data sent while paused waits in the send queue.
+		"""
+		return self._sendPaused
+	
+	def sendQueueLimit(self):
+		"""
+		Returns the maximum number of bytes that may wait to be sent on this
+		connection, or None for no limit.
+		"""
+		return None
+	
+	def _dropSendQueue(self):
+		"""
+		Drops everything waiting in the send queue and stops sending, because
+		the send queue limit was exceeded.
+		"""
+		self._sendQueueOpen = False
+		self._sendQueue = []
+		self.ircd.queuedSendBytes -= self._sendQueueSize
+		self._sendQueueSize = 0
+		reactor.callLater(0, self.sendQueueExceeded)
+	
+	def sendQueueExceeded(self):
+		"""
+		Called when more data is waiting to be sent on this connection than the
+		send queue limit allows. Anything still in the queue has been dropped.
+		"""
+		self.transport.loseConnection()
+	
+	def closeConnection(self):
+		"""
+		Sends anything waiting in the send queue and closes the connection.
+		"""
+		if self._sendQueueOpen:
+			self._sendPaused = False
+			self.flushSendQueue()
+		self.transport.loseConnection()
+	
+	def pauseProducing(self):
+		self._sendPaused = True
+	
+	def resumeProducing(self):
+		self._sendPaused = False
+		self.flushSendQueue()
+	
+	def stopProducing(self):
+		self._sendQueueOpen = False
+		self._sendQueue = []
+		self.ircd.queuedSendBytes -= self._sendQueueSize
+		self._sendQueueSize = 0
\ No newline at end of file
@@ -6,15 +6,24 @@ from twisted.internet.task import LoopingCall
 from twisted.logger import FilteringLogObserver, globalLogPublisher, InvalidLogLevelError, LogLevel, LogLevelFilterPredicate, Logger
 from twisted.plugin import getPlugins
 from twisted.python.rebuild import rebuild
+from txircd.clock import Clock
 from txircd.config import Config, ConfigError, ConfigValidationError
 from txircd.factory import ServerConnectFactory, ServerListenFactory, UserFactory
+from txircd.ircbase import TrafficCounters
 from txircd.module_interface import ICommand, IMode, IModuleData
-from txircd.utils import CaseInsensitiveDictionary, ModeType, now, unescapeEndpointDescription
-from datetime import timedelta
-from weakref import WeakValueDictionary
-import importlib, random, re, shelve, string, txircd.modules
+from txircd.pingservice import PingService
+from txircd.storage import openStorage
+from txircd.timing import TimingRecorder, TimingStats
+from txircd.timingwheel import TimingWheel
+from txircd.utils import CaseInsensitiveDictionary, ircLower, ModeType, now, unescapeEndpointDescription
+from weakref import ref, WeakValueDictionary
+import importlib, random, re, string, txircd.modules
 
 class IRCd(Service):
+	recentlyQuitDuration = 15
+	_actionRunners = ("runActionStandard", "runActionUntilTrue", "runActionUntilFalse", "runActionUntilValue", "runActionFlagTrue", "runActionFlagFalse", "runActionProcessing", "runActionProcessingMultiple")
+	_comboActionRunners = (("runComboActionStandard", 0), ("runComboActionUntilTrue", 0), ("runComboActionUntilFalse", 0), ("runComboActionUntilValue", 0), ("runComboActionFlagTrue", 0), ("runComboActionFlagFalse", 0), ("runComboActionProcessing", 1), ("runComboActionProcessingMultiple", 1))
+	
 	def __init__(self, configFileName):
 		self.config = Config(self, configFileName)
 		
@@ -33,8 +42,13 @@ class IRCd(Service):
 		self.userModes = ({}, {}, {}, {})
 		self.userModeTypes = {}
 		self.actions = {}
+		self._actionPlans = {}
+		self.timing = None
+		self.runningCommand = None
+		self.commandReceivedHook = None
 		self.storage = None
 		self.storageSyncer = None
+		self.storageSyncTimes = TimingStats()
 		self.dataCache = {}
 		self.functionCache = {}
 		
@@ -50,17 +64,32 @@ class IRCd(Service):
 		self.userNicks = CaseInsensitiveDictionary()
 		self.channels = CaseInsensitiveDictionary(WeakValueDictionary)
 		self.servers = {}
+		self.serverRoutes = {}
+		self.usersByServer = {}
+		self.usersByMode = {}
+		self.capabilityBits = {}
 		self.serverNames = CaseInsensitiveDictionary()
 		self.recentlyQuitUsers = {}
 		self.recentlyQuitServers = {}
 		self.recentlyDestroyedChannels = CaseInsensitiveDictionary()
-		self.pruneRecentlyQuit = None
-		self.pruneRecentChannels = None
+		self._sendQueueFlushPending = set()
+		self._sendQueueFlusher = None
+		self.queuedSendBytes = 0
+		self.trafficTotals = {
+			"user": TrafficCounters(),
+			"server": TrafficCounters()
+		}
+		self.connectionsAccepted = 0
+		self.connectionsRejected = 0
 		
 		self._logFilter = LogLevelFilterPredicate()
 		filterObserver = FilteringLogObserver(globalLogPublisher, (self._logFilter,))
 		self.log = Logger("txircd", observer=filterObserver)
 		
+		self.clock = Clock()
+		self.timers = TimingWheel(self.log)
+		self.pingService = PingService(self)
+		
 		self.startupTime = None
 	
 	def startService(self):
@@ -70,15 +99,15 @@ class IRCd(Service):
 		self.config.reload()
 		self.name = self.config["server_name"]
 		self.serverID = self.config["server_id"]
+		self._updateTiming()
 		self.log.info("Loading storage...")
-		self.storage = shelve.open(self.config["datastore_path"], writeback=True)
-		self.storageSyncer = LoopingCall(self.storage.sync)
+		self.storage = openStorage(self.config["datastore_path"], self.config.get("storage_backend", "sqlite"))
+		self.storage.startWriter()
+		self.storageSyncer = LoopingCall(self._syncStorage)
 		self.storageSyncer.start(self.config.get("storage_sync_interval", 5), now=False)
 		self.log.info("Starting processes...")
-		self.pruneRecentlyQuit = LoopingCall(self.pruneQuit)
-		self.pruneRecentlyQuit.start(10, now=False)
-		self.pruneRecentChannels = LoopingCall(self.pruneChannels)
-		self.pruneRecentChannels.start(15, now=False)
+		self.timers.start()
+		self.pingService.start()
 		self.log.info("Loading modules...")
 		self._loadModules()
 		self.log.info("Binding ports...")
@@ -95,6 +124,8 @@ class IRCd(Service):
 		self.log.info("Disconnecting servers...")
 		serverList = self.servers.values() # Take the list of server objects
 		self.servers = {} # And then destroy the server dict to inhibit server objects generating lots of noise
+		self.serverRoutes = {}
+		self.usersByServer = {}
 		for server in serverList:
 			if server.nextClosest == self.serverID:
 				stopDeferreds.append(server.disconnectedDeferred)
@@ -102,31 +133,45 @@ class IRCd(Service):
 				for user in allUsers:
 					if user[:3] == server.serverID:
 						del self.users[user]
-				server.transport.loseConnection()
+				server.closeConnection()
 		self.log.info("Disconnecting users...")
 		userList = self.users.values() # Basically do the same thing I just did with the servers
 		self.users = {}
+		self.usersByMode = {}
 		for user in userList:
 			if user.transport:
 				stopDeferreds.append(user.disconnectedDeferred)
-				user.transport.loseConnection()
+				user.closeConnection()
 		self.log.info("Unloading modules...")
 		moduleList = self.loadedModules.keys()
 		for module in moduleList:
 			self._unloadModule(module, False) # Incomplete unload is done to save time and because side effects are destroyed anyway
 		self.log.info("Stopping processes...")
-		if self.pruneRecentlyQuit.running:
-			self.pruneRecentlyQuit.stop()
-		if self.pruneRecentChannels.running:
-			self.pruneRecentChannels.stop()
+		self.pingService.stop()
+		self.timers.stop()
 		self.log.info("Closing data storage...")
 		if self.storageSyncer.running:
 			self.storageSyncer.stop()
-		self.storage.close() # a close() will sync() also
+		storageClosed = self.storage.close() # a close() will sync() also
+		storageClosed.addErrback(self._logStorageError)
+		stopDeferreds.append(storageClosed)
 		self.log.info("Releasing ports...")
 		stopDeferreds.extend(self._unbindPorts())
 		return DeferredList(stopDeferreds)
 	
+	def _syncStorage(self):
+		syncDeferred = self.storage.sync()
+		syncDeferred.addBoth(self._recordStorageSync, self.clock.monotonic())
+		syncDeferred.addErrback(self._logStorageError) # Keep syncing after a failure
+		return syncDeferred
+	
+	def _recordStorageSync(self, result, startTime):
+		self.storageSyncTimes.record(self.clock.monotonic() - startTime)
+		return result
+	
+	def _logStorageError(self, failure):
+		self.log.error("Failed to write data storage: {err.getErrorMessage()}", err=failure)
+	
 	def _loadModules(self):
 		for module in getPlugins(IModuleData, txircd.modules):
 			if module.name in self.loadedModules:
@@ -293,6 +338,7 @@ class IRCd(Service):
 						break
 				else:
 					self.serverCommands[command].append(data)
+		self._actionPlans = {} # Mode and action data changed, so cached dispatch plans are no longer valid
 		
 		self.log.debug("Module {module.name} is now fully loaded.", module=module)
 	
@@ -380,6 +426,7 @@ class IRCd(Service):
 		
 		del self.loadedModules[moduleName]
 		del self._loadedModuleData[moduleName]
+		self._actionPlans = {}
 		
 		if fullUnload:
 			self.runActionStandard("moduleunload", module.name)
@@ -490,6 +537,10 @@ class IRCd(Service):
 			config["datastore_path"] = "data.db"
 		if "storage_sync_interval" in config and not isinstance(config["storage_sync_interval"], int):
 			raise ConfigValidationError(config["storage_sync_interval"], "invalid number")
+		if "storage_backend" in config and config["storage_backend"] not in ("sqlite", "shelve"):
+			raise ConfigValidationError("storage_backend", "must be \"sqlite\" or \"shelve\"")
+		if "action_timing" in config and not isinstance(config["action_timing"], bool):
+			raise ConfigValidationError("action_timing", "value must be a boolean")
 
 		# Channels
 		if "channel_name_length" in config:
@@ -520,6 +571,8 @@ class IRCd(Service):
 				self.logConfigValidationWarning("user_registration_timeout", "timeout could be too short for clients to register in time", 10)
 		if "user_ping_frequency" in config and (not isinstance(config["user_ping_frequency"], int) or config["user_ping_frequency"] < 0):
 			raise ConfigValidationError("user_ping_frequency", "invalid number")
+		if "user_sendq_limit" in config and (not isinstance(config["user_sendq_limit"], int) or config["user_sendq_limit"] < 0):
+			raise ConfigValidationError("user_sendq_limit", "invalid number")
 		if "hostname_length" in config:
 			if not isinstance(config["hostname_length"], int) or config["hostname_length"] < 0:
 				raise ConfigValidationError("hostname_length", "invalid number")
@@ -563,6 +616,8 @@ class IRCd(Service):
 				self.logConfigValidationWarning("server_registration_timeout", "timeout could be too short for servers to register in time", 10)
 		if "server_ping_frequency" in config and (not isinstance(config["server_ping_frequency"], int) or config["server_ping_frequency"] < 0):
 			raise ConfigValidationError("server_ping_frequency", "invalid number")
+		if "server_sendq_limit" in config and (not isinstance(config["server_sendq_limit"], int) or config["server_sendq_limit"] < 0):
+			raise ConfigValidationError("server_sendq_limit", "invalid number")
 
 		for module in self.loadedModules.itervalues():
 			module.verifyConfig(config)
@@ -587,9 +642,34 @@ class IRCd(Service):
 		except (KeyError, InvalidLogLevelError):
 			pass # If we can't set a new log level, we'll keep the old one
 		
+		self._updateTiming()
+		
 		for module in self.loadedModules.itervalues():
 			module.rehash()
 	
+	def _updateTiming(self):
+		"""
+		Starts or stops timing actions and commands to match the configuration.
+		While timing is enabled, the runAction functions are replaced on this
+		IRCd with versions that time each action, so they cost nothing extra
+		while it's disabled.
+		"""
+		if self.config.get("action_timing", False):
+			if self.timing is None:
+				self.timing = TimingRecorder()
+				self._actionPlans = {} # Rebuild the plans with timed handlers
+				for runnerName in self._actionRunners:
+					setattr(self, runnerName, self.timing.timeActionRunner(getattr(self, runnerName)))
+				for runnerName, actionListIndex in self._comboActionRunners:
+					setattr(self, runnerName, self.timing.timeComboActionRunner(getattr(self, runnerName), actionListIndex))
+		elif self.timing is not None:
+			self.timing = None
+			self._actionPlans = {}
+			for runnerName in self._actionRunners:
+				delattr(self, runnerName)
+			for runnerName, actionListIndex in self._comboActionRunners:
+				delattr(self, runnerName)
+	
 	def _bindPorts(self):
 		for bindDesc in self.config["bind_client"]:
 			try:
@@ -650,31 +730,34 @@ class IRCd(Service):
 			return uid[:-1] + "0"
 		return uid[:-1] + chr(ord(uid[-1]) + 1)
 	
-	def pruneQuit(self):
-		compareTime = now() - timedelta(seconds=10)
-		remove = []
-		for uuid, timeQuit in self.recentlyQuitUsers.iteritems():
-			if timeQuit < compareTime:
-				remove.append(uuid)
-		for uuid in remove:
-			del self.recentlyQuitUsers[uuid]
-		
-		remove = []
-		for serverID, timeQuit in self.recentlyQuitServers.iteritems():
-			if timeQuit < compareTime:
-				remove.append(serverID)
-		for serverID in remove:
-			del self.recentlyQuitServers[serverID]
+	def markUserQuit(self, uuid):
+		"""
+		Remembers a user that quit for a while, so that messages about the
+		user that are still on their way from other servers can be ignored.
+		"""
+		self.recentlyQuitUsers[uuid] = self.clock.now()
+		self.timers.expireKey(self.recentlyQuitUsers, uuid, self.recentlyQuitDuration)
+	
+	def markServerQuit(self, serverID):
+		"""
+		Remembers a server that quit for a while, so that messages about the
+		server that are still on their way can be ignored.
+		"""
+		self.recentlyQuitServers[serverID] = self.clock.now()
+		self.timers.expireKey(self.recentlyQuitServers, serverID, self.recentlyQuitDuration)
 	
-	def pruneChannels(self):
-		removeChannels = []
-		for channel, remove in self.recentlyDestroyedChannels.iteritems():
-			if remove:
-				removeChannels.append(channel)
-			elif channel not in self.channels:
-				self.recentlyDestroyedChannels[channel] = True
-		for channel in removeChannels:
-			del self.recentlyDestroyedChannels[channel]
+	def trackChannel(self, channel):
+		"""
+		Remembers a new channel until a while after it's destroyed, so that
+		messages about the channel that are still on their way from other
+		servers can be ignored.
+		"""
+		lowerName = ircLower(channel.name)
+		self.timers.cancelKeyExpiry(self.recentlyDestroyedChannels, lowerName)
+		def channelDestroyed(channelRef):
+			if self.recentlyDestroyedChannels.get(lowerName) is channelRef:
+				self.timers.expireKey(self.recentlyDestroyedChannels, lowerName, self.recentlyQuitDuration)
+		self.recentlyDestroyedChannels[lowerName] = ref(channel, channelDestroyed)
 	
 	def generateISupportList(self):
 		isupport = self.isupport_tokens.copy()
@@ -725,96 +808,185 @@ class IRCd(Service):
 			if server.nextClosest == self.serverID and server != fromServer:
 				server.sendMessage(command, *params, **kw)
 	
-	def _getActionModes(self, actionName, *params, **kw):
-		users = []
-		channels = []
-		if "users" in kw:
-			users = kw["users"]
-		if "channels" in kw:
-			channels = kw["channels"]
+	def addServerRoute(self, server):
+		"""
+		Adds a newly registered server to the routing table. The server it's
+		introduced through must already be in the table.
+		"""
+		if server.nextClosest == self.serverID:
+			self.serverRoutes[server.serverID] = (server, 1)
+		else:
+			linkServer, hopCount = self.serverRoutes[server.nextClosest]
+			self.serverRoutes[server.serverID] = (linkServer, hopCount + 1)
+	
+	def removeServerRoute(self, serverID):
+		"""
+		Removes a server from the routing table.
+		"""
+		if serverID in self.serverRoutes:
+			del self.serverRoutes[serverID]
+	
+	def serverLink(self, serverID):
+		"""
+		Returns the locally connected server through which messages to the
+		server with the given ID should be sent.
+		"""
+		return self.serverRoutes[serverID][0]
+	
+	def serverHopCount(self, serverID):
+		"""
+		Returns the number of hops from this server to the server with the
+		given ID. Directly connected servers are one hop away.
+		"""
+		return self.serverRoutes[serverID][1]
+	
+	def capabilityBit(self, capName):
+		"""
+		Returns the bit representing the given client capability in users'
+		capabilityMask, assigning one if the capability doesn't have one yet.
+		Bits are never reassigned, so modules may keep them across reloads.
+		"""
+		if capName not in self.capabilityBits:
+			self.capabilityBits[capName] = 1 << len(self.capabilityBits)
+		return self.capabilityBits[capName]
+	
+	def scheduleSendQueueFlush(self, connection):
+		"""
+		Schedules the given connection's send queue to be written out once the
+		current reactor turn is done, so that everything sent to it in this
+		turn is written at once.
+		"""
+		self._sendQueueFlushPending.add(connection)
+		if self._sendQueueFlusher is None:
+			self._sendQueueFlusher = reactor.callLater(0, self._flushSendQueues)
+	
+	def _flushSendQueues(self):
+		self._sendQueueFlusher = None
+		pendingConnections = self._sendQueueFlushPending
+		self._sendQueueFlushPending = set()
+		for connection in pendingConnections:
+			connection.flushSendQueue()
+	
+	def _getActionPlan(self, actionName):
+		"""
+		Gets the dispatch plan for the given action, building and caching it if
+		necessary. The plan is a tuple of the sorted module handlers for the
+		action and lists of the user and channel modes affecting the action,
+		each with its presorted mode check handlers.
+		While timing is enabled, the handlers and modes in the plan are
+		wrapped to time their calls.
+		"""
+		if actionName in self._actionPlans:
+			return self._actionPlans[actionName]
+		staticHandlers = sorted(self.actions.get(actionName, []), key=lambda action: action[1], reverse=True)
+		if self.timing is not None:
+			staticHandlers = [(self.timing.timeHandler(actionName, self._handlerModuleName(actionName, handler[0]), handler[0]), handler[1]) for handler in staticHandlers]
+		userModePlans = []
+		channelModePlans = []
+		for modeType in self.userModes:
+			for mode, modeObj in modeType.iteritems():
+				if actionName in modeObj.affectedActions:
+					priority = modeObj.affectedActions[actionName]
+					if self.timing is not None:
+						modeObj = self.timing.timeMode(actionName, self._modeModuleName("usermodes", mode), modeObj)
+					userModePlans.append((modeObj, priority, self._buildModeCheckList("user", "channel", actionName, mode)))
+		for modeType in self.channelModes:
+			for mode, modeObj in modeType.iteritems():
+				if actionName in modeObj.affectedActions:
+					priority = modeObj.affectedActions[actionName]
+					if self.timing is not None:
+						modeObj = self.timing.timeMode(actionName, self._modeModuleName("channelmodes", mode), modeObj)
+					channelModePlans.append((modeObj, priority, self._buildModeCheckList("channel", "user", actionName, mode)))
+		plan = (staticHandlers, userModePlans, channelModePlans)
+		self._actionPlans[actionName] = plan
+		return plan
+	
+	def _handlerModuleName(self, actionName, function):
+		"""
+		Returns the name of the module that provided the given action handler.
+		"""
+		for moduleName, moduleData in self._loadedModuleData.iteritems():
+			for action in moduleData["actions"]:
+				if action[0] == actionName and action[2] == function:
+					return moduleName
+		return "unknown"
+	
+	def _modeModuleName(self, modeDataType, mode):
+		"""
+		Returns the name of the module that provided the given mode. The mode
+		data type is "usermodes" or "channelmodes".
+		"""
+		for moduleName, moduleData in self._loadedModuleData.iteritems():
+			for modeData in moduleData[modeDataType]:
+				if modeData[0] == mode:
+					return moduleName
+		return "unknown"
+	
+	def _buildModeCheckList(self, targetType, otherType, actionName, mode):
+		"""
+		Builds the sorted list of mode check handlers for a mode on an action.
+		Each entry is a tuple in the format:
+		(function, priority, leadingParams, withOther)
+		The function is called with the leading parameters, then the target,
+		then (if withOther is true) each of the other target type, and then the
+		action parameters.
+		"""
+		checkList = []
+		for action in self.actions.get("modeactioncheck-{}-{}-{}".format(targetType, mode, actionName), []):
+			checkList.append((action[0], action[1], (), False))
+		for action in self.actions.get("modeactioncheck-{}".format(targetType), []):
+			checkList.append((action[0], action[1], (actionName, mode), False))
+		for action in self.actions.get("modeactioncheck-{}-with{}".format(targetType, otherType), []):
+			checkList.append((action[0], action[1], (actionName, mode), True))
+		for action in self.actions.get("modeactioncheck-{}-{}".format(targetType, actionName), []):
+			checkList.append((action[0], action[1], (mode,), False))
+		for action in self.actions.get("modeactioncheck-{}-with{}-{}".format(targetType, otherType, actionName), []):
+			checkList.append((action[0], action[1], (mode,), True))
+		for action in self.actions.get("modeactioncheck-{}-with{}-{}-{}".format(targetType, otherType, mode, actionName), []):
+			checkList.append((action[0], action[1], (), True))
+		checkList.sort(key=lambda action: action[1], reverse=True)
+		return checkList
+	
+	def _checkModeParam(self, checkList, target, others, params):
+		for check, priority, leadingParams, withOther in checkList:
+			if withOther:
+				for other in others:
+					param = check(*(leadingParams + (target, other) + params))
+					if param is not None:
+						return param
+			else:
+				param = check(*(leadingParams + (target,) + params))
+				if param is not None:
+					return param
+		return None
+	
+	def _getActionModes(self, actionName, userModePlans, channelModePlans, *params, **kw):
+		users = kw.get("users", [])
+		channels = kw.get("channels", [])
 		
 		functionList = []
-		
 		if users:
-			genericUserActionName = "modeactioncheck-user-{}".format(actionName)
-			genericUserActionNameWithChannel = "modeactioncheck-user-withchannel-{}".format(actionName)
-			for modeType in self.userModes:
-				for mode, modeObj in modeType.iteritems():
-					if actionName not in modeObj.affectedActions:
-						continue
-					priority = modeObj.affectedActions[actionName]
-					actionList = []
-					# Because Python doesn't properly capture variables in lambdas, we have to force static capture
-					# by wrapping lambdas in more lambdas.
-					# I wish Python wasn't this gross.
-					for action in self.actions.get("modeactioncheck-user", []):
-						actionList.append(((lambda action, actionName, mode: lambda user, *params: action[0](actionName, mode, user, *params))(action, actionName, mode), action[1]))
-					for action in self.actions.get("modeactioncheck-user-withchannel", []):
-						for channel in channels:
-							actionList.append(((lambda action, actionName, mode, channel: lambda user, *params: action[0](actionName, mode, user, channel, *params))(action, actionName, mode, channel), action[1]))
-					for action in self.actions.get(genericUserActionName, []):
-						actionList.append(((lambda action, mode: lambda user, *params: action[0](mode, user, *params))(action, mode), action[1]))
-					for action in self.actions.get(genericUserActionNameWithChannel, []):
-						for channel in channels:
-							actionList.append(((lambda action, mode, channel: lambda user, *params: action[0](mode, user, channel, *params))(action, mode, channel), action[1]))
-					modeUserActionName = "modeactioncheck-user-{}-{}".format(mode, actionName)
-					modeUserActionNameWithChannel = "modeactioncheck-user-withchannel-{}-{}".format(mode, actionName)
-					for action in self.actions.get(modeUserActionNameWithChannel, []):
-						for channel in channels:
-							actionList.append(((lambda action, channel: lambda user, *params: action[0](user, channel, *params))(action, channel), action[1]))
-					actionList = sorted(self.actions.get(modeUserActionName, []) + actionList, key=lambda action: action[1], reverse=True)
-					applyUsers = []
-					for user in users:
-						for action in actionList:
-							param = action[0](user, *params)
-							if param is not None:
-								if param is not False:
-									applyUsers.append((user, param))
-								break
-					for user, param in applyUsers:
+			for modeObj, priority, checkList in userModePlans:
+				for user in users:
+					param = self._checkModeParam(checkList, user, channels, params)
+					if param is not None and param is not False:
 						functionList.append(((lambda modeObj, actionName, user, param: lambda *params: modeObj.apply(actionName, user, param, *params))(modeObj, actionName, user, param), priority))
-		
 		if channels:
-			genericChannelActionName = "modeactioncheck-channel-{}".format(actionName)
-			genericChannelActionNameWithUser = "modeactioncheck-channel-withuser-{}".format(actionName)
-			for modeType in self.channelModes:
-				for mode, modeObj in modeType.iteritems():
-					if actionName not in modeObj.affectedActions:
-						continue
-					priority = modeObj.affectedActions[actionName]
-					actionList = []
-					for action in self.actions.get("modeactioncheck-channel", []):
-						actionList.append(((lambda action, actionName, mode: lambda channel, *params: action[0](actionName, mode, channel, *params))(action, actionName, mode), action[1]))
-					for action in self.actions.get("modeactioncheck-channel-withuser", []):
-						for user in users:
-							actionList.append(((lambda action, actionName, mode, user: lambda channel, *params: action[0](actionName, mode, channel, user, *params))(action, actionName, mode, user), action[1]))
-					for action in self.actions.get(genericChannelActionName, []):
-						actionList.append(((lambda action, mode: lambda channel, *params: action[0](mode, channel, *params))(action, mode), action[1]))
-					for action in self.actions.get(genericChannelActionNameWithUser, []):
-						for user in users:
-							actionList.append(((lambda action, mode, user: lambda channel, *params: action[0](mode, channel, user, *params))(action, mode, user), action[1]))
-					modeChannelActionName = "modeactioncheck-channel-{}-{}".format(mode, actionName)
-					modeChannelActionNameWithUser = "modeactioncheck-channel-withuser-{}-{}".format(mode, actionName)
-					for action in self.actions.get(modeChannelActionNameWithUser, []):
-						for user in users:
-							actionList.append(((lambda action, user: lambda channel, *params: action[0](channel, user, *params))(action, user), action[1]))
-					actionList = sorted(self.actions.get(modeChannelActionName, []) + actionList, key=lambda action: action[1], reverse=True)
-					applyChannels = []
-					for channel in channels:
-						for action in actionList:
-							param = action[0](channel, *params)
-							if param is not None:
-								if param is not False:
-									applyChannels.append((channel, param))
-								break
-					for channel, param in applyChannels:
+			for modeObj, priority, checkList in channelModePlans:
+				for channel in channels:
+					param = self._checkModeParam(checkList, channel, users, params)
+					if param is not None and param is not False:
 						functionList.append(((lambda modeObj, actionName, channel, param: lambda *params: modeObj.apply(actionName, channel, param, *params))(modeObj, actionName, channel, param), priority))
 		return functionList
 	
 	def _getActionFunctionList(self, actionName, *params, **kw):
-		functionList = self.actions.get(actionName, [])
-		functionList = functionList + self._getActionModes(actionName, *params, **kw)
-		return sorted(functionList, key=lambda action: action[1], reverse=True)
+		staticHandlers, userModePlans, channelModePlans = self._getActionPlan(actionName)
+		if not ((userModePlans and kw.get("users")) or (channelModePlans and kw.get("channels"))):
+			return staticHandlers
+		modeFunctions = self._getActionModes(actionName, userModePlans, channelModePlans, *params, **kw)
+		if not modeFunctions:
+			return staticHandlers
+		return sorted(staticHandlers + modeFunctions, key=lambda action: action[1], reverse=True)
 	
 	def _combineActionFunctionLists(self, actionLists):
 		"""
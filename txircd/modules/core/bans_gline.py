@@ -5,7 +5,6 @@ from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from txircd.modules.xlinebase import XLineBase
 from txircd.utils import durationToSeconds, ircLower, now
 from zope.interface import implements
-from fnmatch import fnmatchcase
 
 class GLine(ModuleData, XLineBase):
 	implements(IPlugin, IModuleData)
@@ -36,18 +35,8 @@ class GLine(ModuleData, XLineBase):
 		if "client_ban_msg" in config and not isinstance(config["client_ban_msg"], basestring):
 			raise ConfigValidationError("client_ban_msg", "value must be a string")
 	
-	def checkUserMatch(self, user, mask, data):
-		banMask = self.normalizeMask(mask)
-		userMask = ircLower("{}@{}".format(user.ident, user.host()))
-		if fnmatchcase(userMask, banMask):
-			return True
-		userMask = ircLower("{}@{}".format(user.ident, user.realHost))
-		if fnmatchcase(userMask, banMask):
-			return True
-		userMask = ircLower("{}@{}".format(user.ident, user.ip))
-		if fnmatchcase(userMask, banMask):
-			return True
-		return False
+	def matchStrings(self, user, data):
+		return [ircLower("{}@{}".format(user.ident, user.host())), ircLower("{}@{}".format(user.ident, user.realHost)), ircLower("{}@{}".format(user.ident, user.ip))]
 	
 	def killUser(self, user, reason):
 		self.ircd.log.info("Matched user {user.uuid} ({user.ident}@{user.host()}) against a g:line: {reason}", user=user, reason=reason)
@@ -108,12 +97,7 @@ class UserGLine(Command):
 			if not self.module.addLine(banmask, now(), data["duration"], user.hostmask(), data["reason"]):
 				user.sendMessage("NOTICE", "*** G:Line for {} is already set.".format(banmask))
 				return True
-			badUsers = []
-			for checkUser in self.module.ircd.users.itervalues():
-				reason = self.module.matchUser(checkUser)
-				if reason is not None:
-					badUsers.append((checkUser, reason))
-			for badUser in badUsers:
+			for badUser in self.module.findMatchingUsers(banmask):
 				self.module.killUser(*badUser)
 			if data["duration"] > 0:
 				user.sendMessage("NOTICE", "*** Timed g:line for {} has been set, to expire in {} seconds.".format(banmask, data["duration"]))
@@ -137,12 +121,7 @@ class ServerAddGLine(Command):
 	
 	def execute(self, server, data):
 		if self.module.executeServerAddCommand(server, data):
-			badUsers = []
-			for user in self.module.ircd.users.itervalues():
-				reason = self.module.matchUser(user)
-				if reason is not None:
-					badUsers.append((user, reason))
-			for user in badUsers:
+			for user in self.module.findMatchingUsers(data["mask"]):
 				self.module.killUser(*user)
 			return True
 		return None
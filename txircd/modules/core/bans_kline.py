@@ -5,7 +5,6 @@ from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from txircd.modules.xlinebase import XLineBase
 from txircd.utils import durationToSeconds, ircLower, now
 from zope.interface import implements
-from fnmatch import fnmatchcase
 
 class KLine(ModuleData, Command, XLineBase):
 	implements(IPlugin, IModuleData, ICommand)
@@ -33,18 +32,8 @@ class KLine(ModuleData, Command, XLineBase):
 		if "client_ban_msg" in config and not isinstance(config["client_ban_msg"], basestring):
 			raise ConfigValidationError("client_ban_msg", "value must be a string")
 	
-	def checkUserMatch(self, user, mask, data):
-		banMask = self.normalizeMask(mask)
-		userMask = ircLower("{}@{}".format(user.ident, user.host()))
-		if fnmatchcase(userMask, banMask):
-			return True
-		userMask = ircLower("{}@{}".format(user.ident, user.realHost))
-		if fnmatchcase(userMask, banMask):
-			return True
-		userMask = ircLower("{}@{}".format(user.ident, user.ip))
-		if fnmatchcase(userMask, banMask):
-			return True
-		return False
+	def matchStrings(self, user, data):
+		return [ircLower("{}@{}".format(user.ident, user.host())), ircLower("{}@{}".format(user.ident, user.realHost)), ircLower("{}@{}".format(user.ident, user.ip))]
 	
 	def killUser(self, user, reason):
 		self.ircd.log.info("Matched user {user.uuid} ({user.ident}@{user.host()}) against a k:line: {reason}", user=user, reason=reason)
@@ -99,12 +88,7 @@ class KLine(ModuleData, Command, XLineBase):
 			if not self.addLine(banmask, now(), data["duration"], user.hostmask(), data["reason"]):
 				user.sendMessage("NOTICE", "*** K:Line for {} is already set.".format(banmask))
 				return True
-			badUsers = []
-			for checkUser in self.ircd.users.itervalues():
-				reason = self.matchUser(checkUser)
-				if reason is not None:
-					badUsers.append((checkUser, reason))
-			for badUser in badUsers:
+			for badUser in self.findMatchingUsers(banmask):
 				self.killUser(*badUser)
 			if data["duration"] > 0:
 				user.sendMessage("NOTICE", "*** Timed k:line for {} has been set, to expire in {} seconds.".format(banmask, data["duration"]))
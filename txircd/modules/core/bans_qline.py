@@ -5,7 +5,6 @@ from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from txircd.modules.xlinebase import XLineBase
 from txircd.utils import durationToSeconds, ircLower, now
 from zope.interface import implements
-from fnmatch import fnmatchcase
 
 class QLine(ModuleData, XLineBase):
 	implements(IPlugin, IModuleData)
@@ -36,10 +35,12 @@ class QLine(ModuleData, XLineBase):
 		if "client_ban_msg" in config and not isinstance(config["client_ban_msg"], basestring):
 			raise ConfigValidationError("client_ban_msg", "value must be a string")
 	
-	def checkUserMatch(self, user, mask, data):
+	def matchStrings(self, user, data):
 		if data and "newnick" in data:
-			return fnmatchcase(ircLower(data["newnick"]), ircLower(mask))
-		return fnmatchcase(ircLower(user.nick), ircLower(mask))
+			return [ircLower(data["newnick"])]
+		if user.nick is None: # The user hasn't sent NICK yet
+			return []
+		return [ircLower(user.nick)]
 	
 	def changeNick(self, user, reason, hasBeenConnected):
 		self.ircd.log.info("Matched user {user.uuid} ({user.nick}) against a q:line: {reason}", user=user, reason=reason)
@@ -56,7 +57,6 @@ class QLine(ModuleData, XLineBase):
 		return True
 	
 	def checkNick(self, user, data):
-		self.expireLines()
 		newNick = data["nick"]
 		reason = self.matchUser(user, { "newnick": newNick })
 		if reason is not None:
@@ -101,10 +101,8 @@ class UserQLine(Command):
 			if not self.module.addLine(banmask, now(), data["duration"], user.hostmask(), data["reason"]):
 				user.sendMessage("NOTICE", "*** Q:Line for {} is already set.".format(banmask))
 				return True
-			for checkUser in self.module.ircd.users.itervalues():
-				reason = self.module.matchUser(checkUser)
-				if reason is not None:
-					self.module.changeNick(checkUser, reason, True)
+			for checkUser, reason in self.module.findMatchingUsers(banmask):
+				self.module.changeNick(checkUser, reason, True)
 			if data["duration"] > 0:
 				user.sendMessage("NOTICE", "*** Timed q:line for {} has been set, to expire in {} seconds.".format(banmask, data["duration"]))
 			else:
@@ -127,11 +125,8 @@ class ServerAddQLine(Command):
 	
 	def execute(self, server, data):
 		if self.module.executeServerAddCommand(server, data):
-			for user in self.module.ircd.users.itervalues():
-				if not user.isRegistered():
-					continue
-				reason = self.module.matchUser(user)
-				if reason is not None:
+			for user, reason in self.module.findMatchingUsers(data["mask"]):
+				if user.isRegistered():
 					self.module.changeNick(user, reason, True)
 			return True
 		return None
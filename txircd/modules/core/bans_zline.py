@@ -5,7 +5,6 @@ from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from txircd.modules.xlinebase import XLineBase
 from txircd.utils import durationToSeconds, now
 from zope.interface import implements
-from fnmatch import fnmatchcase
 import socket
 
 class ZLine(ModuleData, XLineBase):
@@ -14,6 +13,7 @@ class ZLine(ModuleData, XLineBase):
 	name = "ZLine"
 	core = True
 	lineType = "Z"
+	networkMasks = True
 	
 	def actions(self):
 		return [ ("userconnect", 10, self.checkLines),
@@ -35,8 +35,11 @@ class ZLine(ModuleData, XLineBase):
 		if "client_ban_msg" in config and not isinstance(config["client_ban_msg"], basestring):
 			raise ConfigValidationError("client_ban_msg", "value must be a string")
 	
-	def checkUserMatch(self, user, mask, data):
-		return fnmatchcase(user.ip, mask)
+	def matchStrings(self, user, data):
+		return [self.normalizeMask(user.ip)]
+	
+	def matchAddress(self, user, data):
+		return user.ip
 	
 	def normalizeMask(self, mask):
 		if ":" in mask and "*" not in mask and "?" not in mask: # Normalize non-wildcard IPv6 addresses
@@ -93,12 +96,7 @@ class UserZLine(Command):
 			if not self.module.addLine(data["mask"], now(), data["duration"], user.hostmask(), data["reason"]):
 				user.sendMessage("NOTICE", "*** Z:Line for {} is already set.".format(banmask))
 				return True
-			badUsers = []
-			for checkUser in self.module.ircd.users.itervalues():
-				reason = self.module.matchUser(checkUser)
-				if reason is not None:
-					badUsers.append((checkUser, reason))
-			for badUser in badUsers:
+			for badUser in self.module.findMatchingUsers(data["mask"]):
 				self.module.killUser(*badUser)
 			if data["duration"] > 0:
 				user.sendMessage("NOTICE", "*** Timed z:line for {} has been set, to expire in {} seconds.".format(banmask, data["duration"]))
@@ -122,12 +120,7 @@ class ServerAddZLine(Command):
 	
 	def execute(self, server, data):
 		if self.module.executeServerAddCommand(server, data):
-			badUsers = []
-			for user in self.module.ircd.users.itervalues():
-				reason = self.module.matchUser(user)
-				if reason is not None:
-					badUsers.append((user, reason))
-			for user in badUsers:
+			for user in self.module.findMatchingUsers(data["mask"]):
 				self.module.killUser(*user)
 			return True
 		return None
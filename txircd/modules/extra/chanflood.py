@@ -1,8 +1,7 @@
 from twisted.plugin import IPlugin
 from txircd.module_interface import IMode, IModuleData, Mode, ModuleData
-from txircd.utils import ModeType, now
+from txircd.utils import ModeType
 from zope.interface import implements
-from datetime import timedelta
 
 class ChannelFlood(ModuleData, Mode):
 	implements(IPlugin, IModuleData, IMode)
@@ -46,13 +45,12 @@ class ChannelFlood(ModuleData, Mode):
 		if "floodhistory" not in channel.users[user]:
 			channel.users[user]["floodhistory"] = []
 		
-		currentTime = now()
+		currentTime = self.ircd.clock.epoch()
 		channel.users[user]["floodhistory"].append((data["targetchans"][channel], currentTime))
 		maxLines, seconds = param.split(":")
 		maxLines = int(maxLines)
 		seconds = int(seconds)
-		duration = timedelta(seconds=seconds)
-		floodTime = currentTime - duration
+		floodTime = currentTime - seconds
 		floodHistory = channel.users[user]["floodhistory"]
 		
 		while floodHistory:
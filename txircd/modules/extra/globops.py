@@ -25,7 +25,7 @@ class GlobopsCommand(ModuleData):
 	
 	def sendGlobops(self, fromUser, message, fromServer):
 		sendToServers = set()
-		for targetUser in self.ircd.users.itervalues():
+		for targetUser in list(self.ircd.usersByMode.get("o", ())): # Only opers can have the permission to view globops
 			if fromUser == targetUser:
 				continue
 			if not self.ircd.runActionUntilValue("userhasoperpermission", targetUser, "view-globops", users=[targetUser]):
@@ -36,10 +36,7 @@ class GlobopsCommand(ModuleData):
 				sendToServers.add(self.ircd.servers[targetUser.uuid[:3]])
 		closestServers = set()
 		for server in sendToServers:
-			closestServer = server
-			while closestServer.nextClosest != self.ircd.serverID:
-				closestServer = self.ircd.servers[closestServer.nextClosest]
-			closestServers.add(closestServer)
+			closestServers.add(self.ircd.serverLink(server.serverID))
 		if fromServer:
 			closestServers.discard(fromServer)
 		for server in closestServers:
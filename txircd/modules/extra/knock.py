@@ -65,15 +65,15 @@ class UserKnock(Command):
 	
 	def execute(self, user, data):
 		channel = data["channel"]
-		self.expireKnocks(user)
 		if user in channel.users:
 			user.sendMessage(irc.ERR_KNOCKONCHAN, channel.name, "Can't KNOCK on {}, you are already on that channel".format(channel.name))
 			return True
 		if "i" not in channel.modes:
 			user.sendMessage(irc.ERR_CHANOPEN, channel.name, "Can't KNOCK on {}, channel is open".format(channel.name))
 			return True
-		if "knocks" in user.cache and channel in user.cache["knocks"]:
-			user.sendMessage(irc.ERR_TOOMANYKNOCK, channel.name, "Can't KNOCK on {} (only one KNOCK per {} seconds allowed)".format(channel.name, self.ircd.config.get("knock_delay", 300)))
+		knockDelay = self.ircd.config.get("knock_delay", 300)
+		if "knocks" in user.cache and channel in user.cache["knocks"] and user.cache["knocks"][channel] + timedelta(seconds=knockDelay) >= now():
+			user.sendMessage(irc.ERR_TOOMANYKNOCK, channel.name, "Can't KNOCK on {} (only one KNOCK per {} seconds allowed)".format(channel.name, knockDelay))
 			return True
 		if "knocks" not in user.cache:
 			user.cache["knocks"] = WeakKeyDictionary()
@@ -88,18 +88,6 @@ class UserKnock(Command):
 	
 	def affectedChannels(self, user, data):
 		return [data["channel"]]
-	
-	def expireKnocks(self, user):
-		if "knocks" not in user.cache:
-			return
-		expiredKnocks = []
-		nowTime = now()
-		timeDiff = timedelta(seconds=self.ircd.config.get("knock_delay", 300))
-		for channel, knockTime in user.cache["knocks"].iteritems():
-			if knockTime + timeDiff < nowTime:
-				expiredKnocks.append(channel)
-		for channel in expiredKnocks:
-			del user.cache["knocks"][channel]
 
 class ServerKnock(Command):
 	implements(ICommand)
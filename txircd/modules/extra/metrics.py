@@ -0,0 +1,155 @@
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList
+from twisted.internet.endpoints import serverFromString
+from twisted.plugin import IPlugin
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+from txircd.config import ConfigValidationError
+from txircd.module_interface import IModuleData, ModuleData
+from txircd.utils import unescapeEndpointDescription
+from zope.interface import implements
+
+class MetricsExporter(ModuleData):
+	implements(IPlugin, IModuleData)
+	
+	name = "MetricsExporter"
+	
+	def verifyConfig(self, config):
+		if "bind_metrics" in config:
+			if not isinstance(config["bind_metrics"], list):
+				raise ConfigValidationError("bind_metrics", "value must be a list")
+			for bindDesc in config["bind_metrics"]:
+				if not isinstance(bindDesc, basestring):
+					raise ConfigValidationError("bind_metrics", "every entry must be a string")
+	
+	def load(self):
+		self.boundPorts = {}
+		self.site = Site(MetricsResource(self))
+		self.bindPorts()
+	
+	def unload(self):
+		return DeferredList(self.unbindPorts())
+	
+	def rehash(self):
+		unbindDeferreds = self.unbindPorts()
+		if unbindDeferreds:
+			DeferredList(unbindDeferreds).addCallback(lambda result: self.bindPorts())
+		else:
+			self.bindPorts()
+	
+	def bindPorts(self):
+		for bindDesc in self.ircd.config.get("bind_metrics", []):
+			try:
+				endpoint = serverFromString(reactor, unescapeEndpointDescription(bindDesc))
+			except ValueError as e:
+				self.ircd.log.error(e)
+				continue
+			listenDeferred = endpoint.listen(self.site)
+			listenDeferred.addCallback(self.savePort, bindDesc)
+			listenDeferred.addErrback(self.logNotBound, bindDesc)
+	
+	def unbindPorts(self):
+		deferreds = []
+		for port in self.boundPorts.itervalues():
+			d = port.stopListening()
+			if d:
+				deferreds.append(d)
+		self.boundPorts = {}
+		return deferreds
+	
+	def savePort(self, port, desc):
+		self.boundPorts[desc] = port
+		self.ircd.log.debug("Bound endpoint '{endpointDescription}' for metrics", endpointDescription=desc)
+	
+	def logNotBound(self, err, desc):
+		self.ircd.log.error("Could not bind '{endpointDescription}' for metrics: {errorMsg}", endpointDescription=desc, errorMsg=err)
+	
+	def buildMetrics(self):
+		"""
+		Builds the Prometheus text exposition of the server's metrics. Only
+		counters the server keeps as it goes are read here, and the only
+		things looped over are the server's links and timed actions, so this
+		costs the same however many users are connected.
+		"""
+		ircd = self.ircd
+		output = []
+		remoteUserCount = sum(len(serverUsers) for serverUsers in ircd.usersByServer.itervalues())
+		self.addMetric(output, "txircd_users", "gauge", "Users on the network", [ ({}, len(ircd.users)) ])
+		self.addMetric(output, "txircd_local_users", "gauge", "Users connected to this server", [ ({}, len(ircd.users) - remoteUserCount) ])
+		self.addMetric(output, "txircd_opers", "gauge", "Opers on the network", [ ({}, len(ircd.usersByMode.get("o", ()))) ])
+		self.addMetric(output, "txircd_channels", "gauge", "Channels on the network", [ ({}, len(ircd.channels)) ])
+		self.addMetric(output, "txircd_servers", "gauge", "Other servers on the network", [ ({}, len(ircd.servers)) ])
+		
+		self.addMetric(output, "txircd_connections_accepted_total", "counter", "Client connections accepted", [ ({}, ircd.connectionsAccepted) ])
+		self.addMetric(output, "txircd_connections_rejected_total", "counter", "Client connections closed by a connect or registration check", [ ({}, ircd.connectionsRejected) ])
+		self.addMetric(output, "txircd_send_queue_bytes", "gauge", "Bytes waiting in the send queues of all local connections", [ ({}, ircd.queuedSendBytes) ])
+		
+		totals = [ ({ "type": connectionType }, counters) for connectionType, counters in ircd.trafficTotals.iteritems() ]
+		self.addMetric(output, "txircd_received_bytes_total", "counter", "Bytes received on local connections", [ (labels, counters.bytesIn) for labels, counters in totals ])
+		self.addMetric(output, "txircd_sent_bytes_total", "counter", "Bytes sent on local connections", [ (labels, counters.bytesOut) for labels, counters in totals ])
+		self.addMetric(output, "txircd_received_lines_total", "counter", "Lines received on local connections", [ (labels, counters.linesIn) for labels, counters in totals ])
+		self.addMetric(output, "txircd_sent_lines_total", "counter", "Lines sent on local connections", [ (labels, counters.linesOut) for labels, counters in totals ])
+		
+		links = [ ({ "server": server.name }, server) for server in ircd.servers.itervalues() if server.nextClosest == ircd.serverID ]
+		self.addMetric(output, "txircd_link_received_bytes_total", "counter", "Bytes received from each linked server", [ (labels, server.traffic.bytesIn) for labels, server in links ])
+		self.addMetric(output, "txircd_link_sent_bytes_total", "counter", "Bytes sent to each linked server", [ (labels, server.traffic.bytesOut) for labels, server in links ])
+		self.addMetric(output, "txircd_link_received_lines_total", "counter", "Lines received from each linked server", [ (labels, server.traffic.linesIn) for labels, server in links ])
+		self.addMetric(output, "txircd_link_sent_lines_total", "counter", "Lines sent to each linked server", [ (labels, server.traffic.linesOut) for labels, server in links ])
+		self.addMetric(output, "txircd_link_send_queue_bytes", "gauge", "Bytes waiting to be sent to each linked server", [ (labels, server.sendQueueSize() + server.transportBufferSize()) for labels, server in links ])
+		
+		self.addTimingMetric(output, "txircd_storage_sync_seconds", "Time taken to write data storage", [ ({}, ircd.storageSyncTimes) ], True)
+		if ircd.timing is not None:
+			self.addTimingMetric(output, "txircd_action_seconds", "Time spent running actions", [ ({ "action": actionName }, stats) for actionName, stats in ircd.timing.actions.iteritems() ], False)
+			self.addTimingMetric(output, "txircd_command_seconds", "Time spent processing commands", [ (dict(zip(("type", "command"), commandKey.split("/", 1))), stats) for commandKey, stats in ircd.timing.commands.iteritems() ], False)
+		output.append("")
+		return "\n".join(output)
+	
+	def addMetric(self, output, metricName, metricType, description, values):
+		output.append("# HELP {} {}".format(metricName, description))
+		output.append("# TYPE {} {}".format(metricName, metricType))
+		for labels, value in values:
+			output.append("{}{} {}".format(metricName, self.formatLabels(labels), value))
+	
+	def addTimingMetric(self, output, metricName, description, values, withBuckets):
+		"""
+		Adds the TimingStats in values to the output. With buckets, they're
+		exported as histograms; without, they're exported as summaries with
+		only the count and total.
+		"""
+		output.append("# HELP {} {}".format(metricName, description))
+		output.append("# TYPE {} {}".format(metricName, "histogram" if withBuckets else "summary"))
+		for labels, stats in values:
+			if withBuckets:
+				seen = 0
+				for bucket, bucketCount in enumerate(stats.buckets[:-1]):
+					seen += bucketCount
+					bucketLabels = labels.copy()
+					bucketLabels["le"] = repr((1 << bucket) / 1000000.0)
+					output.append("{}_bucket{} {}".format(metricName, self.formatLabels(bucketLabels), seen))
+				bucketLabels = labels.copy()
+				bucketLabels["le"] = "+Inf"
+				output.append("{}_bucket{} {}".format(metricName, self.formatLabels(bucketLabels), stats.count))
+			output.append("{}_sum{} {!r}".format(metricName, self.formatLabels(labels), stats.total))
+			output.append("{}_count{} {}".format(metricName, self.formatLabels(labels), stats.count))
+	
+	def formatLabels(self, labels):
+		if not labels:
+			return ""
+		labelList = []
+		for label, value in sorted(labels.iteritems()):
+			escapedValue = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+			labelList.append("{}=\"{}\"".format(label, escapedValue))
+		return "{{{}}}".format(",".join(labelList))
+
+class MetricsResource(Resource):
+	isLeaf = True
+	
+	def __init__(self, exporter):
+		Resource.__init__(self)
+		self.exporter = exporter
+	
+	def render_GET(self, request):
+		request.setHeader("Content-Type", "text/plain; version=0.0.4")
+		return self.exporter.buildMetrics()
+
+metricsExporter = MetricsExporter()
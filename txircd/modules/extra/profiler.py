@@ -0,0 +1,166 @@
+from twisted.internet.threads import deferToThread
+from twisted.plugin import IPlugin
+from twisted.words.protocols import irc
+from txircd.config import ConfigValidationError
+from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
+from zope.interface import implements
+from cProfile import Profile
+from pstats import Stats
+import os
+
+class ProfileCommand(ModuleData, Command):
+	implements(IPlugin, IModuleData, ICommand)
+	
+	name = "ProfileCommand"
+	
+	def actions(self):
+		return [ ("commandpermission-PROFILE", 1, self.checkCommandPermission) ]
+	
+	def userCommands(self):
+		return [ ("PROFILE", 1, self) ]
+	
+	def verifyConfig(self, config):
+		if "profile_directory" in config and not isinstance(config["profile_directory"], basestring):
+			raise ConfigValidationError("profile_directory", "value must be a string")
+		if "profile_report_count" in config and (not isinstance(config["profile_report_count"], int) or config["profile_report_count"] < 0):
+			raise ConfigValidationError("profile_report_count", "invalid number")
+	
+	def load(self):
+		self.profiler = None
+		self.profilingUser = None
+		self.commandsLeft = None
+		self.stopTimer = None
+	
+	def unload(self):
+		if self.profiler is not None:
+			return self.stopProfiling("the ProfileCommand module was unloaded")
+		return None
+	
+	def checkCommandPermission(self, user, data):
+		if not self.ircd.runActionUntilValue("userhasoperpermission", user, "command-profile", users=[user]):
+			user.sendMessage(irc.ERR_NOPRIVILEGES, "Permission denied - You do not have the correct operator privileges")
+			return False
+		return None
+	
+	def parseParams(self, user, params, prefix, tags):
+		if not params:
+			user.sendSingleError("ProfileParams", irc.ERR_NEEDMOREPARAMS, "PROFILE", "Not enough parameters")
+			return None
+		limitType = params[0].upper()
+		if limitType == "STOP":
+			return {
+				"stop": True
+			}
+		if limitType not in ("SECONDS", "COMMANDS") or len(params) < 2:
+			user.sendSingleError("ProfileParams", "NOTICE", "*** Usage: PROFILE SECONDS <seconds>, PROFILE COMMANDS <count>, or PROFILE STOP")
+			return None
+		try:
+			limit = int(params[1])
+		except ValueError:
+			limit = 0
+		if limit <= 0:
+			user.sendSingleError("ProfileParams", "NOTICE", "*** The {} to profile must be a positive number".format(limitType.lower()))
+			return None
+		return {
+			"type": limitType,
+			"limit": limit
+		}
+	
+	def execute(self, user, data):
+		if "stop" in data:
+			if self.profiler is None:
+				user.sendMessage("NOTICE", "*** The server isn't being profiled")
+			else:
+				self.stopProfiling("stopped by {}".format(user.nick))
+			return True
+		if self.profiler is not None:
+			user.sendMessage("NOTICE", "*** The server is already being profiled")
+			return True
+		self.ircd.log.info("User {user.uuid} ({user.nick}) started profiling the server for {limit} {type}", user=user, limit=data["limit"], type=data["type"].lower())
+		self.profilingUser = user
+		if data["type"] == "SECONDS":
+			self.stopTimer = self.ircd.timers.callLater(data["limit"], self.stopProfiling, "time limit reached")
+		else:
+			self.commandsLeft = data["limit"]
+			self.ircd.commandReceivedHook = self.countCommand
+		# The profiler sees everything the reactor thread runs, not just command handling
+		self.profiler = Profile()
+		self.profiler.enable()
+		user.sendMessage("NOTICE", "*** Started profiling for {} {}".format(data["limit"], data["type"].lower()))
+		return True
+	
+	def countCommand(self):
+		self.commandsLeft -= 1
+		if self.commandsLeft <= 0:
+			self.stopProfiling("command limit reached")
+	
+	def stopProfiling(self, reason):
+		"""
+		Stops profiling, and saves and reports the profile. Returns a Deferred
+		that fires when the profile has been reported.
+		"""
+		profiler = self.profiler
+		profiler.disable()
+		self.profiler = None
+		self.ircd.commandReceivedHook = None
+		self.commandsLeft = None
+		if self.stopTimer is not None:
+			self.stopTimer.cancel()
+			self.stopTimer = None
+		user = self.profilingUser
+		self.profilingUser = None
+		directory = self.ircd.config.get("profile_directory", "profiles")
+		fileName = os.path.join(directory, "{}-{}.pstats".format(self.ircd.serverID, self.ircd.clock.now().strftime("%Y%m%d-%H%M%S")))
+		saveDeferred = deferToThread(self.saveProfile, profiler, directory, fileName, self.ircd.config.get("profile_report_count", 20))
+		saveDeferred.addCallback(self.reportProfile, user, reason, fileName)
+		saveDeferred.addErrback(self.logReportError)
+		return saveDeferred
+	
+	def saveProfile(self, profiler, directory, fileName, reportCount):
+		"""
+		Writes the profile to a pstats file and lists the functions that took
+		the most time. Runs in a thread, since both can take a while for a
+		large profile. Returns the error from writing the file (or None) and
+		the list.
+		"""
+		try:
+			if not os.path.isdir(directory):
+				os.makedirs(directory)
+			profiler.dump_stats(fileName)
+		except (IOError, OSError) as e:
+			saveError = e
+		else:
+			saveError = None
+		stats = Stats(profiler)
+		stats.sort_stats("cumulative")
+		topFunctions = []
+		for function in stats.fcn_list[:reportCount]:
+			primitiveCalls, totalCalls, ownTime, cumulativeTime, callers = stats.stats[function]
+			topFunctions.append("{:.3f}s cumulative, {:.3f}s own, {} calls: {}".format(cumulativeTime, ownTime, totalCalls, self.describeFunction(function)))
+		return saveError, topFunctions
+	
+	def reportProfile(self, result, user, reason, fileName):
+		saveError, topFunctions = result
+		messages = ["Profiling finished ({})".format(reason)]
+		if saveError is None:
+			self.ircd.log.info("Saved profile to {fileName}", fileName=fileName)
+			messages.append("Saved the profile to {}".format(fileName))
+		else:
+			self.ircd.log.error("Couldn't save profile: {err}", err=saveError)
+			messages.append("Couldn't save the profile: {}".format(saveError))
+		messages.extend(topFunctions)
+		if self.ircd.users.get(user.uuid) is user:
+			for message in messages:
+				user.sendMessage("NOTICE", "*** {}".format(message))
+	
+	def logReportError(self, failure):
+		self.ircd.log.failure("Failed to report the profile", failure)
+	
+	def describeFunction(self, function):
+		fileName, lineNumber, functionName = function
+		if fileName == "~": # Built-in functions
+			return functionName
+		pathParts = fileName.replace("\\", "/").split("/")
+		return "{} ({}:{})".format(functionName, "/".join(pathParts[-2:]), lineNumber)
+
+profileCmd = ProfileCommand()
@@ -1,7 +1,6 @@
 from twisted.plugin import IPlugin
 from txircd.config import ConfigValidationError
 from txircd.module_interface import IModuleData, ModuleData
-from txircd.utils import now, timestamp
 from zope.interface import implements
 
 class RateLimit(ModuleData):
@@ -39,7 +38,7 @@ class RateLimit(ModuleData):
 
 	def getPeriodData(self):
 		"""Returns (period as integer, time to end of period)"""
-		nowTS = timestamp(now())
+		nowTS = self.ircd.clock.epoch()
 		interval = self.ircd.config["rate_interval"]
 		period = int(nowTS / interval)
 		timeToEnd = (period + 1) * interval - nowTS
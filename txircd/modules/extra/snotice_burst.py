@@ -0,0 +1,28 @@
+from twisted.plugin import IPlugin
+from txircd.module_interface import IModuleData, ModuleData
+from zope.interface import implements
+
+class SnoBurst(ModuleData):
+	implements(IPlugin, IModuleData)
+	
+	name = "ServerNoticeBurst"
+	
+	def actions(self):
+		return [ ("burstprogress", 1, self.sendBurstNotice),
+		         ("servernoticetype", 1, self.checkSnoType)]
+	
+	def sendBurstNotice(self, server, linesSent, duration, complete):
+		if complete:
+			message = "Finished sending burst to {}: {} lines in {:.3f} seconds".format(server.name, linesSent, duration)
+		else:
+			message = "Still sending burst to {}: {} lines sent in {:.0f} seconds".format(server.name, linesSent, duration)
+		snodata = {
+			"mask": "burst",
+			"message": message
+		}
+		self.ircd.runActionProcessing("sendservernotice", snodata)
+	
+	def checkSnoType(self, user, typename):
+		return typename == "burst"
+
+snoBurst = SnoBurst()
@@ -0,0 +1,125 @@
+from twisted.internet.task import LoopingCall
+from twisted.plugin import IPlugin
+from txircd.config import ConfigValidationError
+from txircd.module_interface import IModuleData, ModuleData
+from zope.interface import implements
+from collections import deque
+from datetime import datetime
+from threading import Event, Thread
+import os, sys, thread
+
+class StallDetector(ModuleData):
+	implements(IPlugin, IModuleData)
+	
+	name = "StallDetector"
+	historyLength = 20
+	
+	def actions(self):
+		return [ ("servernoticetype", 1, self.checkSnoType),
+		         ("statsruntype-stalls", 10, self.listStalls) ]
+	
+	def verifyConfig(self, config):
+		if "stall_threshold" in config and (not isinstance(config["stall_threshold"], (int, float)) or config["stall_threshold"] <= 0):
+			raise ConfigValidationError("stall_threshold", "invalid number")
+		if "stall_check_interval" in config and (not isinstance(config["stall_check_interval"], (int, float)) or config["stall_check_interval"] <= 0):
+			raise ConfigValidationError("stall_check_interval", "invalid number")
+	
+	def load(self):
+		self.stalls = deque(maxlen=self.historyLength)
+		self.reactorThreadID = thread.get_ident()
+		self.lastCheck = self.ircd.clock.monotonic()
+		self.stallSample = None
+		self.checkInterval = self.ircd.config.get("stall_check_interval", 0.05)
+		self.lagChecker = LoopingCall(self.checkLag)
+		self.lagChecker.start(self.checkInterval, now=False)
+		# The reactor can't notice what's blocking it until the blocking code is done, so a separate thread watches
+		# for the reactor falling behind and notes what it's running while it's stuck.
+		self.stopSampling = Event()
+		self.sampler = Thread(target=self.runSampler, args=(self.stopSampling,), name="txircd-stalldetector")
+		self.sampler.daemon = True
+		self.sampler.start()
+	
+	def unload(self):
+		if self.lagChecker.running:
+			self.lagChecker.stop()
+		self.stopSampling.set()
+	
+	def rehash(self):
+		newInterval = self.ircd.config.get("stall_check_interval", 0.05)
+		if newInterval != self.checkInterval:
+			self.checkInterval = newInterval
+			if self.lagChecker.running:
+				self.lagChecker.stop()
+			self.lastCheck = self.ircd.clock.monotonic()
+			self.lagChecker.start(newInterval, now=False)
+	
+	def checkLag(self):
+		checkTime = self.ircd.clock.monotonic()
+		lag = checkTime - self.lastCheck - self.checkInterval
+		self.lastCheck = checkTime
+		sample = self.stallSample
+		self.stallSample = None
+		if lag < self.ircd.config.get("stall_threshold", 0.5):
+			return
+		if sample is None:
+			sample = "unknown"
+		self.stalls.append((datetime.utcnow(), lag, sample)) # Only the lag needs the monotonic clock
+		self.ircd.log.warn("The reactor was stalled for {lag:.3f} seconds while running {sample}", lag=lag, sample=sample)
+		snodata = {
+			"mask": "stall",
+			"message": "Server stalled for {:.3f} seconds while running {}".format(lag, sample)
+		}
+		self.ircd.runActionProcessing("sendservernotice", snodata)
+	
+	def runSampler(self, stopSampling):
+		while not stopSampling.wait(self.checkInterval):
+			if self.stallSample is not None:
+				continue # Already noted what's running during this stall
+			if self.ircd.clock.monotonic() - self.lastCheck - self.checkInterval < self.ircd.config.get("stall_threshold", 0.5):
+				continue
+			try:
+				self.stallSample = self.describeRunning()
+			except Exception: # The reactor thread changed what it was running while we looked
+				pass
+	
+	def describeRunning(self):
+		"""
+		Describes what the reactor thread is running right now. Runs in the
+		sampler thread.
+		"""
+		description = []
+		runningCommand = self.ircd.runningCommand
+		if runningCommand is not None:
+			connection, command = runningCommand
+			if connection.connectionType == "server":
+				description.append("command {} from server {}".format(command, connection.name or connection.serverID))
+			else:
+				description.append("command {} from user {}".format(command, connection.nick or connection.uuid))
+		frame = sys._current_frames().get(self.reactorThreadID)
+		location = None
+		actionName = None
+		while frame is not None:
+			code = frame.f_code
+			if actionName is None and code.co_name.startswith(("runAction", "runComboAction")) and "actionName" in code.co_varnames:
+				actionName = frame.f_locals.get("actionName")
+			if location is None and "txircd" in code.co_filename:
+				location = "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), frame.f_lineno)
+			frame = frame.f_back
+		if actionName is not None:
+			description.append("action {}".format(actionName))
+		if location is not None:
+			description.append("in {}".format(location))
+		if not description:
+			return "unknown"
+		return ", ".join(description)
+	
+	def checkSnoType(self, user, typename):
+		return typename == "stall"
+	
+	def listStalls(self):
+		stallInfo = {}
+		for stallTime, lag, sample in self.stalls:
+			stallInfo[stallTime.isoformat()] = "{:.3f}s {}".format(lag, sample)
+		return stallInfo
+
+stallDetector = StallDetector()
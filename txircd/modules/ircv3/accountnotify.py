@@ -12,6 +12,7 @@ class AccountNotify(ModuleData):
 		         ("capabilitylist", 10, self.addCapability) ]
 	
 	def load(self):
+		self.accountNotifyBit = self.ircd.capabilityBit("account-notify")
 		if "unloading-account-notify" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-account-notify"]
 			return
@@ -32,14 +33,10 @@ class AccountNotify(ModuleData):
 	def sendAccountNotice(self, user, key, oldValue, value, visibility, setByUser, fromServer):
 		if key != "account":
 			return
-		noticeUsers = set()
 		noticePrefix = user.hostmask()
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
-		for channel in user.channels:
-			for noticeUser in channel.users.iterkeys():
-				if noticeUser.uuid[:3] == self.ircd.serverID and noticeUser != user and "capabilities" in noticeUser.cache and "account-notify" in noticeUser.cache["capabilities"]:
-					noticeUsers.add(noticeUser)
+		noticeUsers = user.localNeighbors(self.accountNotifyBit)
 		if value:
 			for noticeUser in noticeUsers:
 				tags = noticeUser.filterConditionalTags(conditionalTags)
@@ -12,6 +12,7 @@ class AccountTag(ModuleData):
 		         ("capabilitylist", 10, self.addCapability) ]
 	
 	def load(self):
+		self.accountTagBit = self.ircd.capabilityBit("account-tag")
 		if "unloading-account-tag" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-account-tag"]
 			return
@@ -31,6 +32,6 @@ class AccountTag(ModuleData):
 	
 	def addAccountTag(self, fromUser, conditionalTags):
 		if fromUser.metadataKeyExists("account"):
-			conditionalTags["account"] = (fromUser.metadataValue("account"), lambda user: "capabilities" in user.cache and "account-tag" in user.cache["capabilities"])
+			conditionalTags["account"] = (fromUser.metadataValue("account"), self.accountTagBit)
 
 accountTag = AccountTag()
\ No newline at end of file
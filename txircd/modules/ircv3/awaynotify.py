@@ -13,6 +13,7 @@ class AwayNotify(ModuleData):
 		         ("join", 10, self.tellChannelAway) ]
 	
 	def load(self):
+		self.awayNotifyBit = self.ircd.capabilityBit("away-notify")
 		if "unloading-away-notify" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-away-notify"]
 			return
@@ -33,14 +34,10 @@ class AwayNotify(ModuleData):
 	def sendAwayNotice(self, user, key, oldValue, value, visibility, setByUser, fromServer):
 		if key != "away":
 			return
-		noticeUsers = set()
 		noticePrefix = user.hostmask()
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
-		for channel in user.channels:
-			for noticeUser in channel.users.iterkeys():
-				if noticeUser.uuid[:3] == self.ircd.serverID and noticeUser != user and "capabilities" in noticeUser.cache and "away-notify" in noticeUser.cache["capabilities"]:
-					noticeUsers.add(noticeUser)
+		noticeUsers = user.localNeighbors(self.awayNotifyBit)
 		if value:
 			for noticeUser in noticeUsers:
 				tags = noticeUser.filterConditionalTags(conditionalTags)
@@ -51,14 +48,14 @@ class AwayNotify(ModuleData):
 				noticeUser.sendMessage("AWAY", to=None, prefix=noticePrefix, tags=tags)
 	
 	def tellChannelAway(self, channel, user):
-		if not user.metadataKeyExists("away"):
+		if not user.metadataKeyExists("away") or not channel.capabilityUserCount(self.awayNotifyBit):
 			return
 		awayReason = user.metadataValue("away")
 		noticePrefix=user.hostmask()
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
-		for noticeUser in channel.users.iterkeys():
-			if noticeUser.uuid[:3] == self.ircd.serverID and "capabilities" in noticeUser.cache and "away-notify" in noticeUser.cache["capabilities"]:
+		for noticeUser in channel.localUsers:
+			if noticeUser.capabilityMask & self.awayNotifyBit:
 				tags = noticeUser.filterConditionalTags(conditionalTags)
 				noticeUser.sendMessage("AWAY", awayReason, to=None, prefix=noticePrefix, tags=tags)
 
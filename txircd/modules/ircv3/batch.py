@@ -15,6 +15,7 @@ class Batch(ModuleData):
 		         ("capabilitylist", 10, self.addCapability) ]
 	
 	def load(self):
+		self.batchBit = self.ircd.capabilityBit("batch")
 		if "unloading-batch" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-batch"]
 			return
@@ -33,13 +34,14 @@ class Batch(ModuleData):
 		capList.append("batch")
 	
 	def startBatch(self, user, batchName, batchType, batchParameters):
-		if "capabilities" not in user.cache or "batch" not in user.cache["capabilities"]:
+		if not user.capabilityMask & self.batchBit:
 			return
 		uniqueReferenceTagParts = [ random.choice(string.ascii_letters) ]
 		for i in range(2, 10):
 			uniqueReferenceTagParts.append(random.choice(string.ascii_letters + string.digits))
 		uniqueReferenceTag = "".join(uniqueReferenceTagParts)
 		user.cache["currentBatch"] = uniqueReferenceTag
+		user.outgoingMessageModifiers.add("batch")
 		user.sendMessage("BATCH", "+{}".format(uniqueReferenceTag), batchType, *batchParameters)
 	
 	def addBatchTag(self, user, command, args, kw):
@@ -54,6 +56,7 @@ class Batch(ModuleData):
 			return
 		uniqueReferenceTag = user.cache["currentBatch"]
 		del user.cache["currentBatch"]
+		user.outgoingMessageModifiers.discard("batch")
 		user.sendMessage("BATCH", "-{}".format(uniqueReferenceTag))
 
 batch = Batch()
\ No newline at end of file
@@ -28,6 +28,7 @@ class Cap(ModuleData, Command):
 				if "capabilities" not in user.cache:
 					user.cache["capabilities"] = {}
 				user.cache["capabilities"]["cap-notify"] = None
+				user.setCapabilityMask(user.capabilityMask | self.ircd.capabilityBit("cap-notify"))
 	
 	def unload(self):
 		self.removeCapability("cap-notify")
@@ -43,8 +44,9 @@ class Cap(ModuleData, Command):
 		return None
 	
 	def newCapability(self, capName, sendInBatch = None):
+		notifyBit = self.ircd.capabilityBit("cap-notify")
 		for user in self.ircd.users.itervalues():
-			if "capabilities" in user.cache and "cap-notify" in user.cache["capabilities"]:
+			if user.capabilityMask & notifyBit:
 				if sendInBatch:
 					user.sendMessageInBatch(sendInBatch, "CAP", "NEW", capName)
 				else:
@@ -56,15 +58,18 @@ class Cap(ModuleData, Command):
 		else:
 			capName = capability
 			value = None
+		capBit = self.ircd.capabilityBit(capName)
+		notifyBit = self.ircd.capabilityBit("cap-notify")
 		for user in self.ircd.users.itervalues():
 			if "capabilities" in user.cache:
-				if "cap-notify" in user.cache["capabilities"]:
+				if user.capabilityMask & notifyBit:
 					if sendInBatch:
 						user.sendMessageInBatch(sendInBatch, "CAP", "DEL", capName)
 					else:
 						user.sendMessage("CAP", "DEL", capName)
 				if capName in user.cache["capabilities"] and (value is None or user.cache["capabilities"][capName] == value):
 					del user.cache["capabilities"][capName]
+					user.setCapabilityMask(user.capabilityMask & ~capBit)
 	
 	def parseParams(self, user, params, prefix, tags):
 		if not params:
@@ -118,6 +123,7 @@ class Cap(ModuleData, Command):
 				if version == "302":
 					user.cache["capversion"] = 302
 					user.cache["capabilities"]["cap-notify"] = None
+					user.setCapabilityMask(user.capabilityMask | self.ircd.capabilityBit("cap-notify"))
 			capList = []
 			self.ircd.runActionStandard("capabilitylist", user, capList)
 			capabilities = " ".join(capList)
@@ -182,9 +188,11 @@ class Cap(ModuleData, Command):
 						capability = change[1]
 						value = None
 					user.cache["capabilities"][change[1]] = value
+					user.setCapabilityMask(user.capabilityMask | self.ircd.capabilityBit(capability))
 					self.ircd.runActionStandard("addusercap", user, change[1], value)
 				elif change[1] in user.cache["capabilities"]:
 					del user.cache["capabilities"][change[1]]
+					user.setCapabilityMask(user.capabilityMask & ~self.ircd.capabilityBit(change[1].split("=", 1)[0]))
 					self.ircd.runActionStandard("delusercap", user, change[1])
 			user.sendMessage("CAP", "ACK", " ".join(requestedCapabilities))
 			return True
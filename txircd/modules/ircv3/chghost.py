@@ -14,6 +14,7 @@ class ChangeHost(ModuleData):
 		         ("capabilitylist", 1, self.addCapability) ]
 	
 	def load(self):
+		self.chghostBit = self.ircd.capabilityBit("chghost")
 		if "unloading-chghost" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-chghost"]
 			return
@@ -46,13 +47,10 @@ class ChangeHost(ModuleData):
 	def sendToChannelUsers(self, user, userIdent, userHost, userPrefix):
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
-		channelUsers = set()
-		for channel in user.channels:
-			for chanUser in channel.users.iterkeys():
-				channelUsers.add(chanUser)
+		channelUsers = user.localNeighbors(self.chghostBit)
+		if user.channels and user.uuid[:3] == self.ircd.serverID and user.capabilityMask & self.chghostBit:
+			channelUsers.add(user)
 		for chanUser in channelUsers:
-			if "capabilities" not in chanUser.cache or "chghost" not in chanUser.cache["capabilities"]:
-				continue
 			tags = chanUser.filterConditionalTags(conditionalTags)
 			chanUser.sendMessage("CHGHOST", userIdent, userHost, to=None, prefix=userPrefix, tags=tags)
 
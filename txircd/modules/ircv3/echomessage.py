@@ -13,6 +13,7 @@ class EchoMessage(ModuleData):
 		         ("capabilitylist", 10, self.addCapability) ]
 	
 	def load(self):
+		self.echoMessageBit = self.ircd.capabilityBit("echo-message")
 		if "unloading-echo-message" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-echo-message"]
 			return
@@ -37,7 +38,7 @@ class EchoMessage(ModuleData):
 		self.returnMessage("NOTICE", user, data)
 	
 	def returnMessage(self, command, user, data):
-		if "capabilities" not in user.cache or "echo-message" not in user.cache["capabilities"]:
+		if not user.capabilityMask & self.echoMessageBit:
 			return
 		userPrefix = user.hostmask()
 		conditionalTags = {}
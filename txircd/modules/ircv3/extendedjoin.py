@@ -12,6 +12,7 @@ class ExtendedJoin(ModuleData):
 		         ("joinmessage", 2, self.sendExtJoin) ]
 	
 	def load(self):
+		self.extendedJoinBit = self.ircd.capabilityBit("extended-join")
 		if "unloading-extended-join" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-extended-join"]
 			return
@@ -30,6 +31,8 @@ class ExtendedJoin(ModuleData):
 		capList.append("extended-join")
 	
 	def sendExtJoin(self, messageUsers, channel, user):
+		if not channel.capabilityUserCount(self.extendedJoinBit):
+			return
 		userPrefix = user.hostmask()
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
@@ -39,7 +42,7 @@ class ExtendedJoin(ModuleData):
 			userAccount = "*"
 		extJoinUsers = []
 		for toUser in messageUsers:
-			if "capabilities" in toUser.cache and "extended-join" in toUser.cache["capabilities"]:
+			if toUser.capabilityMask & self.extendedJoinBit:
 				extJoinUsers.append(toUser)
 				tags = toUser.filterConditionalTags(conditionalTags)
 				toUser.sendMessage("JOIN", userAccount, user.gecos, to=channel.name, prefix=userPrefix, tags=tags)
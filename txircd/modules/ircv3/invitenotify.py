@@ -12,6 +12,7 @@ class InviteNotify(ModuleData):
 		         ("notifyinvite", 10, self.sendInviteNotify) ]
 	
 	def load(self):
+		self.inviteNotifyBit = self.ircd.capabilityBit("invite-notify")
 		if "unloading-invite-notify" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-invite-notify"]
 			return
@@ -35,7 +36,7 @@ class InviteNotify(ModuleData):
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", sendingUser, conditionalTags)
 		for user in userList:
-			if "capabilities" in user.cache and "invite-notify" in user.cache["capabilities"]:
+			if user.capabilityMask & self.inviteNotifyBit:
 				tags = user.filterConditionalTags(conditionalTags)
 				user.sendMessage("INVITE", channel.name, to=invitedUser.nick, prefix=userPrefix, tags=tags)
 				sentToUsers.append(user)
@@ -36,6 +36,7 @@ class Monitor(ModuleData, Command):
 		return [ ("MONITOR", 1, self) ]
 	
 	def load(self):
+		self.metadataNotifyBit = self.ircd.capabilityBit("metadata-notify")
 		self.targetIndex = CaseInsensitiveDictionary()
 		# We'll run a cleaner every minute. The reason we do this is that, since there can be multiple
 		# notified users for a target, the index is implemented as a CaseInsensitiveDictionary pointing
@@ -98,7 +99,7 @@ class Monitor(ModuleData, Command):
 	
 	def notifyUserMetadataChange(self, user, key, oldValue, value, visibility, setByUser, fromServer):
 		sentToUsers = set()
-		if not setByUser and ("capabilities" in user.cache and "metadata-notify" in user.cache["capabilities"]) and user.canSeeMetadataVisibility(visibility):
+		if not setByUser and user.capabilityMask & self.metadataNotifyBit and user.canSeeMetadataVisibility(visibility):
 			# Technically, the spec excludes "changes made by the clients themselves" from notification. However,
 			# since we don't know WHICH user changed the metadata, we'll exclude all sets by users and hope that
 			# nobody's actually changing someone else's metadata (would only be opers).
@@ -111,26 +112,29 @@ class Monitor(ModuleData, Command):
 			for monitoringUser in self.targetIndex[user.nick]:
 				if monitoringUser in sentToUsers:
 					continue
-				if "capabilities" in monitoringUser.cache and "metadata-notify" in monitoringUser.cache["capabilities"] and monitoringUser.canSeeMetadataVisibility(visibility):
+				if monitoringUser.capabilityMask & self.metadataNotifyBit and monitoringUser.canSeeMetadataVisibility(visibility):
 					if value is None:
 						monitoringUser.sendMessage("METADATA", key, visibility, to=user.nick)
 					else:
 						monitoringUser.sendMessage("METADATA", key, visibility, value, to=user.nick)
 					sentToUsers.add(monitoringUser)
-		for channel in user.channels:
-			for inChannelUser in channel.users.iterkeys():
-				if inChannelUser in sentToUsers:
-					continue
-				if "capabilities" in inChannelUser.cache and "metadata-notify" in inChannelUser.cache["capabilities"] and inChannelUser.canSeeMetadataVisibility(visibility):
-					if value is None:
-						inChannelUser.sendMessage("METADATA", key, visibility, to=user.nick)
-					else:
-						inChannelUser.sendMessage("METADATA", key, visibility, value, to=user.nick)
-					sentToUsers.add(inChannelUser)
+		channelUsers = user.localNeighbors(self.metadataNotifyBit)
+		if user.channels and user.capabilityMask & self.metadataNotifyBit:
+			channelUsers.add(user) # The user is notified as a channel member even for changes they made
+		for inChannelUser in channelUsers:
+			if inChannelUser in sentToUsers:
+				continue
+			if inChannelUser.canSeeMetadataVisibility(visibility):
+				if value is None:
+					inChannelUser.sendMessage("METADATA", key, visibility, to=user.nick)
+				else:
+					inChannelUser.sendMessage("METADATA", key, visibility, value, to=user.nick)
 	
 	def notifyChannelMetadataChange(self, channel, key, oldValue, value, visibility, setByUser, fromServer):
-		for user in channel.users.iterkeys():
-			if "capabilities" in user.cache and "metadata-notify" in user.cache["capabilities"] and user.canSeeMetadataVisibility(visibility):
+		if not channel.capabilityUserCount(self.metadataNotifyBit):
+			return
+		for user in channel.localUsers:
+			if user.capabilityMask & self.metadataNotifyBit and user.canSeeMetadataVisibility(visibility):
 				if value is None:
 					user.sendMessage("METADATA", key, visibility, to=channel.name)
 				else:
@@ -206,7 +210,7 @@ class Monitor(ModuleData, Command):
 				offlineLines = splitMessage(",".join(offlineList), 400, ",")
 				for line in offlineLines:
 					user.sendMessage(irc.RPL_MONOFFLINE, line)
-			if "capabilities" in user.cache and "metadata-notify" in user.cache["capabilities"]:
+			if user.capabilityMask & self.metadataNotifyBit:
 				for targetUser in onlineUserList:
 					self.sendUserMetadata(targetUser, user)
 			return True
@@ -12,6 +12,7 @@ class MultiPrefix(ModuleData):
 		         ("capabilitylist", 10, self.addCapability) ]
 	
 	def load(self):
+		self.multiPrefixBit = self.ircd.capabilityBit("multi-prefix")
 		if "unloading-multi-prefix" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-multi-prefix"]
 			return
@@ -30,7 +31,7 @@ class MultiPrefix(ModuleData):
 		capList.append("multi-prefix")
 	
 	def allStatuses(self, channel, user, requestingUser):
-		if "capabilities" not in requestingUser.cache or "multi-prefix" not in requestingUser.cache["capabilities"]:
+		if not requestingUser.capabilityMask & self.multiPrefixBit:
 			return None
 		if user not in channel.users:
 			return ""
@@ -12,6 +12,7 @@ class UserhostInNames(ModuleData):
 		         ("displaychanneluser", 10, self.showUserHostmask) ]
 	
 	def load(self):
+		self.userhostInNamesBit = self.ircd.capabilityBit("userhost-in-names")
 		if "unloading-userhost-in-names" in self.ircd.dataCache:
 			del self.ircd.dataCache["unloading-userhost-in-names"]
 			return
@@ -30,7 +31,7 @@ class UserhostInNames(ModuleData):
 		capList.append("userhost-in-names")
 	
 	def showUserHostmask(self, channel, showToUser, showingUser):
-		if "capabilities" not in showToUser.cache or "userhost-in-names" not in showToUser.cache["capabilities"]:
+		if not showToUser.capabilityMask & self.userhostInNamesBit:
 			return None
 		return showingUser.hostmask()
 
@@ -1,15 +1,202 @@
-from txircd.utils import ircLower, now, timestamp
+from txircd.utils import ircLower, timestamp, wildcardPattern
 from datetime import datetime, timedelta
+from heapq import heappop, heappush
+import re, socket
+
+def _addressBits(address):
+	"""
+	Converts an IP address to a tuple of (family, address as an integer, bit
+	length). IPv4-mapped IPv6 addresses are converted to IPv4. Returns None if
+	the address isn't valid.
+	"""
+	if address.startswith("::ffff:") and "." in address:
+		address = address[7:]
+	for family, bitLength in ((socket.AF_INET, 32), (socket.AF_INET6, 128)):
+		try:
+			packedAddress = socket.inet_pton(family, address)
+		except (socket.error, ValueError):
+			continue
+		return family, int(packedAddress.encode("hex"), 16), bitLength
+	return None
+
+class NetworkTree(object):
+	"""
+	A binary radix tree of CIDR ranges for one address family. Each node is a
+	list of [zero child, one child, values on this prefix].
+	"""
+	def __init__(self, bitLength):
+		self.bitLength = bitLength
+		self.root = [None, None, None]
+	
+	def add(self, addressNum, prefixLength, value):
+		node = self.root
+		for bitIndex in xrange(prefixLength):
+			bit = (addressNum >> (self.bitLength - 1 - bitIndex)) & 1
+			if node[bit] is None:
+				node[bit] = [None, None, None]
+			node = node[bit]
+		if node[2] is None:
+			node[2] = []
+		node[2].append(value)
+	
+	def remove(self, addressNum, prefixLength, value):
+		path = []
+		node = self.root
+		for bitIndex in xrange(prefixLength):
+			bit = (addressNum >> (self.bitLength - 1 - bitIndex)) & 1
+			if node[bit] is None:
+				return
+			path.append((node, bit))
+			node = node[bit]
+		if node[2] is None or value not in node[2]:
+			return
+		node[2].remove(value)
+		if not node[2]:
+			node[2] = None
+		while path and node[0] is None and node[1] is None and node[2] is None: # Prune empty branches
+			parent, bit = path.pop()
+			parent[bit] = None
+			node = parent
+	
+	def lookup(self, addressNum):
+		"""
+		Returns the values of all ranges containing the given address.
+		"""
+		values = []
+		node = self.root
+		bitIndex = 0
+		while node is not None:
+			if node[2] is not None:
+				values.extend(node[2])
+			if bitIndex == self.bitLength:
+				break
+			node = node[(addressNum >> (self.bitLength - 1 - bitIndex)) & 1]
+			bitIndex += 1
+		return values
+
+class XLineIndex(object):
+	"""
+	An index of all the lines of one type, keyed by normalized mask. Masks
+	with no wildcards are found by hash lookup, CIDR masks (when enabled) are
+	found in a radix tree, and wildcard masks are compiled into regular
+	expressions.
+	"""
+	def __init__(self, networkMasks):
+		self.networkMasks = networkMasks
+		self.lines = {}
+		self.exactMasks = {}
+		self.wildcardMasks = {}
+		self.networks = {
+			socket.AF_INET: NetworkTree(32),
+			socket.AF_INET6: NetworkTree(128)
+		}
+		self._nextSequence = 0
+		self._wildcardMatch = None
+	
+	def add(self, normalMask, lineData):
+		"""
+		Adds a line to the index. Returns the line's sequence number, which
+		orders lines by when they were added.
+		"""
+		sequence = self._nextSequence
+		self._nextSequence += 1
+		entry = (sequence, lineData)
+		networkData = self._parseNetwork(normalMask)
+		if networkData:
+			family, addressNum, prefixLength = networkData
+			self.networks[family].add(addressNum, prefixLength, entry)
+		elif "*" not in normalMask and "?" not in normalMask:
+			self.exactMasks[normalMask] = entry
+		else:
+			pattern = wildcardPattern(normalMask)
+			self.wildcardMasks[normalMask] = (sequence, lineData, pattern, re.compile(pattern + r"\Z", re.DOTALL).match)
+			self._wildcardMatch = None
+		self.lines[normalMask] = entry
+		return sequence
+	
+	def remove(self, normalMask):
+		if normalMask not in self.lines:
+			return
+		entry = self.lines[normalMask]
+		del self.lines[normalMask]
+		networkData = self._parseNetwork(normalMask)
+		if networkData:
+			family, addressNum, prefixLength = networkData
+			self.networks[family].remove(addressNum, prefixLength, entry)
+		elif normalMask in self.exactMasks:
+			del self.exactMasks[normalMask]
+		elif normalMask in self.wildcardMasks:
+			del self.wildcardMasks[normalMask]
+			self._wildcardMatch = None
+	
+	def match(self, matchStrings, address):
+		"""
+		Returns the data for all lines matching any of the given normalized
+		strings or the given IP address, in the order they were added.
+		"""
+		matches = []
+		for matchString in matchStrings:
+			if matchString in self.exactMasks:
+				matches.append(self.exactMasks[matchString])
+		if self.wildcardMasks:
+			if self._wildcardMatch is None:
+				self._wildcardMatch = re.compile("(?:{})\\Z".format("|".join([maskData[2] for maskData in self.wildcardMasks.itervalues()])), re.DOTALL).match
+			for matchString in matchStrings:
+				if self._wildcardMatch(matchString):
+					for sequence, lineData, pattern, maskMatch in self.wildcardMasks.itervalues():
+						for checkString in matchStrings:
+							if maskMatch(checkString):
+								matches.append((sequence, lineData))
+								break
+					break
+		if self.networkMasks and address:
+			addressData = _addressBits(address)
+			if addressData:
+				family, addressNum, bitLength = addressData
+				matches.extend(self.networks[family].lookup(addressNum))
+		if not matches:
+			return []
+		matchesBySequence = dict(matches) # Each line only needs to be returned once
+		return [matchesBySequence[sequence] for sequence in sorted(matchesBySequence)]
+	
+	def _parseNetwork(self, normalMask):
+		if not self.networkMasks or "/" not in normalMask:
+			return None
+		address, prefixLength = normalMask.split("/", 1)
+		try:
+			prefixLength = int(prefixLength)
+		except ValueError:
+			return None
+		addressData = _addressBits(address)
+		if not addressData:
+			return None
+		family, addressNum, bitLength = addressData
+		if prefixLength < 0 or prefixLength > bitLength:
+			return None
+		addressNum &= ~((1 << (bitLength - prefixLength)) - 1) # Mask off the host part of the address
+		return family, addressNum, prefixLength
 
 class XLineBase(object):
 	lineType = None
 	propagateToServers = True
+	networkMasks = False
 	
 	def initializeLineStorage(self):
-		if "xlines" not in self.ircd.storage:
-			self.ircd.storage["xlines"] = {}
-		if self.lineType not in self.ircd.storage["xlines"]:
-			self.ircd.storage["xlines"][self.lineType] = []
+		# Each line type is stored under its own key, so a change to one type's lines doesn't rewrite the others
+		self._storageKey = "xlines-{}".format(self.lineType)
+		if "xlines" in self.ircd.storage and self.lineType in self.ircd.storage["xlines"]: # Stored by older versions
+			self.ircd.storage[self._storageKey] = self.ircd.storage["xlines"].pop(self.lineType)
+			if self.ircd.storage["xlines"]:
+				self.ircd.storage.markChanged("xlines")
+			else:
+				del self.ircd.storage["xlines"]
+		if self._storageKey not in self.ircd.storage:
+			self.ircd.storage[self._storageKey] = []
+		self._lineIndex = XLineIndex(self.networkMasks)
+		self._expiryHeap = []
+		self._expiryTimer = None
+		for lineData in self.ircd.storage[self._storageKey]:
+			self._indexLine(lineData)
 		self.expireLines()
 	
 	def matchUser(self, user, data = None):
@@ -17,33 +204,80 @@ class XLineBase(object):
 			return None
 		if user.uuid[:3] != self.ircd.serverID:
 			return None # The remote server should handle the users on that server
-		self.expireLines()
-		for lineData in self.ircd.storage["xlines"][self.lineType]:
+		for lineData in self._matchingLines(user, data):
 			mask = lineData["mask"]
-			if self.checkUserMatch(user, mask, data) and self.ircd.runComboActionUntilValue((("verifyxlinematch-{}".format(self.lineType), user, mask, data), ("verifyxlinematch", self.lineType, user, mask, data)), users=[user]) is not False:
+			if self.ircd.runComboActionUntilValue((("verifyxlinematch-{}".format(self.lineType), user, mask, data), ("verifyxlinematch", self.lineType, user, mask, data)), users=[user]) is not False:
 				return lineData["reason"]
 		return None
 	
+	def findMatchingUsers(self, mask):
+		"""
+		Checks all local users against only the line with the given mask.
+		Returns a list of (user, reason) tuples for matching users. Used after
+		adding a line, since no other line can have started matching a user.
+		"""
+		if not self.lineType:
+			return []
+		normalMask = self.normalizeMask(mask)
+		if normalMask not in self._lineIndex.lines:
+			return []
+		lineData = self._lineIndex.lines[normalMask][1]
+		lineIndex = XLineIndex(self.networkMasks)
+		lineIndex.add(normalMask, lineData)
+		matchingUsers = []
+		for user in self.ircd.users.values():
+			if user.uuid[:3] != self.ircd.serverID:
+				continue
+			matchStrings = self.matchStrings(user, None)
+			if matchStrings is None:
+				if not self.checkUserMatch(user, lineData["mask"], None):
+					continue
+			elif not lineIndex.match(matchStrings, self.matchAddress(user, None)):
+				continue
+			if self.ircd.runComboActionUntilValue((("verifyxlinematch-{}".format(self.lineType), user, lineData["mask"], None), ("verifyxlinematch", self.lineType, user, lineData["mask"], None)), users=[user]) is not False:
+				matchingUsers.append((user, lineData["reason"]))
+		return matchingUsers
+	
+	def _matchingLines(self, user, data):
+		matchStrings = self.matchStrings(user, data)
+		if matchStrings is None: # This line type doesn't support the index, so check each line
+			return [lineData for lineData in self.ircd.storage[self._storageKey] if self.checkUserMatch(user, lineData["mask"], data)]
+		return self._lineIndex.match(matchStrings, self.matchAddress(user, data))
+	
 	def checkUserMatch(self, user, mask, data):
 		pass
 	
+	def matchStrings(self, user, data):
+		"""
+		Returns a list of strings for the user to match against line masks,
+		normalized the same way as masks. Line types that don't implement
+		this are matched by calling checkUserMatch for every line.
+		"""
+		return None
+	
+	def matchAddress(self, user, data):
+		"""
+		Returns the IP address for the user to match against CIDR masks. Only
+		used by line types with networkMasks set.
+		"""
+		return None
+	
 	def addLine(self, mask, createdTime, durationSeconds, setter, reason, fromServer = None):
 		if not self.lineType:
 			return False
-		self.expireLines()
 		normalMask = self.normalizeMask(mask)
-		lines = self.ircd.storage["xlines"][self.lineType]
-		for lineData in lines:
-			lineMask = self.normalizeMask(lineData["mask"])
-			if normalMask == lineMask:
-				return False
-		lines.append({
+		if normalMask in self._lineIndex.lines:
+			return False
+		lineData = {
 			"mask": mask,
 			"created": createdTime,
 			"duration": durationSeconds,
 			"setter": setter,
 			"reason": reason
-		})
+		}
+		self.ircd.storage[self._storageKey].append(lineData)
+		self.ircd.storage.markChanged(self._storageKey)
+		self._indexLine(lineData)
 		if self.propagateToServers:
 			self.ircd.broadcastToServers(fromServer, "ADDLINE", self.lineType, mask, setter, str(timestamp(createdTime)), str(durationSeconds), reason, prefix=self.ircd.serverID)
 		return True
@@ -52,41 +286,72 @@ class XLineBase(object):
 		if not self.lineType:
 			return False
 		normalMask = self.normalizeMask(mask)
-		for index, lineData in enumerate(self.ircd.storage["xlines"][self.lineType]):
-			lineMask = self.normalizeMask(lineData["mask"])
-			if normalMask == lineMask:
-				del self.ircd.storage["xlines"][self.lineType][index]
-				if self.propagateToServers:
-					self.ircd.broadcastToServers(fromServer, "DELLINE", self.lineType, mask)
-				return True
-		return False
+		if normalMask not in self._lineIndex.lines:
+			return False
+		self._removeLine(normalMask)
+		if self.propagateToServers:
+			self.ircd.broadcastToServers(fromServer, "DELLINE", self.lineType, mask)
+		return True
 	
 	def normalizeMask(self, mask):
 		return ircLower(mask)
 	
+	def _indexLine(self, lineData):
+		normalMask = self.normalizeMask(lineData["mask"])
+		if normalMask in self._lineIndex.lines:
+			return
+		sequence = self._lineIndex.add(normalMask, lineData)
+		if lineData["duration"]:
+			expireTime = lineData["created"] + timedelta(seconds=lineData["duration"])
+			expiryEntry = (expireTime, sequence, normalMask)
+			heappush(self._expiryHeap, expiryEntry)
+			if self._expiryHeap[0] is expiryEntry: # Only reschedule when this is now the next line to expire
+				self._scheduleExpiry()
+	
+	def _removeLine(self, normalMask):
+		lineData = self._lineIndex.lines[normalMask][1]
+		self._lineIndex.remove(normalMask)
+		self.ircd.storage[self._storageKey].remove(lineData)
+		self.ircd.storage.markChanged(self._storageKey)
+	
 	def expireLines(self):
+		"""
+		Removes the lines that have expired. This runs from a timer set for
+		the next line to expire, so lines don't need to be expired before
+		they're checked.
+		"""
 		if not self.lineType:
 			return
-		currentTime = now()
-		expiredLines = []
-		lines = self.ircd.storage["xlines"][self.lineType]
-		for lineData in lines:
-			durationSeconds = lineData["duration"]
-			if not durationSeconds:
-				continue
-			duration = timedelta(seconds=lineData["duration"])
-			expireTime = lineData["created"] + duration
-			if expireTime < currentTime:
-				expiredLines.append(lineData)
-		for lineData in expiredLines:
-			lines.remove(lineData)
+		currentTime = self.ircd.clock.now()
+		while self._expiryHeap and self._expiryHeap[0][0] <= currentTime: # The current time has no microseconds, so a line is expired once its second is reached
+			expireTime, sequence, normalMask = heappop(self._expiryHeap)
+			if normalMask in self._lineIndex.lines and self._lineIndex.lines[normalMask][0] == sequence: # Skip lines that were already removed
+				self._removeLine(normalMask)
+		self._scheduleExpiry()
+	
+	def _scheduleExpiry(self):
+		if not self._expiryHeap:
+			if self._expiryTimer:
+				self._expiryTimer.cancel()
+			self._expiryTimer = None
+			return
+		delay = max((self._expiryHeap[0][0] - self.ircd.clock.now()).total_seconds(), 0) + 0.001 # Be sure we're past the expiry time when it fires
+		if self._expiryTimer and self._expiryTimer.active():
+			self._expiryTimer.reset(delay)
+		else:
+			self._expiryTimer = self.ircd.timers.callLater(delay, self._expireFromTimer)
+	
+	def _expireFromTimer(self):
+		self._expiryTimer = None
+		if self.ircd.loadedModules.get(self.name) is not self:
+			return # The module was unloaded or reloaded
+		self.expireLines()
 	
 	def generateInfo(self):
 		if not self.lineType:
 			return None
-		self.expireLines()
 		lineInfo = {}
-		for lineData in self.ircd.storage["xlines"][self.lineType]:
+		for lineData in self.ircd.storage[self._storageKey]:
 			lineInfo[lineData["mask"]] = "{} {} {} :{}".format(timestamp(lineData["created"]), lineData["duration"], lineData["setter"], lineData["reason"])
 		return lineInfo
 	
@@ -128,7 +393,6 @@ class XLineBase(object):
 	def burstLines(self, server):
 		if not self.lineType:
 			return
-		self.expireLines()
 		if self.propagateToServers:
-			for lineData in self.ircd.storage["xlines"][self.lineType]:
+			for lineData in self.ircd.storage[self._storageKey]:
 				server.sendMessage("ADDLINE", self.lineType, lineData["mask"], lineData["setter"], str(timestamp(lineData["created"])), str(lineData["duration"]), lineData["reason"], prefix=self.ircd.serverID)
\ No newline at end of file
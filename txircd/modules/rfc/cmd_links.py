@@ -18,11 +18,7 @@ class LinksCommand(ModuleData, Command):
 	def execute(self, user, data):
 		user.sendMessage(irc.RPL_LINKS, self.ircd.name, self.ircd.name, "0 {}".format(self.ircd.config["server_description"]))
 		for server in self.ircd.servers.itervalues():
-			hopCount = 1
-			nextServer = server.nextClosest
-			while nextServer != self.ircd.serverID:
-				nextServer = self.ircd.servers[nextServer].nextClosest
-				hopCount += 1
+			hopCount = self.ircd.serverHopCount(server.serverID)
 			if server.nextClosest == self.ircd.serverID:
 				nextClosestName = self.ircd.name
 			else:
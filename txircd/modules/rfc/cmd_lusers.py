@@ -29,6 +29,7 @@ class LUsersCommand(ModuleData, Command):
 		for key in ("users", "local"):
 			if counts[key] > maxes.get(key, 0):
 				maxes[key] = counts[key]
+				self.ircd.storage.markChanged("user_count_max")
 		return maxes
 	
 	def countStats(self):
@@ -37,11 +38,9 @@ class LUsersCommand(ModuleData, Command):
 		counts["servers"] = len(self.ircd.servers) + 1
 		counts["channels"] = len(self.ircd.channels)
 
+		counts["invisible"] = len(self.ircd.usersByMode.get("i", ()))
+		counts["opers"] = len(self.ircd.usersByMode.get("o", ()))
 		for user in self.ircd.users.itervalues():
-			if "i" in user.modes:
-				counts["invisible"] += 1
-			if "o" in user.modes:
-				counts["opers"] += 1
 			if user.uuid[:3] == self.ircd.serverID:
 				counts["local"] += 1
 
@@ -11,6 +11,7 @@ class QuitCommand(ModuleData, Command):
 	
 	def actions(self):
 		return [ ("quitmessage", 10, self.sendQuitMessage),
+		         ("netsplitquitmessage", 10, self.sendNetsplitQuitMessages),
 		         ("remotequitrequest", 10, self.sendRQuit),
 		         ("quit", 10, self.broadcastQuit),
 		         ("remotequit", 10, self.propagateQuit) ]
@@ -39,6 +40,20 @@ class QuitCommand(ModuleData, Command):
 			destUser.sendMessage("QUIT", reason, to=None, prefix=hostmask, tags=tags)
 		del sendUserList[:]
 	
+	def sendNetsplitQuitMessages(self, quitsByUser, reason, splitServerNames):
+		userMessageData = {}
+		for destUser, quitUsers in quitsByUser.iteritems():
+			destUser.createMessageBatch("netsplit", "netsplit", splitServerNames)
+			for user in quitUsers:
+				if user not in userMessageData:
+					conditionalTags = {}
+					self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
+					userMessageData[user] = (user.hostmask(), conditionalTags)
+				hostmask, conditionalTags = userMessageData[user]
+				tags = destUser.filterConditionalTags(conditionalTags)
+				destUser.sendMessageInBatch("netsplit", "QUIT", reason, to=None, prefix=hostmask, tags=tags)
+			destUser.sendBatch("netsplit")
+	
 	def sendRQuit(self, user, reason):
 		self.ircd.servers[user.uuid[:3]].sendMessage("RQUIT", user.uuid, reason, prefix=self.ircd.serverID)
 		return True
@@ -48,9 +63,7 @@ class QuitCommand(ModuleData, Command):
 			self.ircd.broadcastToServers(None, "QUIT", reason, prefix=user.uuid)
 	
 	def propagateQuit(self, user, reason):
-		fromServer = self.ircd.servers[user.uuid[:3]]
-		while fromServer.nextClosest != self.ircd.serverID:
-			fromServer = self.ircd.servers[fromServer.nextClosest]
+		fromServer = self.ircd.serverLink(user.uuid[:3])
 		self.ircd.broadcastToServers(fromServer, "QUIT", reason, prefix=user.uuid)
 
 class UserQuit(Command):
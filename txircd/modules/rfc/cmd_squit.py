@@ -26,9 +26,7 @@ class ServerQuit(ModuleData):
 			if server.serverID:
 				server.sendMessage("SQUIT", server.serverID, reason, prefix=server.nextClosest)
 			return
-		closestHop = server
-		while closestHop.nextClosest != self.ircd.serverID:
-			closestHop = self.ircd.servers[closestHop.nextClosest]
+		closestHop = self.ircd.serverLink(server.serverID)
 		if closestHop == server:
 			closestHop = None
 		self.ircd.broadcastToServers(closestHop, "SQUIT", server.serverID, reason, prefix=server.nextClosest)
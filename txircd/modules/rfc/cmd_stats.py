@@ -2,6 +2,7 @@ from twisted.plugin import IPlugin
 from twisted.words.protocols import irc
 from txircd.config import ConfigValidationError
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
+from txircd.utils import timestamp
 from zope.interface import implements
 
 irc.ERR_NOSUCHXINFO = "772"
@@ -14,6 +15,16 @@ class StatsCommand(ModuleData, Command):
 	
 	name = "StatsCommand"
 	core = True
+	connectionListLength = 30
+	
+	def actions(self):
+		return [ ("statsruntype-actiontimes", 10, self.listActionTimes),
+		         ("statsruntype-handlertimes", 10, self.listHandlerTimes),
+		         ("statsruntype-commandtimes", 10, self.listCommandTimes),
+		         ("statsruntype-links", 10, self.listLinks),
+		         ("statsruntype-connections", 10, self.listConnections),
+		         ("statsruntype-commands", 10, self.listCommands),
+		         ("statsruntype-uptime", 10, self.showUptime) ]
 	
 	def userCommands(self):
 		return [ ("STATS", 1, UserStats(self.ircd)) ]
@@ -30,6 +41,71 @@ class StatsCommand(ModuleData, Command):
 			for info in config["public_info"]:
 				if not isinstance(info, basestring):
 					raise ConfigValidationError("public_info", "every entry must be a string")
+	
+	def listActionTimes(self):
+		if self.ircd.timing is None:
+			return { "disabled": "Action timing is not enabled" }
+		return self.ircd.timing.report(self.ircd.timing.actions)
+	
+	def listHandlerTimes(self):
+		if self.ircd.timing is None:
+			return { "disabled": "Action timing is not enabled" }
+		return self.ircd.timing.report(self.ircd.timing.handlers)
+	
+	def listCommandTimes(self):
+		if self.ircd.timing is None:
+			return { "disabled": "Action timing is not enabled" }
+		return self.ircd.timing.report(self.ircd.timing.commands)
+	
+	def listLinks(self):
+		linkInfo = {}
+		for server in self.ircd.servers.itervalues():
+			if server.nextClosest == self.ircd.serverID:
+				linkInfo[server.name] = self.describeTraffic(server)
+		return linkInfo
+	
+	def listConnections(self):
+		"""
+		Lists the local users that have sent and received the most data.
+		"""
+		localUsers = [user for user in self.ircd.users.itervalues() if user.uuid[:3] == self.ircd.serverID and not user.localOnly]
+		localUsers.sort(key=lambda user: user.traffic.bytesIn + user.traffic.bytesOut, reverse=True)
+		connectionInfo = {}
+		for user in localUsers[:self.connectionListLength]:
+			commands = user.traffic.commands
+			if commands:
+				topCommand = max(commands.iterkeys(), key=commands.get)
+				connectionInfo[user.nick or user.uuid] = "{} top={}:{}".format(self.describeTraffic(user), topCommand, commands[topCommand])
+			else:
+				connectionInfo[user.nick or user.uuid] = self.describeTraffic(user)
+		return connectionInfo
+	
+	def listCommands(self):
+		commandInfo = {}
+		for connectionType, traffic in self.ircd.trafficTotals.iteritems():
+			for command, count in traffic.commands.iteritems():
+				commandInfo["{}/{}".format(connectionType, command)] = str(count)
+		return commandInfo
+	
+	def showUptime(self):
+		uptime = self.ircd.clock.epoch() - timestamp(self.ircd.startupTime)
+		uptimeInfo = {
+			"uptime": "{} days, {:02d}:{:02d}:{:02d}".format(uptime / 86400, uptime / 3600 % 24, uptime / 60 % 60, uptime % 60),
+			"connections": "accepted={} rejected={}".format(self.ircd.connectionsAccepted, self.ircd.connectionsRejected),
+			"sendq": str(self.ircd.queuedSendBytes)
+		}
+		for connectionType, traffic in self.ircd.trafficTotals.iteritems():
+			uptimeInfo["{}-traffic".format(connectionType)] = "sent={}/{} received={}/{}".format(traffic.linesOut, traffic.bytesOut, traffic.linesIn, traffic.bytesIn)
+		return uptimeInfo
+	
+	def describeTraffic(self, connection):
+		"""
+		Describes the traffic on a local connection in the style of STATS l:
+		bytes waiting to be sent, lines/bytes sent and received, and seconds
+		connected.
+		"""
+		traffic = connection.traffic
+		return "sendq={} buffer={} sent={}/{} received={}/{} open={}".format(connection.sendQueueSize(), connection.transportBufferSize(), traffic.linesOut, traffic.bytesOut, traffic.linesIn, traffic.bytesIn, self.ircd.clock.epoch() - timestamp(connection.connectedSince))
 
 class UserStats(Command):
 	implements(ICommand)
@@ -120,7 +196,7 @@ class ServerInfoRequest(Command):
 		typeName = data["type"]
 		if serverID == self.ircd.serverID:
 			user = data["user"]
-			destServer = user.uuid[:3]
+			destServer = self.ircd.servers[user.uuid[:3]]
 			results = self.ircd.runComboActionUntilValue((("statsruntype", typeName), ("statsruntype-{}".format(typeName),)), users=[user])
 			if results:
 				for key, val in results.iteritems():
@@ -169,12 +245,13 @@ class ServerInfo(Command):
 		user = data["user"]
 		if user.uuid[:3] == self.ircd.serverID:
 			sourceServerName = self.ircd.servers[data["source"]].name
-			for key, val in data["data"]:
+			for key, val in data["data"].iteritems():
 				user.sendMessage(irc.RPL_XINFOENTRY, typeName, key, val, prefix=sourceServerName)
 			return True
 		responseList = []
-		for key, val in data["data"]:
-			responseList.append("{} {}".format(key, val))
+		for key, val in data["data"].iteritems():
+			responseList.append(key)
+			responseList.append(val)
 		destServer = self.ircd.servers[user.uuid[:3]]
 		destServer.sendMessage("INFO", user.uuid, typeName, *responseList, prefix=data["source"])
 		return True
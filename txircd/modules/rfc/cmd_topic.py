@@ -51,9 +51,7 @@ class TopicCommand(ModuleData):
 				tags = sourceUser.filterConditionalTags(conditionalTags)
 				sourceUser.sendMessage("TOPIC", channel.topic, to=channel.name, prefix=channel.topicSetter, tags=tags)
 		elif setter != self.ircd.serverID:
-			sourceServer = self.ircd.servers[setter[:3]]
-			while sourceServer.nextClosest != self.ircd.serverID:
-				sourceServer = self.ircd.servers[sourceServer.nextClosest]
+			sourceServer = self.ircd.serverLink(setter[:3])
 		self.ircd.broadcastToServers(sourceServer, "TOPIC", channel.name, str(timestamp(channel.existedSince)), str(timestamp(channel.topicTime)), channel.topic, prefix=setter)
 	
 	def sendChannelTopic(self, channel, user):
@@ -32,8 +32,12 @@ class WhoCommand(ModuleData, Command):
 		matchingUsers = []
 		channel = None
 		mask = data["mask"]
+		if "opersonly" in data:
+			searchUsers = list(self.ircd.usersByMode.get("o", ())) # Only users with +o can match
+		else:
+			searchUsers = self.ircd.users.itervalues()
 		if mask in ("0", "*"):
-			for targetUser in self.ircd.users.itervalues():
+			for targetUser in searchUsers:
 				if not targetUser.isRegistered():
 					continue
 				if not set(user.channels).intersection(targetUser.channels) and self.ircd.runActionUntilValue("showuser", user, targetUser, users=[user, targetUser]) is not False:
@@ -44,7 +48,7 @@ class WhoCommand(ModuleData, Command):
 				if self.ircd.runActionUntilValue("showchanneluser", channel, user, targetUser, users=[user, targetUser], channels=[channel]) is not False:
 					matchingUsers.append(targetUser)
 		else:
-			for targetUser in self.ircd.users.itervalues():
+			for targetUser in searchUsers:
 				if not targetUser.isRegistered():
 					continue # We should exclude all unregistered users from this search
 				if self.ircd.runActionUntilValue("showuser", user, targetUser, users=[user, targetUser]) is False:
@@ -66,12 +70,8 @@ class WhoCommand(ModuleData, Command):
 			isAway = targetUser.metadataKeyExists("away")
 			status = self.ircd.runActionUntilValue("channelstatuses", channel, targetUser, user, users=[targetUser, user], channels=[channel]) if channel else ""
 			hopcount = 0
-			if user.uuid[:3] != self.ircd.serverID:
-				countingServer = server
-				hopcount = 1
-				while countingServer.nextClosest != self.ircd.serverID:
-					countingServer = self.ircd.servers[countingServer.nextClosest]
-					hopcount += 1
+			if targetUser.uuid[:3] != self.ircd.serverID:
+				hopcount = self.ircd.serverHopCount(targetUser.uuid[:3])
 			user.sendMessage(irc.RPL_WHOREPLY, mask, targetUser.ident, targetUser.host(), serverName, targetUser.nick, "{}{}{}".format("G" if isAway else "H", "*" if isOper else "", status), "{} {}".format(hopcount, targetUser.gecos))
 		user.sendMessage(irc.RPL_ENDOFWHO, mask, "End of /WHO list")
 		return True
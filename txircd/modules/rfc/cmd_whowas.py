@@ -2,15 +2,21 @@ from twisted.plugin import IPlugin
 from twisted.words.protocols import irc
 from txircd.config import ConfigValidationError
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
-from txircd.utils import durationToSeconds, ircLower, now, timestamp
+from txircd.utils import durationToSeconds, ircLower, wildcardPattern
 from zope.interface import implements
+from bisect import bisect_left, insort
+from collections import deque
 from datetime import datetime
+from zlib import crc32
+import re
 
 class WhowasCommand(ModuleData, Command):
 	implements(IPlugin, IModuleData, ICommand)
 	
 	name = "WhowasCommand"
 	core = True
+	maxWildcardNicks = 20
+	storageBucketCount = 64
 	
 	def actions(self):
 		return [ ("quit", 10, self.addUserToWhowas),
@@ -21,82 +27,206 @@ class WhowasCommand(ModuleData, Command):
 		return [ ("WHOWAS", 1, self) ]
 	
 	def load(self):
-		if "whowas" not in self.ircd.storage:
-			self.ircd.storage["whowas"] = {}
-
+		# Entries are (nick, ident, host, gecos, server name, timestamp) tuples. The newest entries for each nick
+		# are kept in entriesByNick, and allEntries holds (lowercase nick, entry) tuples for all entries in the
+		# order they were added, so the oldest entries can be expired or removed when there are too many.
+		# Entries pushed out of their nick's history stay in allEntries until they reach the front or allEntries
+		# is compacted, so entryCount keeps the number of entries still in entriesByNick.
+		# sortedNicks holds the nicks in entriesByNick in order, so wildcard lookups only check the nicks starting
+		# with the mask's prefix.
+		# Entries are stored in buckets by nick, so each save only writes the buckets with changed nicks.
+		self.entriesByNick = {}
+		self.sortedNicks = []
+		self.nicksByBucket = {}
+		self.changedBuckets = set()
+		self.allEntries = deque()
+		self.entryCount = 0
+		storedEntries = []
+		for bucket in xrange(self.storageBucketCount):
+			storageKey = "whowas-{}".format(bucket)
+			if storageKey in self.ircd.storage:
+				storedEntries.extend(self.ircd.storage[storageKey])
+		storedEntries.sort(key=lambda entry: entry[5])
+		for entry in storedEntries:
+			self.addEntry(tuple(entry))
+		if "whowas" in self.ircd.storage: # Stored by older versions
+			self.loadOldEntries(self.ircd.storage["whowas"])
+			del self.ircd.storage["whowas"]
+		self.expireEntries()
+		self.scheduleMaintenance()
+	
+	def unload(self):
+		self.maintenanceTimer.cancel()
+		self.saveEntries()
+	
 	def verifyConfig(self, config):
 		if "whowas_duration" in config and not isinstance(config["whowas_duration"], basestring) and not isinstance(config["whowas_duration"], int):
 			raise ConfigValidationError("whowas_duration", "value must be an integer or a duration string")
 		if "whowas_max_entries" in config and (not isinstance(config["whowas_max_entries"], int) or config["whowas_max_entries"] < 0):
 			raise  ConfigValidationError("whowas_max_entries", "invalid number")
+		if "whowas_max_total_entries" in config and (not isinstance(config["whowas_max_total_entries"], int) or config["whowas_max_total_entries"] < 0):
+			raise ConfigValidationError("whowas_max_total_entries", "invalid number")
+	
+	def loadOldEntries(self, storedEntries):
+		if isinstance(storedEntries, dict): # Lists of entry dicts by nick
+			entryList = []
+			for nickEntries in storedEntries.itervalues():
+				for entry in nickEntries:
+					entryList.append((entry["nick"], entry["ident"], entry["host"], entry["gecos"], entry["server"], entry["when"]))
+			entryList.sort(key=lambda entry: entry[5])
+			storedEntries = entryList
+		for entry in storedEntries:
+			self.addEntry(tuple(entry))
+	
+	def storageBucket(self, lowerNick):
+		return crc32(lowerNick) % self.storageBucketCount
 	
-	def removeOldEntries(self, whowasEntries):
-		expireDuration = durationToSeconds(self.ircd.config.get("whowas_duration", "1d"))
+	def saveEntries(self):
+		"""
+		Saves the entries of the nicks in buckets that changed since the last
+		save.
+		"""
+		for bucket in self.changedBuckets:
+			storageKey = "whowas-{}".format(bucket)
+			bucketEntries = []
+			for lowerNick in self.nicksByBucket.get(bucket, ()):
+				bucketEntries.extend(self.entriesByNick[lowerNick])
+			if bucketEntries:
+				self.ircd.storage[storageKey] = bucketEntries
+			elif storageKey in self.ircd.storage:
+				del self.ircd.storage[storageKey]
+		self.changedBuckets = set()
+	
+	def addNick(self, lowerNick, maxCount):
+		self.entriesByNick[lowerNick] = deque(maxlen=maxCount)
+		insort(self.sortedNicks, lowerNick)
+		bucket = self.storageBucket(lowerNick)
+		if bucket not in self.nicksByBucket:
+			self.nicksByBucket[bucket] = set()
+		self.nicksByBucket[bucket].add(lowerNick)
+	
+	def removeNick(self, lowerNick):
+		del self.entriesByNick[lowerNick]
+		del self.sortedNicks[bisect_left(self.sortedNicks, lowerNick)]
+		bucket = self.storageBucket(lowerNick)
+		self.nicksByBucket[bucket].discard(lowerNick)
+		if not self.nicksByBucket[bucket]:
+			del self.nicksByBucket[bucket]
+	
+	def addEntry(self, entry):
 		maxCount = self.ircd.config.get("whowas_max_entries", 10)
-		while whowasEntries and len(whowasEntries) > maxCount:
-			whowasEntries.pop(0)
-		expireTime = timestamp(now()) - expireDuration
-		while whowasEntries and whowasEntries[0]["when"] < expireTime:
-			whowasEntries.pop(0)
-		return whowasEntries
+		if not maxCount:
+			return
+		lowerNick = ircLower(entry[0])
+		if lowerNick not in self.entriesByNick:
+			self.addNick(lowerNick, maxCount)
+		elif self.entriesByNick[lowerNick].maxlen != maxCount: # The configuration changed
+			oldCount = len(self.entriesByNick[lowerNick])
+			self.entriesByNick[lowerNick] = deque(self.entriesByNick[lowerNick], maxCount)
+			self.entryCount -= oldCount - len(self.entriesByNick[lowerNick])
+		nickEntries = self.entriesByNick[lowerNick]
+		if len(nickEntries) < maxCount: # Otherwise, the oldest entry for the nick is pushed out to make room
+			self.entryCount += 1
+		nickEntries.append(entry)
+		self.allEntries.append((lowerNick, entry))
+		self.changedBuckets.add(self.storageBucket(lowerNick))
+		maxTotal = self.ircd.config.get("whowas_max_total_entries", 10000)
+		while self.entryCount > maxTotal:
+			self.removeOldestEntry()
+		if len(self.allEntries) > 2 * self.entryCount + 1000:
+			self.compactEntries()
+	
+	def removeOldestEntry(self):
+		lowerNick, entry = self.allEntries.popleft()
+		if lowerNick in self.entriesByNick:
+			nickEntries = self.entriesByNick[lowerNick]
+			if nickEntries and nickEntries[0] is entry: # Otherwise, it was already pushed out of the nick's history
+				nickEntries.popleft()
+				self.entryCount -= 1
+				self.changedBuckets.add(self.storageBucket(lowerNick))
+				if not nickEntries:
+					self.removeNick(lowerNick)
+	
+	def compactEntries(self):
+		"""
+		Drops entries that were pushed out of their nick's history from
+		allEntries. This is only done once they outnumber the current entries,
+		so the cost is spread over the entries added since the last time.
+		"""
+		currentEntries = set()
+		for nickEntries in self.entriesByNick.itervalues():
+			currentEntries.update([id(entry) for entry in nickEntries])
+		self.allEntries = deque([entryData for entryData in self.allEntries if id(entryData[1]) in currentEntries])
+	
+	def expireEntries(self):
+		expireTime = self.ircd.clock.epoch() - durationToSeconds(self.ircd.config.get("whowas_duration", "1d"))
+		while self.allEntries and self.allEntries[0][1][5] < expireTime:
+			self.removeOldestEntry()
+	
+	def scheduleMaintenance(self):
+		self.maintenanceTimer = self.ircd.timers.callLater(self.ircd.config.get("storage_sync_interval", 5), self.maintainEntries)
+	
+	def maintainEntries(self):
+		self.scheduleMaintenance()
+		self.expireEntries()
+		if self.changedBuckets:
+			self.saveEntries()
+	
+	def findNicks(self, lowerMask):
+		"""
+		Returns the first nicks in the history, in order, matching the given
+		lowercase wildcard mask. Only the nicks starting with the part of the
+		mask before the first wildcard are checked.
+		"""
+		prefix = lowerMask[:min([index for index in (lowerMask.find("*"), lowerMask.find("?")) if index >= 0])]
+		maskMatch = re.compile(wildcardPattern(lowerMask) + r"\Z", re.DOTALL).match
+		nicks = []
+		for index in xrange(bisect_left(self.sortedNicks, prefix), len(self.sortedNicks)):
+			nick = self.sortedNicks[index]
+			if not nick.startswith(prefix):
+				break
+			if maskMatch(nick):
+				nicks.append(nick)
+				if len(nicks) == self.maxWildcardNicks:
+					break
+		return nicks
 	
 	def addUserToWhowas(self, user, reason):
 		if not user.isRegistered():
 			# user never registered a nick, so no whowas entry to add
 			return
-		lowerNick = ircLower(user.nick)
-		allWhowas = self.ircd.storage["whowas"]
-		if lowerNick in allWhowas:
-			whowasEntries = allWhowas[lowerNick]
-		else:
-			whowasEntries = []
 		serverName = self.ircd.name
 		if user.uuid[:3] != self.ircd.serverID:
 			serverName = self.ircd.servers[user.uuid[:3]].name
-		whowasEntries.append({
-			"nick": user.nick,
-			"ident": user.ident,
-			"host": user.host(),
-			"gecos": user.gecos,
-			"server": serverName,
-			"when": timestamp(now())
-		})
-		whowasEntries = self.removeOldEntries(whowasEntries)
-		if whowasEntries:
-			allWhowas[lowerNick] = whowasEntries
-		elif lowerNick in allWhowas:
-			del allWhowas[lowerNick]
+		self.addEntry((user.nick, user.ident, user.host(), user.gecos, serverName, self.ircd.clock.epoch()))
 	
 	def parseParams(self, user, params, prefix, tags):
 		if not params:
 			user.sendSingleError("WhowasCmd", irc.ERR_NEEDMOREPARAMS, "WHOWAS", "Not enough parameters")
 			return None
 		lowerParam = ircLower(params[0])
-		if lowerParam not in self.ircd.storage["whowas"]:
+		if "*" in lowerParam or "?" in lowerParam:
+			nicks = self.findNicks(lowerParam)
+		elif lowerParam in self.entriesByNick:
+			nicks = [lowerParam]
+		else:
+			nicks = []
+		if not nicks:
 			user.sendSingleError("WhowasNick", irc.ERR_WASNOSUCHNICK, params[0], "There was no such nickname")
 			return None
 		return {
-			"nick": lowerParam,
+			"nicks": nicks,
 			"param": params[0]
 		}
 	
 	def execute(self, user, data):
-		nick = data["nick"]
-		allWhowas = self.ircd.storage["whowas"]
-		whowasEntries = allWhowas[nick]
-		whowasEntries = self.removeOldEntries(whowasEntries)
-		if not whowasEntries:
-			del allWhowas[nick]
-			self.ircd.storage["whowas"] = allWhowas
-			user.sendMessage(irc.ERR_WASNOSUCHNICK, data["param"], "There was no such nickname")
-			return True
-		allWhowas[nick] = whowasEntries # Save back to the list excluding the removed entries
-		self.ircd.storage["whowas"] = allWhowas
-		for entry in whowasEntries:
-			entryNick = entry["nick"]
-			user.sendMessage(irc.RPL_WHOWASUSER, entryNick, entry["ident"], entry["host"], "*", entry["gecos"])
-			user.sendMessage(irc.RPL_WHOISSERVER, entryNick, entry["server"], str(datetime.utcfromtimestamp(entry["when"])))
-		user.sendMessage(irc.RPL_ENDOFWHOWAS, nick, "End of WHOWAS")
+		for nick in data["nicks"]:
+			if nick not in self.entriesByNick:
+				continue
+			for entryNick, entryIdent, entryHost, entryGecos, entryServer, entryTime in self.entriesByNick[nick]:
+				user.sendMessage(irc.RPL_WHOWASUSER, entryNick, entryIdent, entryHost, "*", entryGecos)
+				user.sendMessage(irc.RPL_WHOISSERVER, entryNick, entryServer, str(datetime.utcfromtimestamp(entryTime)))
+		user.sendMessage(irc.RPL_ENDOFWHOWAS, data["param"], "End of WHOWAS")
 		return True
 
 whowasCmd = WhowasCommand()
\ No newline at end of file
@@ -1,9 +1,151 @@
 from twisted.plugin import IPlugin
 from twisted.words.protocols import irc
 from txircd.module_interface import IMode, IModuleData, Mode, ModuleData
-from txircd.utils import ircLower, ModeType, timestamp
+from txircd.utils import ircLower, ModeType, timestamp, wildcardPattern
 from zope.interface import implements
-from fnmatch import fnmatchcase
+import re
+
+def parseBan(param):
+	"""
+	Splits a ban parameter into its action extban, action parameter, matching
+	extban, whether the matching extban is negated, and the mask.
+	"""
+	actionExtban = ""
+	actionParam = ""
+	matchingExtban = ""
+	matchNegated = False
+	banmask = param
+	if ";" in banmask:
+		actionExtban, banmask = banmask.split(";", 1)
+		if ":" in actionExtban:
+			actionExtban, actionParam = actionExtban.split(":", 1)
+	if ":" in banmask and ("@" not in banmask or banmask.find(":") < banmask.find("@")):
+		matchingExtban, banmask = banmask.split(":", 1)
+		if matchingExtban and matchingExtban[0] == "~":
+			matchNegated = True
+			matchingExtban = matchingExtban[1:]
+	return actionExtban, actionParam, matchingExtban, matchNegated, banmask
+
+class BanMatcher(object):
+	"""
+	Matches users against a group of bans. Each ban is parsed and compiled
+	once when it's added: bans on an exact hostmask, nick, or host go in
+	dicts, other hostmask bans are compiled to regular expressions, and only
+	bans using matching extbans are checked one at a time.
+	Bans must be added in list order so that the first matching ban in the
+	list is the one whose action parameter is returned.
+	"""
+	def __init__(self, ircd):
+		self.ircd = ircd
+		self.exactMasks = {}
+		self.exactNicks = {}
+		self.exactHosts = {}
+		self.wildcardMasks = []
+		self.extbans = []
+		self._wildcardMatch = None
+	
+	def addBan(self, index, actionParam, matchingExtban, matchNegated, banmask):
+		if matchingExtban:
+			self.extbans.append((index, actionParam, "usermatchban-{}".format(matchingExtban), matchNegated, banmask))
+			return
+		banmask = ircLower(banmask)
+		if "*" not in banmask and "?" not in banmask:
+			if banmask not in self.exactMasks:
+				self.exactMasks[banmask] = (index, actionParam)
+			return
+		if banmask.startswith("*!*@"):
+			host = banmask[4:]
+			if "*" not in host and "?" not in host and "@" not in host:
+				if host not in self.exactHosts:
+					self.exactHosts[host] = (index, actionParam)
+				return
+		if banmask.endswith("!*@*"):
+			nick = banmask[:-4]
+			if "*" not in nick and "?" not in nick and "!" not in nick and "@" not in nick:
+				if nick not in self.exactNicks:
+					self.exactNicks[nick] = (index, actionParam)
+				return
+		pattern = wildcardPattern(banmask)
+		self.wildcardMasks.append((index, actionParam, pattern, re.compile(pattern + r"\Z", re.DOTALL).match))
+		self._wildcardMatch = None
+	
+	def match(self, user):
+		"""
+		Returns the action parameter of the first ban in this group matching
+		the user, or None if no ban matches.
+		"""
+		bestMatch = None
+		if self.exactMasks or self.exactNicks or self.exactHosts or self.wildcardMasks:
+			userMasks = (ircLower(user.hostmask()), ircLower(user.hostmaskWithRealHost()), ircLower(user.hostmaskWithIP()))
+			for userMask in userMasks:
+				if userMask in self.exactMasks:
+					bestMatch = self._earlier(bestMatch, self.exactMasks[userMask])
+				if self.exactHosts:
+					userHost = userMask[userMask.rfind("@") + 1:]
+					if userHost in self.exactHosts:
+						bestMatch = self._earlier(bestMatch, self.exactHosts[userHost])
+			if self.exactNicks:
+				userNick = userMasks[0][:userMasks[0].find("!")]
+				if userNick in self.exactNicks:
+					bestMatch = self._earlier(bestMatch, self.exactNicks[userNick])
+			if self.wildcardMasks:
+				if self._wildcardMatch is None:
+					self._wildcardMatch = re.compile("(?:{})\\Z".format("|".join([maskData[2] for maskData in self.wildcardMasks])), re.DOTALL).match
+				if self._wildcardMatch(userMasks[0]) or self._wildcardMatch(userMasks[1]) or self._wildcardMatch(userMasks[2]):
+					for index, actionParam, pattern, banMatch in self.wildcardMasks:
+						if bestMatch is not None and bestMatch[0] < index:
+							break
+						if banMatch(userMasks[0]) or banMatch(userMasks[1]) or banMatch(userMasks[2]):
+							bestMatch = (index, actionParam)
+							break
+		for index, actionParam, matchAction, matchNegated, banmask in self.extbans:
+			if bestMatch is not None and bestMatch[0] < index:
+				break
+			if self.ircd.runActionUntilTrue(matchAction, user, matchNegated, banmask):
+				bestMatch = (index, actionParam)
+				break
+		if bestMatch is None:
+			return None
+		return bestMatch[1]
+	
+	def _earlier(self, bestMatch, newMatch):
+		if bestMatch is None or newMatch[0] < bestMatch[0]:
+			return newMatch
+		return bestMatch
+
+class CompiledBanList(object):
+	"""
+	A channel's ban list, parsed and grouped by action extban. Plain bans are
+	in the group for the empty action extban.
+	"""
+	def __init__(self, ircd, banList):
+		self.groups = {}
+		for index, paramData in enumerate(banList):
+			actionExtban, actionParam, matchingExtban, matchNegated, banmask = parseBan(paramData[0])
+			if actionExtban not in self.groups:
+				self.groups[actionExtban] = BanMatcher(ircd)
+			self.groups[actionExtban].addBan(index, actionParam, matchingExtban, matchNegated, banmask)
+	
+	def match(self, user, actionExtban):
+		"""
+		Returns the action parameter of the first ban with the given action
+		extban matching the user, or None if none match.
+		"""
+		if actionExtban not in self.groups:
+			return None
+		return self.groups[actionExtban].match(user)
+	
+	def matchAll(self, user):
+		"""
+		Returns a dict mapping each action extban for which a ban matches the
+		user to the matching ban's action parameter.
+		"""
+		matches = {}
+		for actionExtban, group in self.groups.iteritems():
+			actionParam = group.match(user)
+			if actionParam is not None:
+				matches[actionExtban] = actionParam
+		return matches
 
 class BanMode(ModuleData, Mode):
 	implements(IPlugin, IModuleData, IMode)
@@ -25,28 +167,19 @@ class BanMode(ModuleData, Mode):
 		         ("updateuserbancache", 1, self.updateUserCaches)
 		]
 	
-	def banMatchesUser(self, user, banmask):
-		matchingExtban = ""
-		matchNegated = False
-		if ":" in banmask and ("@" not in banmask or banmask.find(":") < banmask.find("@")):
-			matchingExtban, banmask = banmask.split(":", 1)
-			if matchingExtban and matchingExtban[0] == "~":
-				matchNegated = True
-				matchingExtban = matchingExtban[1:]
-		if matchingExtban:
-			return self.ircd.runActionUntilTrue("usermatchban-{}".format(matchingExtban), user, matchNegated, banmask)
-		return self.matchHostmask(user, banmask)
+	def unload(self):
+		for channel in self.ircd.channels.itervalues():
+			if "compiledbans" in channel.cache:
+				del channel.cache["compiledbans"]
 	
-	def matchHostmask(self, user, banmask):
-		banmask = ircLower(banmask)
-		userMask = ircLower(user.hostmask())
-		if fnmatchcase(userMask, banmask):
-			return True
-		userMask = ircLower(user.hostmaskWithRealHost())
-		if fnmatchcase(userMask, banmask):
-			return True
-		userMask = ircLower(user.hostmaskWithIP())
-		return fnmatchcase(userMask, banmask)
+	def compiledBans(self, channel):
+		"""
+		Returns the compiled ban list for the channel, compiling it if the ban
+		list has changed since it was last used.
+		"""
+		if "compiledbans" not in channel.cache:
+			channel.cache["compiledbans"] = CompiledBanList(self.ircd, channel.modes["b"] if "b" in channel.modes else [])
+		return channel.cache["compiledbans"]
 	
 	def checkAction(self, actionName, mode, channel, user, *params, **kw):
 		if "b" not in channel.modes:
@@ -59,42 +192,14 @@ class BanMode(ModuleData, Mode):
 			if mode in channel.users[user]["bans"]:
 				return channel.users[user]["bans"][mode]
 			return None
-		for paramData in channel.modes["b"]:
-			param = paramData[0]
-			actionExtban = ""
-			actionParam = ""
-			if ";" in param:
-				actionExtban, param = param.split(";", 1)
-				if ":" in actionExtban:
-					actionExtban, actionParam = actionExtban.split(":", 1)
-			if actionExtban != mode:
-				continue
-			match = self.banMatchesUser(user, param)
-			if match:
-				return actionParam
-		return None
+		return self.compiledBans(channel).match(user, mode)
 	
 	def onChange(self, channel, source, adding, param):
-		if ";" in param:
-			actionExtban, banmask = param.split(";", 1)
-			if ":" in actionExtban:
-				actionExtban, actionParam = actionExtban.split(":", 1)
-			else:
-				actionParam = ""
-		else:
-			actionExtban= ""
-			actionParam = ""
-			banmask = param
-		if ":" in banmask and ("@" not in banmask or banmask.index(":") < banmask.index("@")):
-			matchingExtban, banmask = banmask.split(":", 1)
-			if matchingExtban and matchingExtban[0] == "~":
-				matchNegated = True
-				matchingExtban = matchingExtban[1:]
-			else:
-				matchNegated = False
-		else:
-			matchingExtban = ""
-			matchNegated = None
+		if "compiledbans" in channel.cache:
+			del channel.cache["compiledbans"]
+		actionExtban, actionParam, matchingExtban, matchNegated, banmask = parseBan(param)
+		matcher = BanMatcher(self.ircd)
+		matcher.addBan(0, actionParam, matchingExtban, matchNegated, banmask)
 		for user, cache in channel.users.iteritems():
 			if "bans" not in cache:
 				cache["bans"] = {}
@@ -102,11 +207,7 @@ class BanMode(ModuleData, Mode):
 				continue # If it didn't affect them before, it won't now, so let's skip the mongo processing we're about to do to them
 			if (actionExtban in cache["bans"]) and adding and actionParam == cache["bans"][actionExtban]:
 				continue
-			if matchingExtban:
-				matchesUser = self.ircd.runActionUntilTrue("usermatchban-{}".format(matchingExtban), user, matchNegated, banmask)
-			else:
-				matchesUser = self.matchHostmask(user, banmask)
-			if not matchesUser:
+			if matcher.match(user) is None:
 				continue
 			if adding:
 				cache["bans"][actionExtban] = actionParam
@@ -117,31 +218,7 @@ class BanMode(ModuleData, Mode):
 		if user in channel.users and "bans" in channel.users[user]:
 			return channel.users[user]["bans"]
 		if "b" in channel.modes:
-			matchesActions = {}
-			for paramData in channel.modes["b"]:
-				param = paramData[0]
-				actionExtban = ""
-				actionParam = ""
-				matchingExtban = ""
-				matchNegated = False
-				if ";" in param:
-					actionExtban, param = param.split(";", 1)
-					if ":" in actionExtban:
-						actionExtban, actionParam = actionExtban.split(":", 1)
-				if actionExtban in matchesActions:
-					continue
-				if ":" in param and ("@" not in param or param.find(":") < param.find("@")):
-					matchingExtban, param = param.split(":", 1)
-					if matchingExtban[0] == "~":
-						matchNegated = True
-						matchingExtban = matchingExtban[1:]
-				if matchingExtban:
-					if self.ircd.runActionUntilTrue("usermatchban-{}".format(matchingExtban), user, matchNegated, param):
-						matchesActions[actionExtban] = actionParam
-				else:
-					if self.matchHostmask(user, param):
-						matchesActions[""] = ""
-			return matchesActions
+			return self.compiledBans(channel).matchAll(user)
 		return {}
 
 	def checkAutostatusPermission(self, channel, user, adding, param):
@@ -161,17 +238,8 @@ class BanMode(ModuleData, Mode):
 			return
 		if "bans" not in channel.users[user]:
 			channel.users[user]["bans"] = {}
-		for paramData in channel.modes["b"]:
-			param = paramData[0]
-			actionExtban = ""
-			actionParam = ""
-			if ";" in param:
-				actionExtban, param = param.split(";", 1)
-				if ":" in actionExtban:
-					actionExtban, actionParam = actionExtban.split(":", 1)
-			if actionExtban in channel.users[user]["bans"]:
-				continue
-			if self.banMatchesUser(user, param):
+		for actionExtban, actionParam in self.compiledBans(channel).matchAll(user).iteritems():
+			if actionExtban not in channel.users[user]["bans"]:
 				channel.users[user]["bans"][actionExtban] = actionParam
 	
 	def autoStatus(self, channel, user):
@@ -257,13 +325,9 @@ class BanMode(ModuleData, Mode):
 		# so we'll go straight to analyzing the ban list
 		if "b" not in channel.modes:
 			return None
-		for paramData in channel.modes["b"]:
-			param = paramData[0]
-			if ";" in param:
-				continue # Ignore entries with action extbans
-			if self.banMatchesUser(user, param):
-				user.sendMessage(irc.ERR_BANNEDFROMCHAN, channel.name, "Cannot join channel (You're banned)")
-				return False
+		if self.compiledBans(channel).match(user, "") is not None: # Entries with action extbans are in other groups, so they're ignored
+			user.sendMessage(irc.ERR_BANNEDFROMCHAN, channel.name, "Cannot join channel (You're banned)")
+			return False
 		return None
 	
 	def showListParams(self, user, channel):
@@ -123,8 +123,8 @@ class Oper(ModuleData, Mode):
 		return None
 	
 	def propagatePermissions(self, server):
-		for user in self.ircd.users.itervalues():
-			if "o" in user.modes and "oper-permissions" in user.cache:
+		for user in list(self.ircd.usersByMode.get("o", ())):
+			if "oper-permissions" in user.cache:
 				permString = " ".join(user.cache["oper-permissions"])
 				server.sendMessage("OPER", user.uuid, permString, prefix=self.ircd.serverID)
 
@@ -47,8 +47,8 @@ class UserWallops(Command):
 		userPrefix = user.hostmask()
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", user, conditionalTags)
-		for u in self.ircd.users.itervalues():
-			if u.uuid[:3] == self.ircd.serverID and "w" in u.modes:
+		for u in list(self.ircd.usersByMode.get("w", ())):
+			if u.uuid[:3] == self.ircd.serverID:
 				tags = u.filterConditionalTags(conditionalTags)
 				u.sendMessage("WALLOPS", message, prefix=userPrefix, to=None, tags=tags)
 		self.ircd.broadcastToServers(None, "WALLOPS", message, prefix=user.uuid)
@@ -82,8 +82,8 @@ class ServerWallops(Command):
 		userPrefix = fromUser.hostmask()
 		conditionalTags = {}
 		self.ircd.runActionStandard("sendingusertags", fromUser, conditionalTags)
-		for user in self.ircd.users.itervalues():
-			if user.uuid[:3] == self.ircd.serverID and "w" in user.modes:
+		for user in list(self.ircd.usersByMode.get("w", ())):
+			if user.uuid[:3] == self.ircd.serverID:
 				tags = user.filterConditionalTags(conditionalTags)
 				user.sendMessage("WALLOPS", message, prefix=userPrefix, to=None, tags=tags)
 		self.ircd.broadcastToServers(server, "WALLOPS", message, prefix=fromUser.uuid)
@@ -1,7 +1,6 @@
 from twisted.plugin import IPlugin
 from twisted.words.protocols import irc
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
-from txircd.utils import now
 from zope.interface import implements
 
 class PingPong(ModuleData):
@@ -16,41 +15,30 @@ class PingPong(ModuleData):
 	
 	def userCommands(self):
 		return [ ("PING", 1, UserPing(self.ircd)),
-		         ("PONG", 1, UserPong()) ]
+		         ("PONG", 1, UserPong(self.ircd)) ]
 	
 	def serverCommands(self):
 		return [ ("PING", 1, ServerPing(self.ircd)),
 		         ("PONG", 1, ServerPong(self.ircd)) ]
 	
 	def pingUser(self, user):
-		if "pingtime" not in user.cache or "pongtime" not in user.cache:
-			user.cache["pingtime"] = now()
-			user.cache["pongtime"] = now()
-		pingTime = user.cache["pingtime"]
-		pongTime = user.cache["pongtime"]
-		if pongTime < pingTime:
-			self.ircd.log.debug("User {user.uuid} pinged out (last pong time '{pongTime}' was less than last ping time '{pingTime}' at the next ping interval)", user=user, pongTime=pongTime, pingTime=pingTime)
+		if user.lastPongTime < user.lastPingTime:
+			self.ircd.log.debug("User {user.uuid} pinged out (last pong time '{pongTime}' was less than last ping time '{pingTime}' at the next ping interval)", user=user, pongTime=user.lastPongTime, pingTime=user.lastPingTime)
 			user.disconnect("Ping timeout")
 			return
-		if user.idleSince > user.cache["pongtime"]:
-			user.cache["pingtime"] = now()
-			user.cache["pongtime"] = now()
+		if user.idleSince > user.pingIdleSince: # The user did something since the last check, so we know the connection is fine
+			user.pingIdleSince = user.idleSince
 			return
 		user.sendMessage("PING", self.ircd.name, to=None, prefix=None)
-		user.cache["pingtime"] = now()
+		user.lastPingTime = self.ircd.clock.monotonic()
 	
 	def pingServer(self, server):
-		if "pingtime" not in server.cache or "pongtime" not in server.cache:
-			server.cache["pingtime"] = now()
-			server.cache["pongtime"] = now()
-		pingTime = server.cache["pingtime"]
-		pongTime = server.cache["pongtime"]
-		if pongTime < pingTime:
-			self.ircd.log.debug("Server {server.serverID} pinged out (last pong time '{pongTime}' was less than last ping time '{pingTime}' at the next ping interval)", server=server, pongTime=pongTime, pingTime=pingTime)
+		if server.lastPongTime < server.lastPingTime:
+			self.ircd.log.debug("Server {server.serverID} pinged out (last pong time '{pongTime}' was less than last ping time '{pingTime}' at the next ping interval)", server=server, pongTime=server.lastPongTime, pingTime=server.lastPingTime)
 			server.disconnect("Ping timeout")
 			return
 		server.sendMessage("PING", self.ircd.serverID, server.serverID, prefix=self.ircd.serverID)
-		server.cache["pingtime"] = now()
+		server.lastPingTime = self.ircd.clock.monotonic()
 
 class UserPing(Command):
 	implements(ICommand)
@@ -79,6 +67,9 @@ class UserPong(Command):
 	resetsIdleTime = False
 	forRegistered = None
 	
+	def __init__(self, ircd):
+		self.ircd = ircd
+	
 	def parseParams(self, user, params, prefix, tags):
 		if not params:
 			user.sendSingleError("PongCmd", irc.ERR_NEEDMOREPARAMS, "PONG", "Not enough parameters")
@@ -88,7 +79,7 @@ class UserPong(Command):
 		}
 	
 	def execute(self, user, data):
-		user.cache["pongtime"] = now()
+		user.lastPongTime = self.ircd.clock.monotonic()
 		return True
 
 class ServerPing(Command):
@@ -163,9 +154,9 @@ class ServerPong(Command):
 			return True
 		if data["dest"] == self.ircd.serverID:
 			if data["source"] == server.serverID:
-				server.cache["pongtime"] = now()
+				server.lastPongTime = self.ircd.clock.monotonic()
 			else:
-				self.ircd.servers[data["source"]].cache["pongtime"] = now()
+				self.ircd.servers[data["source"]].lastPongTime = self.ircd.clock.monotonic()
 			return True
 		self.ircd.servers[data["dest"]].sendMessage("PONG", data["source"], data["dest"], prefix=data["prefix"])
 		return True
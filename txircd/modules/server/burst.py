@@ -1,7 +1,10 @@
+from twisted.internet import reactor
 from twisted.plugin import IPlugin
+from txircd.config import ConfigValidationError
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
-from txircd.utils import ModeType, timestamp
+from txircd.utils import joinBulkEntry, ModeType, timestamp
 from zope.interface import implements
+from time import time
 
 class ServerBurst(ModuleData, Command):
 	implements(IPlugin, IModuleData, ICommand)
@@ -9,43 +12,42 @@ class ServerBurst(ModuleData, Command):
 	name = "ServerBurst"
 	core = True
 	forRegistered = False
+	bulkLineLength = 4096
 	
 	def actions(self):
-		return [ ("burst", 100, self.startBurst),
+		return [ ("startburst", 100, self.startBurst),
 		         ("burst", 1, self.completeBurst) ]
 	
 	def serverCommands(self):
 		return [ ("BURST", 1, self) ]
 	
+	def verifyConfig(self, config):
+		if "server_burst_chunk_size" in config and (not isinstance(config["server_burst_chunk_size"], int) or config["server_burst_chunk_size"] < 1):
+			raise ConfigValidationError("server_burst_chunk_size", "invalid number")
+	
 	def startBurst(self, server):
 		server.bursted = False
+		server.holdMessages()
 		serversByHopcount = []
 		serversBurstingTo = []
 		for remoteServer in self.ircd.servers.itervalues():
 			if remoteServer == server:
 				continue
-			hopCount = 1
-			servTrace = remoteServer
-			if server == servTrace:
-				serversBurstingTo.append(remoteServer.serverID)
-				continue # Don't count this server
-			burstingRemote = False
-			while servTrace.nextClosest != self.ircd.serverID:
-				servTrace = self.ircd.servers[servTrace.nextClosest]
-				if server == servTrace:
-					burstingRemote = True
-					break
-				hopCount += 1
-			if burstingRemote:
+			if self.ircd.serverLink(remoteServer.serverID) == server: # The server we're bursting to told us about this server
 				serversBurstingTo.append(remoteServer.serverID)
 				continue
+			hopCount = self.ircd.serverHopCount(remoteServer.serverID)
 			while len(serversByHopcount) < hopCount:
 				serversByHopcount.append([])
 			serversByHopcount[hopCount - 1].append(remoteServer)
 		for hopCount in range(1, len(serversByHopcount) + 1):
 			strHopCount = str(hopCount)
 			for remoteServer in serversByHopcount[hopCount - 1]:
-				server.sendMessage("SERVER", remoteServer.name, remoteServer.serverID, strHopCount, remoteServer.nextClosest, remoteServer.description, prefix=self.ircd.serverID)
+				server.sendBurstMessage("SERVER", remoteServer.name, remoteServer.serverID, strHopCount, remoteServer.nextClosest, remoteServer.description, prefix=self.ircd.serverID)
+		
+		# The users and channel memberships are taken as they are now. Anything that changes while the burst is
+		# being sent is held and sent to the server after the burst data, so it must apply on top of this state.
+		burstUsers = []
 		for user in self.ircd.users.itervalues():
 			if user.localOnly:
 				continue
@@ -53,65 +55,145 @@ class ServerBurst(ModuleData, Command):
 				continue
 			if user.uuid[:3] in serversBurstingTo: # The remote server apparently already finished its burst (or at least enough that we know this), so we need to not send it those again.
 				continue
+			burstUsers.append((user, user.nick))
+		burstChannels = []
+		for channel in self.ircd.channels.itervalues():
+			users = []
+			for user, data in channel.users.iteritems():
+				if user.localOnly:
+					continue
+				if user.uuid[:3] in serversBurstingTo: # The remote server already knows about these users
+					continue
+				users.append("{},{}".format(data["status"], user.uuid))
+			if users: # Let's not sync channels with no users since they won't sync properly
+				burstChannels.append((channel, users))
+		self.ircd.log.info("Sending burst to {server.name} ({userCount} users, {channelCount} channels)", server=server, userCount=len(burstUsers), channelCount=len(burstChannels))
+		if "BULKBURST" in server.cache.get("features", ()):
+			burstLines = self._bulkBurstLines(burstUsers, burstChannels)
+		else:
+			burstLines = self._burstLines(burstUsers, burstChannels)
+		sender = BurstSender(self.ircd, server, burstLines)
+		sender.run()
+	
+	def _splitModes(self, modes, modeTypes):
+		"""
+		Splits a set of modes into the parameters for a mode string and the
+		list modes, which are sent separately.
+		"""
+		modeLetters = []
+		params = []
+		listModes = {}
+		for mode, param in modes.iteritems():
+			if modeTypes[mode] == ModeType.List:
+				listModes[mode] = param
+			else:
+				modeLetters.append(mode)
+				if param is not None:
+					params.append(param)
+		return ["+{}".format("".join(modeLetters))] + params, listModes
+	
+	def _burstLines(self, burstUsers, burstChannels):
+		for user, nick in burstUsers:
 			signonTimestamp = str(timestamp(user.connectedSince))
 			nickTimestamp = str(timestamp(user.nickSince))
-			modes = []
-			params = []
-			listModes = {}
-			for mode, param in user.modes.iteritems():
-				if self.ircd.userModeTypes[mode] == ModeType.List:
-					listModes[mode] = param
-				else:
-					modes.append(mode)
-					if param is not None:
-						params.append(param)
-			modeStr = "+{} {}".format("".join(modes), " ".join(params)) if params else "+{}".format("".join(modes))
-			server.sendMessage("UID", user.uuid, signonTimestamp, user.nick, user.realHost, user.host(), user.currentHostType(), user.ident, user.ip, nickTimestamp, modeStr, user.gecos, prefix=self.ircd.serverID)
+			modeParams, listModes = self._splitModes(user.modes, self.ircd.userModeTypes)
+			yield ("UID", user.uuid, signonTimestamp, nick, user.realHost, user.host(), user.currentHostType(), user.ident, user.ip, nickTimestamp, " ".join(modeParams), user.gecos)
 			sentListModes = False
 			for mode, paramList in listModes.iteritems():
 				for param, setter, time in paramList:
-					server.sendMessage("LISTMODE", user.uuid, signonTimestamp, mode, param, setter, str(timestamp(time)), prefix=self.ircd.serverID)
+					yield ("LISTMODE", user.uuid, signonTimestamp, mode, param, setter, str(timestamp(time)))
 					sentListModes = True
 			if sentListModes:
-				server.sendMessage("ENDLISTMODE", user.uuid, prefix=self.ircd.serverID)
+				yield ("ENDLISTMODE", user.uuid)
 			for key, value, visibility, setByUser in user.metadataList():
-				server.sendMessage("METADATA", user.uuid, signonTimestamp, key, visibility, "1" if setByUser else "0", value, prefix=self.ircd.serverID)
-		for channel in self.ircd.channels.itervalues():
+				yield ("METADATA", user.uuid, signonTimestamp, key, visibility, "1" if setByUser else "0", value)
+		for channel, users in burstChannels:
 			channelTimestamp = str(timestamp(channel.existedSince))
-			users = []
-			for user, data in channel.users.iteritems():
-				if user.localOnly:
-					continue
-				if user.uuid[:3] in serversBurstingTo: # The remote server already knows about these users
-					continue
-				ranks = data["status"]
-				users.append("{},{}".format(ranks, user.uuid))
-			if not users:
-				continue # Let's not sync this channel since it won't sync properly
-			modes = []
-			params = []
-			listModes = {}
-			for mode, param in channel.modes.iteritems():
-				if self.ircd.channelModeTypes[mode] == ModeType.List:
-					listModes[mode] = param
-				else:
-					modes.append(mode)
-					if param is not None:
-						params.append(param)
-			modeStr = "+{} {}".format("".join(modes), " ".join(params)) if params else "+{}".format("".join(modes))
-			fjoinParams = [channel.name, channelTimestamp] + modeStr.split(" ") + [" ".join(users)]
-			server.sendMessage("FJOIN", *fjoinParams, prefix=self.ircd.serverID)
+			modeParams, listModes = self._splitModes(channel.modes, self.ircd.channelModeTypes)
+			yield tuple(["FJOIN", channel.name, channelTimestamp] + modeParams + [" ".join(users)])
 			sentListModes = False
 			for mode, params in listModes.iteritems():
 				for param, setter, time in params:
-					server.sendMessage("LISTMODE", channel.name, channelTimestamp, mode, param, setter, str(timestamp(time)), prefix=self.ircd.serverID)
+					yield ("LISTMODE", channel.name, channelTimestamp, mode, param, setter, str(timestamp(time)))
 					sentListModes = True
 			if sentListModes:
-				server.sendMessage("ENDLISTMODE", channel.name, prefix=self.ircd.serverID)
+				yield ("ENDLISTMODE", channel.name)
 			if channel.topic:
-				server.sendMessage("TOPIC", channel.name, channelTimestamp, str(timestamp(channel.topicTime)), channel.topic, prefix=self.ircd.serverID)
+				yield ("TOPIC", channel.name, channelTimestamp, str(timestamp(channel.topicTime)), channel.topic)
 			for key, value, visibility, setByUser in channel.metadataList():
-				server.sendMessage("METADATA", channel.name, channelTimestamp, key, visibility, "1" if setByUser else "0", value, prefix=self.ircd.serverID)
+				yield ("METADATA", channel.name, channelTimestamp, key, visibility, "1" if setByUser else "0", value)
+	
+	def _bulkBurstLines(self, burstUsers, burstChannels):
+		"""
+		Generates the burst using the bulk commands, which fit many users or
+		channel members per line. Used for servers that have the BULKBURST
+		feature.
+		"""
+		userEntries = []
+		userEntriesLength = 0
+		userExtraLines = []
+		for user, nick in burstUsers:
+			signonTimestamp = str(timestamp(user.connectedSince))
+			modeParams, listModes = self._splitModes(user.modes, self.ircd.userModeTypes)
+			userEntry = joinBulkEntry([user.uuid, signonTimestamp, nick, user.realHost, user.host(), user.currentHostType(), user.ident, user.ip, str(timestamp(user.nickSince))] + modeParams + [user.gecos])
+			if userEntries and userEntriesLength + len(userEntry) > self.bulkLineLength:
+				yield ("BULKUID", " ".join(userEntries))
+				for line in userExtraLines: # List modes and metadata must come after the users they're for
+					yield line
+				userEntries = []
+				userEntriesLength = 0
+				userExtraLines = []
+			userEntries.append(userEntry)
+			userEntriesLength += len(userEntry) + 1
+			for entries in self._groupBulkEntries(self._listModeEntries(listModes)):
+				userExtraLines.append(("BULKLISTMODE", user.uuid, signonTimestamp, entries))
+			for entries in self._groupBulkEntries(self._metadataEntries(user.metadataList())):
+				userExtraLines.append(("BULKMETADATA", user.uuid, signonTimestamp, entries))
+		if userEntries:
+			yield ("BULKUID", " ".join(userEntries))
+			for line in userExtraLines:
+				yield line
+		for channel, users in burstChannels:
+			channelTimestamp = str(timestamp(channel.existedSince))
+			modeParams, listModes = self._splitModes(channel.modes, self.ircd.channelModeTypes)
+			# Users go first so that the first line always creates the channel if the remote server doesn't have it
+			for entries in self._groupBulkEntries(users + self._listModeEntries(listModes)):
+				yield tuple(["BULKFJOIN", channel.name, channelTimestamp] + modeParams + [entries])
+				modeParams = ["+"]
+			if channel.topic:
+				yield ("TOPIC", channel.name, channelTimestamp, str(timestamp(channel.topicTime)), channel.topic)
+			for entries in self._groupBulkEntries(self._metadataEntries(channel.metadataList())):
+				yield ("BULKMETADATA", channel.name, channelTimestamp, entries)
+	
+	def _listModeEntries(self, listModes):
+		entries = []
+		for mode, paramList in listModes.iteritems():
+			for param, setter, time in paramList:
+				entries.append(joinBulkEntry([mode, param, setter, str(timestamp(time))]))
+		return entries
+	
+	def _metadataEntries(self, metadataList):
+		entries = []
+		for key, value, visibility, setByUser in metadataList:
+			entries.append(joinBulkEntry([key, visibility, "1" if setByUser else "0", value]))
+		return entries
+	
+	def _groupBulkEntries(self, entries):
+		"""
+		Groups bulk command entries into space-separated strings, each short
+		enough to send as part of a single line.
+		"""
+		groupEntries = []
+		groupLength = 0
+		for entry in entries:
+			if groupEntries and groupLength + len(entry) > self.bulkLineLength:
+				yield " ".join(groupEntries)
+				groupEntries = []
+				groupLength = 0
+			groupEntries.append(entry)
+			groupLength += len(entry) + 1
+		if groupEntries:
+			yield " ".join(groupEntries)
 	
 	def completeBurst(self, server):
 		server.sendMessage("BURST", prefix=self.ircd.serverID)
@@ -123,4 +205,54 @@ class ServerBurst(ModuleData, Command):
 		server.endBurst()
 		return True
 
-serverBurst = ServerBurst()
\ No newline at end of file
+class BurstSender(object):
+	"""
+	Sends burst lines to a server in chunks, one chunk per reactor turn, so
+	that bursting a large network doesn't hold up every other connection.
+	While the connection is paused, sending waits until the server resumes
+	it.
+	"""
+	progressInterval = 5
+	
+	def __init__(self, ircd, server, burstLines):
+		self.ircd = ircd
+		self.server = server
+		self.burstLines = burstLines
+		self.linesSent = 0
+		self.startTime = time()
+		self.lastProgressTime = self.startTime
+	
+	def run(self):
+		server = self.server
+		if server.bursted is None:
+			self.ircd.log.info("Stopped sending burst to {server.name}: the server disconnected", server=server)
+			return
+		if server.isSendPaused():
+			server.callWhenResumed(self.run) # Wait for the connection to catch up before sending more
+			return
+		chunkSize = self.ircd.config.get("server_burst_chunk_size", 1000)
+		prefix = self.ircd.serverID
+		for lineCount in xrange(chunkSize):
+			try:
+				lineParams = self.burstLines.next()
+			except StopIteration:
+				self.linesSent += lineCount
+				self.finish()
+				return
+			server.sendBurstMessage(*lineParams, prefix=prefix)
+		self.linesSent += chunkSize
+		nowTime = time()
+		if nowTime - self.lastProgressTime >= self.progressInterval:
+			self.lastProgressTime = nowTime
+			self.ircd.runActionStandard("burstprogress", server, self.linesSent, nowTime - self.startTime, False)
+		reactor.callLater(0, self.run)
+	
+	def finish(self):
+		server = self.server
+		duration = time() - self.startTime
+		self.ircd.log.info("Finished sending burst to {server.name}: {lines} lines in {duration:.3f} seconds", server=server, lines=self.linesSent, duration=duration)
+		self.ircd.runActionStandard("burstprogress", server, self.linesSent, duration, True)
+		server.releaseHeldMessages()
+		self.ircd.runActionStandard("burst", server)
+
+serverBurst = ServerBurst()
@@ -1,5 +1,5 @@
 from twisted.plugin import IPlugin
-from txircd import protoVersion
+from txircd import protoFeatures, protoVersion
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from zope.interface import implements
 
@@ -31,6 +31,13 @@ class CapabCommand(ModuleData, Command):
 				"subcmd": subcmd,
 				"modules": params[1].split(" ")
 			}
+		if subcmd == "FEATURES":
+			if len(params) != 2:
+				return None
+			return {
+				"subcmd": subcmd,
+				"features": params[1].split(" ")
+			}
 		if subcmd == "END":
 			if len(params) != 1:
 				return None
@@ -54,6 +61,9 @@ class CapabCommand(ModuleData, Command):
 				server.disconnect("Link Error: Not all required modules are loaded [Missing {}]".format(", ".join(missingModules)))
 				return True
 			return True
+		if subcmd == "FEATURES":
+			server.cache["features"] = set(data["features"])
+			return True
 		if subcmd == "END":
 			if server.serverID in self.ircd.servers:
 				server.disconnect("Server {} already exists".format(server.serverID))
@@ -65,8 +75,9 @@ class CapabCommand(ModuleData, Command):
 			if server.receivedConnection:
 				server.sendMessage("CAPAB", "START", protoVersion, prefix=self.ircd.serverID)
 				server.sendMessage("CAPAB", "MODULES", " ".join(self.ircd.loadedModules.keys()), prefix=self.ircd.serverID)
+				server.sendMessage("CAPAB", "FEATURES", " ".join(protoFeatures), prefix=self.ircd.serverID)
 				server.sendMessage("CAPAB", "END", prefix=self.ircd.serverID)
-			self.ircd.runActionStandard("burst", server)
+			self.ircd.runActionStandard("startburst", server)
 			return True
 		return None
 
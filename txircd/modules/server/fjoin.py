@@ -1,7 +1,7 @@
 from twisted.plugin import IPlugin
 from txircd.channel import IRCChannel
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
-from txircd.utils import ModeType
+from txircd.utils import ModeType, splitBulkEntry
 from zope.interface import implements
 from datetime import datetime
 
@@ -12,9 +12,18 @@ class FJoinCommand(ModuleData, Command):
 	core = True
 	
 	def serverCommands(self):
-		return [ ("FJOIN", 1, self) ]
+		return [ ("FJOIN", 1, self),
+		         ("BULKFJOIN", 1, BulkFJoinCommand(self)) ]
 	
 	def parseParams(self, server, params, prefix, tags):
+		return self.parseJoinParams(params, False)
+	
+	def parseJoinParams(self, params, bulk):
+		"""
+		Parses FJOIN parameters. In the bulk form, the user list may also
+		contain list mode entries (mode, parameter, setter, and set time) for
+		the channel, and each entry is encoded with joinBulkEntry.
+		"""
 		if len(params) < 4:
 			return None
 		try:
@@ -44,9 +53,20 @@ class FJoinCommand(ModuleData, Command):
 		if currParam + 1 < len(params):
 			return None
 		users = {}
+		listModes = []
 		try:
 			for userData in usersInChannel:
-				ranks, uuid = userData.split(",")
+				if bulk:
+					entryData = splitBulkEntry(userData)
+					if len(entryData) == 4:
+						mode, param, setter, modeTime = entryData
+						if mode not in self.ircd.channelModeTypes or self.ircd.channelModeTypes[mode] != ModeType.List:
+							return None
+						listModes.append((mode, param, setter, datetime.utcfromtimestamp(int(modeTime))))
+						continue
+					ranks, uuid = entryData
+				else:
+					ranks, uuid = userData.split(",")
 				if uuid not in self.ircd.users:
 					return None
 				for rank in ranks:
@@ -63,6 +83,7 @@ class FJoinCommand(ModuleData, Command):
 			"channel": channel,
 			"time": time,
 			"modes": modes,
+			"listmodes": listModes,
 			"users": users
 		}
 	
@@ -70,11 +91,23 @@ class FJoinCommand(ModuleData, Command):
 		channel = data["channel"]
 		time = data["time"]
 		remoteModes = data["modes"]
+		remoteListModes = data["listmodes"]
 		remoteStatuses = []
+		# Local users get the joins from a netjoin in a batch
+		batchUsers = []
+		for user in data["users"].iterkeys():
+			if user not in channel.users:
+				batchUsers = list(channel.localUsers)
+				break
+		batchParameters = [self.ircd.name, server.name]
+		for user in batchUsers:
+			self.ircd.runActionStandard("startbatchsend", user, "netjoin", "netjoin", batchParameters)
 		for user, ranks in data["users"].iteritems():
 			user.joinChannel(channel, True, True)
 			for rank in ranks:
 				remoteStatuses.append((user.uuid, rank))
+		for user in batchUsers:
+			self.ircd.runActionStandard("endbatchsend", user, "netjoin", "netjoin", batchParameters)
 		if time < channel.existedSince:
 			modeUnsetList = []
 			for mode, param in channel.modes.iteritems():
@@ -94,10 +127,24 @@ class FJoinCommand(ModuleData, Command):
 			modeSetList = []
 			for mode, param in remoteModes.iteritems():
 				modeSetList.append((True, mode, param))
+			for mode, param, setter, modeTime in remoteListModes:
+				modeSetList.append((True, mode, param, setter, modeTime))
 			for status in remoteStatuses:
 				modeSetList.append((True, status[1], status[0]))
 			if modeSetList:
 				channel.setModes(modeSetList, self.ircd.serverID)
 		return True
 
+class BulkFJoinCommand(Command):
+	implements(ICommand)
+	
+	def __init__(self, module):
+		self.module = module
+	
+	def parseParams(self, server, params, prefix, tags):
+		return self.module.parseJoinParams(params, True)
+	
+	def execute(self, server, data):
+		return self.module.execute(server, data)
+
 fjoinCmd = FJoinCommand()
\ No newline at end of file
@@ -1,6 +1,6 @@
 from twisted.plugin import IPlugin
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
-from txircd.utils import ModeType
+from txircd.utils import ModeType, splitBulkEntry
 from zope.interface import implements
 from datetime import datetime
 
@@ -13,7 +13,8 @@ class ListModeSync(ModuleData):
 	
 	def serverCommands(self):
 		return [ ("LISTMODE", 1, ListModeCmd(self)),
-		         ("ENDLISTMODE", 1, EndListModeCmd(self)) ]
+		         ("ENDLISTMODE", 1, EndListModeCmd(self)),
+		         ("BULKLISTMODE", 1, BulkListModeCmd(self)) ]
 	
 	def addListMode(self, target, modeData):
 		if target not in self.modeCache:
@@ -144,4 +145,56 @@ class EndListModeCmd(Command):
 			self.module.setModes(data["target"], server)
 		return True
 
+class BulkListModeCmd(Command):
+	implements(ICommand)
+	
+	def __init__(self, module):
+		self.module = module
+		self.ircd = module.ircd
+	
+	def parseParams(self, server, params, prefix, tags):
+		if len(params) != 3:
+			return None
+		if params[0] in self.ircd.channels:
+			target = self.ircd.channels[params[0]]
+			modeTypes = self.ircd.channelModeTypes
+		elif params[0] in self.ircd.users:
+			target = self.ircd.users[params[0]]
+			modeTypes = self.ircd.userModeTypes
+		elif params[0] in self.ircd.recentlyQuitUsers or params[0] in self.ircd.recentlyDestroyedChannels:
+			return {
+				"losttarget": True
+			}
+		else:
+			return None
+		modeList = []
+		try:
+			targetTime = datetime.utcfromtimestamp(int(params[1]))
+			for modeEntry in params[2].split(" "):
+				mode, param, setter, modeTime = splitBulkEntry(modeEntry)
+				if mode not in modeTypes or modeTypes[mode] != ModeType.List:
+					return None
+				modeList.append((True, mode, param, setter, datetime.utcfromtimestamp(int(modeTime))))
+		except ValueError:
+			return None
+		return {
+			"target": target,
+			"targettime": targetTime,
+			"modes": modeList
+		}
+	
+	def execute(self, server, data):
+		if "losttarget" in data:
+			return True
+		targetTime = data["targettime"]
+		target = data["target"]
+		try: # Check channel timestamp
+			if targetTime > target.existedSince:
+				return True
+		except AttributeError: # Check user timestamp
+			if targetTime > target.connectedSince:
+				return True
+		target.setModes(data["modes"], server.serverID)
+		return True
+
 listModeSync = ListModeSync()
\ No newline at end of file
@@ -1,6 +1,6 @@
 from twisted.plugin import IPlugin
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
-from txircd.utils import timestamp
+from txircd.utils import splitBulkEntry, timestamp
 from zope.interface import implements
 from datetime import datetime
 
@@ -15,7 +15,8 @@ class ServerMetadata(ModuleData, Command):
 		         ("channelmetadataupdate", 10, self.propagateChannelMetadata) ]
 	
 	def serverCommands(self):
-		return [ ("METADATA", 1, self) ]
+		return [ ("METADATA", 1, self),
+		         ("BULKMETADATA", 1, BulkMetadataCommand(self)) ]
 	
 	def propagateMetadata(self, targetID, targetTime, key, value, visibility, setByUser, fromServer):
 		serverPrefix = fromServer.serverID if fromServer else self.ircd.serverID
@@ -82,4 +83,54 @@ class ServerMetadata(ModuleData, Command):
 			value = None
 		return target.setMetadata(data["key"], value, data["visibility"], data["setbyuser"], server)
 
+class BulkMetadataCommand(Command):
+	implements(ICommand)
+	
+	def __init__(self, module):
+		self.module = module
+		self.ircd = module.ircd
+	
+	def parseParams(self, server, params, prefix, tags):
+		if len(params) != 3:
+			return None
+		data = {}
+		if params[0] in self.ircd.users:
+			data["user"] = self.ircd.users[params[0]]
+		elif params[0] in self.ircd.channels:
+			data["channel"] = self.ircd.channels[params[0]]
+		elif params[0] in self.ircd.recentlyQuitUsers or params[0] in self.ircd.recentlyDestroyedChannels:
+			return {
+				"losttarget": True
+			}
+		else:
+			return None
+		metadataList = []
+		try:
+			data["time"] = datetime.utcfromtimestamp(int(params[1]))
+			for metadataEntry in params[2].split(" "):
+				key, visibility, setByUser, value = splitBulkEntry(metadataEntry)
+				metadataList.append((key, value, visibility, int(setByUser) > 0))
+		except ValueError:
+			return None
+		data["metadata"] = metadataList
+		return data
+	
+	def execute(self, server, data):
+		if "losttarget" in data:
+			return True
+		if "user" in data:
+			target = data["user"]
+			if data["time"] > target.connectedSince:
+				self.module.clearMetadata(target, server)
+				return True
+		else:
+			target = data["channel"]
+			if data["time"] > target.existedSince:
+				self.module.clearMetadata(target, server)
+				return True
+		for key, value, visibility, setByUser in data["metadata"]:
+			if not target.setMetadata(key, value, visibility, setByUser, server):
+				return None
+		return True
+
 serverMetadata = ServerMetadata()
\ No newline at end of file
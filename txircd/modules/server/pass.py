@@ -1,5 +1,5 @@
 from twisted.plugin import IPlugin
-from txircd import protoVersion
+from txircd import protoFeatures, protoVersion
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from zope.interface import implements
 
@@ -36,6 +36,7 @@ class PassCommand(ModuleData, Command):
 			else:
 				server.sendMessage("CAPAB", "START", protoVersion, prefix=self.ircd.serverID)
 				server.sendMessage("CAPAB", "MODULES", " ".join(self.ircd.loadedModules.keys()), prefix=self.ircd.serverID)
+				server.sendMessage("CAPAB", "FEATURES", " ".join(protoFeatures), prefix=self.ircd.serverID)
 				server.sendMessage("CAPAB", "END", prefix=self.ircd.serverID)
 			return True
 		server.disconnect("Incorrect password")
@@ -21,11 +21,8 @@ class ServerCommand(ModuleData, Command):
 		server.sendMessage("SERVER", self.ircd.name, self.ircd.serverID, "0", self.ircd.serverID, self.ircd.config["server_description"], prefix=self.ircd.serverID)
 	
 	def propagateServer(self, server):
-		hopCount = 1
-		closestServer = server
-		while closestServer.nextClosest != self.ircd.serverID:
-			hopCount += 1
-			closestServer = self.ircd.servers[closestServer.nextClosest]
+		closestServer = self.ircd.serverLink(server.serverID)
+		hopCount = self.ircd.serverHopCount(server.serverID)
 		self.ircd.broadcastToServers(closestServer, "SERVER", server.name, server.serverID, str(hopCount), server.nextClosest, server.description, prefix=server.nextClosest)
 	
 	def parseParams(self, server, params, prefix, tags):
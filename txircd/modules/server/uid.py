@@ -1,7 +1,7 @@
 from twisted.plugin import IPlugin
 from txircd.module_interface import Command, ICommand, IModuleData, ModuleData
 from txircd.user import RemoteUser
-from txircd.utils import ModeType, now, timestamp
+from txircd.utils import ModeType, now, splitBulkEntry, timestamp
 from zope.interface import implements
 from datetime import datetime
 
@@ -15,7 +15,8 @@ class ServerUID(ModuleData, Command):
 		return [ ("welcome", 500, self.broadcastUID) ]
 	
 	def serverCommands(self):
-		return [ ("UID", 1, self) ]
+		return [ ("UID", 1, self),
+		         ("BULKUID", 1, BulkUIDCommand(self)) ]
 	
 	def parseParams(self, server, params, prefix, tags):
 		if len(params) < 9:
@@ -37,7 +38,10 @@ class ServerUID(ModuleData, Command):
 				return None # There's a mode that's NOT REAL so get out of here
 			param = None
 			if modeType in (ModeType.List, ModeType.ParamOnUnset, ModeType.Param):
-				param = params[currParam]
+				try:
+					param = params[currParam]
+				except IndexError:
+					return None
 				currParam += 1
 				if not param or " " in param:
 					return None
@@ -47,6 +51,8 @@ class ServerUID(ModuleData, Command):
 				modes[mode].append(param)
 			else:
 				modes[mode] = param
+		if currParam >= len(params):
+			return None
 		gecos = params[currParam]
 		return {
 			"uuid": uuid,
@@ -122,4 +128,30 @@ class ServerUID(ModuleData, Command):
 	def broadcastUID(self, user):
 		self.ircd.broadcastToServers(None, "UID", user.uuid, str(timestamp(user.connectedSince)), user.nick, user.realHost, user.host(), user.currentHostType(), user.ident, user.ip, str(timestamp(user.nickSince)), user.modeString(None), user.gecos, prefix=self.ircd.serverID)
 
+class BulkUIDCommand(Command):
+	implements(ICommand)
+	
+	def __init__(self, module):
+		self.module = module
+		self.ircd = module.ircd
+	
+	def parseParams(self, server, params, prefix, tags):
+		if len(params) != 1:
+			return None
+		userList = []
+		for userEntry in params[0].split(" "):
+			userData = self.module.parseParams(server, splitBulkEntry(userEntry), prefix, tags)
+			if userData is None:
+				return None
+			userList.append(userData)
+		return {
+			"users": userList
+		}
+	
+	def execute(self, server, data):
+		for userData in data["users"]:
+			if not self.module.execute(server, userData):
+				return None
+		return True
+
 serverUID = ServerUID()
\ No newline at end of file
@@ -0,0 +1,58 @@
+class PingService(object):
+	"""
+	Pings all local users from a single timer. Users are spread across a
+	fixed number of buckets, and each tick processes one bucket, so each user
+	is checked once per ping interval and the pings are spread evenly over
+	the interval instead of each user having a timer of their own.
+	"""
+	bucketCount = 64
+	
+	def __init__(self, ircd):
+		self.ircd = ircd
+		self._buckets = [set() for bucket in xrange(self.bucketCount)]
+		self._userBuckets = {}
+		self._nextBucket = 0
+		self._timer = None
+	
+	def __len__(self):
+		return len(self._userBuckets)
+	
+	def start(self):
+		if self._timer is None:
+			self._scheduleTick()
+	
+	def stop(self):
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+	
+	def addUser(self, user):
+		"""
+		Starts pinging a user. The user is first checked after one full ping
+		interval.
+		"""
+		if user in self._userBuckets:
+			return
+		bucketIndex = (self._nextBucket - 1) % self.bucketCount # The bucket that was just processed
+		self._buckets[bucketIndex].add(user)
+		self._userBuckets[user] = bucketIndex
+	
+	def removeUser(self, user):
+		"""
+		Stops pinging a user.
+		"""
+		if user not in self._userBuckets:
+			return
+		self._buckets[self._userBuckets.pop(user)].discard(user)
+	
+	def _scheduleTick(self):
+		interval = float(self.ircd.config.get("user_ping_frequency", 60)) / self.bucketCount
+		self._timer = self.ircd.timers.callLater(interval, self._tick)
+	
+	def _tick(self):
+		self._scheduleTick()
+		bucket = self._buckets[self._nextBucket]
+		self._nextBucket = (self._nextBucket + 1) % self.bucketCount
+		for user in list(bucket): # Pinging a user can disconnect users, which removes them from the bucket
+			if user in bucket:
+				self.ircd.runActionStandard("pinguser", user)
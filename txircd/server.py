@@ -1,10 +1,9 @@
-from twisted.internet import reactor
 from twisted.internet.defer import Deferred
-from twisted.internet.task import LoopingCall
 from txircd.ircbase import IRCBase
-from txircd.utils import now
 
 class IRCServer(IRCBase):
+	connectionType = "server"
+	
 	def __init__(self, ircd, ip, received):
 		self.ircd = ircd
 		self.serverID = None
@@ -16,8 +15,14 @@ class IRCServer(IRCBase):
 		self.bursted = None
 		self.disconnectedDeferred = Deferred()
 		self.receivedConnection = received
-		self._pinger = LoopingCall(self._ping)
-		self._registrationTimeoutTimer = reactor.callLater(self.ircd.config.get("server_registration_timeout", 10), self._timeoutRegistration)
+		self._heldMessages = None
+		self._heldMessagesSize = 0
+		self._resumeCallback = None
+		self.lastPingTime = 0
+		self.lastPongTime = 0
+		self.connectedSince = self.ircd.clock.now()
+		self._pinger = None
+		self._registrationTimeoutTimer = self.ircd.timers.callLater(self.ircd.config.get("server_registration_timeout", 10), self._timeoutRegistration)
 	
 	def handleCommand(self, command, params, prefix, tags):
 		if self.bursted and self.serverID not in self.ircd.servers:
@@ -65,7 +70,76 @@ class IRCServer(IRCBase):
 					break # Something failed to process, so we disconnected
 			del self.cache["burst_queue"]
 	
+	def sendMessage(self, command, *params, **kw):
+		if self._heldMessages is not None and command not in ("PING", "PONG"): # Keep pings going so the link doesn't time out
+			if not self._sendQueueOpen:
+				return
+			line = self._buildMessageLine(command, params, kw)
+			self._heldMessages.append(line)
+			self._heldMessagesSize += len(line) + 2
+			sendQueueLimit = self.sendQueueLimit()
+			if sendQueueLimit and self._heldMessagesSize + self.sendQueueSize() > sendQueueLimit: # Held messages count toward the SendQ
+				self._heldMessages = []
+				self._heldMessagesSize = 0
+				self._dropSendQueue()
+			return
+		IRCBase.sendMessage(self, command, *params, **kw)
+	
+	def sendBurstMessage(self, command, *params, **kw):
+		"""
+		Sends a message that's part of the burst to this server, ahead of any
+		messages being held until the burst is complete.
+		"""
+		IRCBase.sendMessage(self, command, *params, **kw)
+	
+	def holdMessages(self):
+		"""
+		Holds all messages sent to this server (except pings) until
+		releaseHeldMessages is called. Used while sending a burst, so that
+		network changes that happen during the burst are sent after the network
+		state they modify.
+		"""
+		if self._heldMessages is None:
+			self._heldMessages = []
+	
+	def releaseHeldMessages(self):
+		"""
+		Sends all messages held since holdMessages was called and stops holding
+		messages.
+		"""
+		heldMessages = self._heldMessages
+		self._heldMessages = None
+		self._heldMessagesSize = 0
+		if heldMessages:
+			for line in heldMessages:
+				self.sendLine(line)
+	
+	def callWhenResumed(self, callback):
+		"""
+		Calls the callback when the transport next asks us to resume sending,
+		for code that stops sending while the connection is paused. Replaces
+		any callback set before.
+		"""
+		self._resumeCallback = callback
+	
+	def resumeProducing(self):
+		IRCBase.resumeProducing(self)
+		callback = self._resumeCallback
+		if callback is not None:
+			self._resumeCallback = None
+			callback()
+	
+	def sendQueueLimit(self):
+		return self.ircd.config.get("server_sendq_limit", 33554432)
+	
+	def sendQueueExceeded(self):
+		if self.bursted is None and self.serverID not in self.ircd.servers:
+			self.transport.loseConnection()
+		else:
+			self.disconnect("SendQ exceeded")
+	
 	def connectionLost(self, reason):
+		IRCBase.connectionLost(self, reason)
 		if self.serverID in self.ircd.servers:
 			self.disconnect("Connection reset")
 		self.disconnectedDeferred.callback(None)
@@ -80,37 +154,77 @@ class IRCServer(IRCBase):
 			self.ircd.log.warn("Removing server {server.name}: {reason}", server=self, reason=reason)
 		self.ircd.runActionStandard("serverquit", self, reason)
 		if self.serverID in self.ircd.servers:
-			if netsplitQuitMsg is None:
+			if netsplitQuitMsg is None: # Only the server that split removes users; the ones behind it pass the message on
 				netsplitQuitMsg = "{} {}".format(self.ircd.servers[self.nextClosest].name if self.nextClosest in self.ircd.servers else self.ircd.name, self.name)
-			allUsers = self.ircd.users.values()
-			for user in allUsers:
-				if user.uuid[:3] == self.serverID:
-					user.disconnect(netsplitQuitMsg, True)
+				self._removeSplitUsers(netsplitQuitMsg)
 			allServers = self.ircd.servers.values()
 			for server in allServers:
 				if server.nextClosest == self.serverID:
 					server.disconnect(reason, netsplitQuitMsg)
-			self.ircd.recentlyQuitServers[self.serverID] = now()
+			self.ircd.markServerQuit(self.serverID)
 			del self.ircd.servers[self.serverID]
+			self.ircd.removeServerRoute(self.serverID)
 			del self.ircd.serverNames[self.name]
 		self.bursted = None
-		if self._pinger.running:
-			self._pinger.stop()
-		if self._registrationTimeoutTimer.active():
-			self._registrationTimeoutTimer.cancel()
+		self._heldMessages = None
+		self._heldMessagesSize = 0
+		self._resumeCallback = None
+		if self._pinger:
+			self._pinger.cancel()
+			self._pinger = None
+		self._registrationTimeoutTimer.cancel()
 		self._endConnection()
 	
+	def _removeSplitUsers(self, netsplitQuitMsg):
+		"""
+		Removes the users on this server and all servers behind it at once.
+		Each local user gets the QUIT messages for all the split users they
+		could see together, instead of one user's quit at a time.
+		"""
+		serversBehind = {}
+		for server in self.ircd.servers.itervalues():
+			if server.nextClosest not in serversBehind:
+				serversBehind[server.nextClosest] = []
+			serversBehind[server.nextClosest].append(server.serverID)
+		splitServerIDs = [self.serverID]
+		index = 0
+		while index < len(splitServerIDs):
+			if splitServerIDs[index] in serversBehind:
+				splitServerIDs.extend(serversBehind[splitServerIDs[index]])
+			index += 1
+		splitUsers = []
+		for serverID in splitServerIDs:
+			if serverID in self.ircd.usersByServer:
+				for user in self.ircd.usersByServer[serverID]:
+					if self.ircd.users.get(user.uuid) is user:
+						splitUsers.append(user)
+		if not splitUsers:
+			return
+		quitsByUser = {}
+		for user in splitUsers:
+			for localUser in user.localNeighbors():
+				if localUser in quitsByUser:
+					quitsByUser[localUser].append(user)
+				else:
+					quitsByUser[localUser] = [user]
+		for user in splitUsers:
+			user.disconnect(netsplitQuitMsg, True, False)
+		if quitsByUser:
+			nearServerName = self.ircd.servers[self.nextClosest].name if self.nextClosest in self.ircd.servers else self.ircd.name
+			self.ircd.runActionStandard("netsplitquitmessage", quitsByUser, netsplitQuitMsg, [nearServerName, self.name])
+	
 	def _endConnection(self):
-		self.transport.loseConnection()
+		self.closeConnection()
 	
 	def _timeoutRegistration(self):
 		if self.serverID and self.name:
-			self._pinger.start(self.ircd.config.get("server_ping_frequency", 60))
+			self._ping()
 			return
 		self.ircd.log.info("Disconnecting unregistered server")
 		self.disconnect("Registration timeout")
 	
 	def _ping(self):
+		self._pinger = self.ircd.timers.callLater(self.ircd.config.get("server_ping_frequency", 60), self._ping)
 		self.ircd.runActionStandard("pingserver", self)
 	
 	def register(self):
@@ -124,6 +238,7 @@ class IRCServer(IRCBase):
 			return
 		self.ircd.servers[self.serverID] = self
 		self.ircd.serverNames[self.name] = self.serverID
+		self.ircd.addServerRoute(self)
 		self.ircd.runActionStandard("serverconnect", self)
 		if self.nextClosest != self.ircd.serverID:
 			self.bursted = True # Indicate that this server is fully connected and synced NOW since it's a remote server and we've either already gotten or are about to get all the interesting tidbits
@@ -140,10 +255,7 @@ class RemoteServer(IRCServer):
 		Messages sent this way should have some information in the contents so
 		that they can be propagated in the correct direction.
 		"""
-		target = self
-		while target.nextClosest != self.ircd.serverID:
-			target = self.ircd.servers[target.nextClosest]
-		target.sendMessage(command, *params, **kw)
+		self.ircd.serverLink(self.serverID).sendMessage(command, *params, **kw)
 	
 	def _endConnection(self):
 		pass
\ No newline at end of file
@@ -0,0 +1,192 @@
+from twisted.internet import reactor
+from twisted.internet.defer import succeed
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+from collections import MutableMapping
+import cPickle as pickle, os, shelve, sqlite3, whichdb
+
+class DataStorage(MutableMapping):
+	"""
+	Persistent storage for the server's data. All values are kept in memory,
+	and the keys that changed since the last sync are tracked so that a sync
+	only writes those keys. Setting or deleting a key marks it as changed;
+	code that modifies a stored value in place (e.g. adds to a stored list)
+	must call markChanged for its key so that the change is saved.
+	Once the writer is started, changes are written to disk by a separate
+	writer thread so that disk I/O doesn't hold up the reactor.
+	Backends override _loadAll, _writeChanges, and _close; on its own, this
+	keeps the data only in memory.
+	"""
+	def __init__(self):
+		self._data = self._loadAll()
+		self._changedKeys = set()
+		self._writerPool = None
+	
+	def __repr__(self):
+		return repr(self._data)
+	
+	def __getitem__(self, key):
+		return self._data[key]
+	
+	def __setitem__(self, key, value):
+		self._data[key] = value
+		self._changedKeys.add(key)
+	
+	def __delitem__(self, key):
+		del self._data[key]
+		self._changedKeys.add(key)
+	
+	def __contains__(self, key):
+		return key in self._data
+	
+	def __iter__(self):
+		return iter(self._data)
+	
+	def __len__(self):
+		return len(self._data)
+	
+	def markChanged(self, key):
+		"""
+		Marks a key as changed so that it's written on the next sync.
+		"""
+		if key in self._data:
+			self._changedKeys.add(key)
+	
+	def startWriter(self):
+		"""
+		Starts the writer thread. Until it's started, changes are written in
+		the calling thread.
+		"""
+		if self._writerPool is not None:
+			return
+		self._writerPool = ThreadPool(1, 1, "txircd-storage") # A single thread writes all changes in order
+		self._writerPool.start()
+	
+	def sync(self):
+		"""
+		Writes all changes since the last sync to disk. The changed values are
+		pickled immediately, so later changes to the stored values don't
+		affect what's written. Only changed keys are pickled, so large data
+		should be split across keys that change separately. Returns a Deferred that fires when the changes
+		are written.
+		"""
+		changes = self._collectChanges()
+		if not changes:
+			return succeed(None)
+		if self._writerPool is None:
+			self._writeChanges(changes)
+			return succeed(None)
+		return deferToThreadPool(reactor, self._writerPool, self._writeChanges, changes)
+	
+	def close(self):
+		"""
+		Writes any unsaved changes and closes the storage. Returns a Deferred
+		that fires once all writes are finished and the storage is closed.
+		"""
+		syncDeferred = self.sync()
+		writerPool = self._writerPool
+		if writerPool is None:
+			self._close()
+			return syncDeferred
+		self._writerPool = None
+		closeDeferred = deferToThreadPool(reactor, writerPool, self._close) # Runs after all queued writes
+		def stopWriter(result):
+			writerPool.stop()
+			return result
+		closeDeferred.addBoth(stopWriter)
+		return closeDeferred
+	
+	def _collectChanges(self):
+		"""
+		Returns the changes since the last sync as a list of (key, pickled
+		value) tuples, where the value is None for deleted keys.
+		"""
+		changes = []
+		for key in self._changedKeys:
+			if key in self._data:
+				changes.append((key, pickle.dumps(self._data[key], pickle.HIGHEST_PROTOCOL)))
+			else:
+				changes.append((key, None))
+		self._changedKeys = set()
+		return changes
+	
+	def _loadAll(self):
+		return {}
+	
+	def _writeChanges(self, changes):
+		pass
+	
+	def _close(self):
+		pass
+
+class SQLiteStorage(DataStorage):
+	"""
+	Stores data in an SQLite database in WAL mode, with one row per key.
+	"""
+	def __init__(self, path):
+		self._connection = sqlite3.connect(path, check_same_thread=False) # Only one thread uses it at a time
+		self._connection.execute("PRAGMA journal_mode=WAL")
+		self._connection.execute("PRAGMA synchronous=NORMAL")
+		self._connection.execute("CREATE TABLE IF NOT EXISTS storage (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+		self._connection.commit()
+		DataStorage.__init__(self)
+	
+	def _loadAll(self):
+		data = {}
+		for key, value in self._connection.execute("SELECT key, value FROM storage"):
+			data[str(key)] = pickle.loads(str(value))
+		return data
+	
+	def _writeChanges(self, changes):
+		with self._connection: # Commits all the changes as one transaction
+			for key, value in changes:
+				if value is None:
+					self._connection.execute("DELETE FROM storage WHERE key = ?", (key,))
+				else:
+					self._connection.execute("INSERT OR REPLACE INTO storage (key, value) VALUES (?, ?)", (key, sqlite3.Binary(value)))
+	
+	def _close(self):
+		self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)") # Compact the write-ahead log back into the database
+		self._connection.close()
+
+class ShelveStorage(DataStorage):
+	"""
+	Stores data in a shelve file, as older versions did.
+	"""
+	def __init__(self, path):
+		self._shelf = shelve.open(path)
+		DataStorage.__init__(self)
+	
+	def _loadAll(self):
+		return dict(self._shelf.iteritems())
+	
+	def _writeChanges(self, changes):
+		for key, value in changes:
+			if value is None:
+				if key in self._shelf:
+					del self._shelf[key]
+			else:
+				self._shelf.dict[key] = value # The value is already pickled
+		self._shelf.sync()
+	
+	def _close(self):
+		self._shelf.close()
+
+def openStorage(path, backend):
+	"""
+	Opens the data storage with the given backend. The SQLite database is
+	stored next to the path of the shelve file older versions used; when
+	it's first created, data from an existing shelve file is imported.
+	"""
+	if backend == "shelve":
+		return ShelveStorage(path)
+	databasePath = "{}.sqlite".format(path)
+	importShelve = not os.path.exists(databasePath) and whichdb.whichdb(path)
+	storage = SQLiteStorage(databasePath)
+	if importShelve:
+		oldStorage = shelve.open(path, "r")
+		for key, value in oldStorage.iteritems():
+			storage[key] = value
+		oldStorage.close()
+		storage.sync()
+	return storage
@@ -0,0 +1,104 @@
+from twisted.trial import unittest
+from txircd.modules.cmode_b import CompiledBanList, parseBan
+
+class FakeIRCd(object):
+	def __init__(self):
+		self.matchedExtbans = {}
+	
+	def runActionUntilTrue(self, actionName, user, matchNegated, banmask):
+		matched = (actionName, banmask) in self.matchedExtbans.get(user.nick, ())
+		if matchNegated:
+			return not matched
+		return matched
+
+class FakeUser(object):
+	def __init__(self, nick, ident, host, realHost, ip):
+		self.nick = nick
+		self.ident = ident
+		self.displayHost = host
+		self.realHost = realHost
+		self.ip = ip
+	
+	def hostmask(self):
+		return "{}!{}@{}".format(self.nick, self.ident, self.displayHost)
+	
+	def hostmaskWithRealHost(self):
+		return "{}!{}@{}".format(self.nick, self.ident, self.realHost)
+	
+	def hostmaskWithIP(self):
+		return "{}!{}@{}".format(self.nick, self.ident, self.ip)
+
+class ParseBanTest(unittest.TestCase):
+	def test_plainBan(self):
+		self.assertEqual(parseBan("nick!ident@host"), ("", "", "", False, "nick!ident@host"))
+	
+	def test_actionExtban(self):
+		self.assertEqual(parseBan("m:param;*!*@host"), ("m", "param", "", False, "*!*@host"))
+	
+	def test_negatedMatchingExtban(self):
+		self.assertEqual(parseBan("q;~R:account"), ("q", "", "R", True, "account"))
+	
+	def test_ipv6HostIsNotAnExtban(self):
+		self.assertEqual(parseBan("*!*@2001:db8::1"), ("", "", "", False, "*!*@2001:db8::1"))
+
+class BanMatcherTest(unittest.TestCase):
+	def setUp(self):
+		self.ircd = FakeIRCd()
+		self.user = FakeUser("Alice", "alice", "cloaked.example", "host.example.net", "198.51.100.7")
+	
+	def compile(self, bans):
+		return CompiledBanList(self.ircd, [(ban, "setter", None) for ban in bans])
+	
+	def test_noBans(self):
+		self.assertIsNone(self.compile([]).match(self.user, ""))
+	
+	def test_exactMask(self):
+		self.assertEqual(self.compile(["alice!alice@cloaked.example"]).match(self.user, ""), "")
+		self.assertIsNone(self.compile(["alice!alice@other.example"]).match(self.user, ""))
+	
+	def test_exactHostMatchesAnyHost(self):
+		for host in ("cloaked.example", "host.example.net", "198.51.100.7"):
+			self.assertEqual(self.compile(["*!*@{}".format(host)]).match(self.user, ""), "")
+	
+	def test_exactNick(self):
+		self.assertEqual(self.compile(["ALICE!*@*"]).match(self.user, ""), "")
+		self.assertIsNone(self.compile(["bob!*@*"]).match(self.user, ""))
+	
+	def test_wildcards(self):
+		self.assertEqual(self.compile(["a?ice!*@*.example.net"]).match(self.user, ""), "")
+		self.assertEqual(self.compile(["*!*@198.51.100.*"]).match(self.user, ""), "")
+		self.assertIsNone(self.compile(["*!*@*.example.org", "b*!*@*"]).match(self.user, ""))
+	
+	def test_regexCharactersAreLiteral(self):
+		self.assertIsNone(self.compile(["*!*@host.example.ne."]).match(self.user, ""))
+		self.assertIsNone(self.compile(["a.ice!*@*"]).match(self.user, ""))
+	
+	def test_ircCaseMapping(self):
+		user = FakeUser("Nick[away]", "ident", "host", "host", "192.0.2.1")
+		self.assertEqual(self.compile(["nick{away}!*@*"]).match(user, ""), "")
+	
+	def test_firstMatchingBanWins(self):
+		bans = self.compile(["m:first;*!*@*.example.net", "m:second;alice!*@*", "m:third;*!*@cloaked.example"])
+		self.assertEqual(bans.match(self.user, "m"), "first")
+		bans = self.compile(["m:first;*!*@nowhere.example", "m:second;*!*@cloaked.example", "m:third;alice!*@*"])
+		self.assertEqual(bans.match(self.user, "m"), "second")
+	
+	def test_actionGroupsAreSeparate(self):
+		bans = self.compile(["*!*@nowhere.example", "m:muted;alice!*@*"])
+		self.assertIsNone(bans.match(self.user, ""))
+		self.assertEqual(bans.match(self.user, "m"), "muted")
+		self.assertEqual(bans.matchAll(self.user), { "m": "muted" })
+	
+	def test_matchingExtban(self):
+		self.ircd.matchedExtbans["Alice"] = [("usermatchban-R", "account")]
+		self.assertEqual(self.compile(["R:account"]).match(self.user, ""), "")
+		self.assertIsNone(self.compile(["R:other"]).match(self.user, ""))
+		self.assertIsNone(self.compile(["~R:account"]).match(self.user, ""))
+		self.assertEqual(self.compile(["~R:other"]).match(self.user, ""), "")
+	
+	def test_extbanOrdering(self):
+		self.ircd.matchedExtbans["Alice"] = [("usermatchban-R", "account")]
+		bans = self.compile(["m:extban;R:account", "m:mask;alice!*@*"])
+		self.assertEqual(bans.match(self.user, "m"), "extban")
+		bans = self.compile(["m:mask;alice!*@*", "m:extban;R:account"])
+		self.assertEqual(bans.match(self.user, "m"), "mask")
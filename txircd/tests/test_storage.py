@@ -0,0 +1,94 @@
+from twisted.trial import unittest
+from txircd.storage import DataStorage, ShelveStorage, SQLiteStorage, openStorage
+import os, shelve
+
+def tempPath(testCase, fileName):
+	directory = testCase.mktemp()
+	os.mkdir(directory)
+	return os.path.join(directory, fileName)
+
+class DataStorageTest(unittest.TestCase):
+	def test_tracksChangedKeys(self):
+		storage = DataStorage()
+		storage["a"] = 1
+		storage["b"] = [1]
+		self.assertEqual(sorted(key for key, value in storage._collectChanges()), ["a", "b"])
+		self.assertEqual(storage._collectChanges(), [])
+		storage["b"].append(2)
+		self.assertEqual(storage._collectChanges(), [])
+		storage.markChanged("b")
+		storage.markChanged("missing")
+		self.assertEqual([key for key, value in storage._collectChanges()], ["b"])
+		del storage["a"]
+		self.assertEqual(storage._collectChanges(), [("a", None)])
+
+class SQLiteStorageTest(unittest.TestCase):
+	def setUp(self):
+		self.path = tempPath(self, "data.sqlite")
+	
+	def reopen(self, storage):
+		storage.close()
+		return SQLiteStorage(self.path)
+	
+	def test_roundTrip(self):
+		storage = SQLiteStorage(self.path)
+		storage["xlines-G"] = [{ "mask": "*@host.example", "duration": 0 }]
+		storage["user_count_max"] = { "total": 5 }
+		storage = self.reopen(storage)
+		self.assertEqual(storage["xlines-G"], [{ "mask": "*@host.example", "duration": 0 }])
+		self.assertEqual(storage["user_count_max"], { "total": 5 })
+		storage.close()
+	
+	def test_deleteAndMarkChanged(self):
+		storage = SQLiteStorage(self.path)
+		storage["a"] = [1]
+		storage["b"] = 2
+		storage.sync()
+		storage["a"].append(2)
+		storage.markChanged("a")
+		del storage["b"]
+		storage = self.reopen(storage)
+		self.assertEqual(storage["a"], [1, 2])
+		self.assertNotIn("b", storage)
+		storage.close()
+	
+	def test_writerThread(self):
+		storage = SQLiteStorage(self.path)
+		storage.startWriter()
+		storage["a"] = [1]
+		syncDeferred = storage.sync()
+		storage["a"].append(2) # Changed after the sync without marking it, so it isn't written
+		def checkWritten(result):
+			return storage.close()
+		def reopen(result):
+			reopenedStorage = SQLiteStorage(self.path)
+			self.assertEqual(reopenedStorage["a"], [1])
+			reopenedStorage.close()
+		syncDeferred.addCallback(checkWritten)
+		syncDeferred.addCallback(reopen)
+		return syncDeferred
+
+class ShelveStorageTest(unittest.TestCase):
+	def test_roundTrip(self):
+		path = tempPath(self, "data.db")
+		storage = ShelveStorage(path)
+		storage["a"] = { "b": [1, 2] }
+		storage["c"] = 3
+		storage.sync()
+		del storage["c"]
+		storage.close()
+		storage = ShelveStorage(path)
+		self.assertEqual(dict(storage.iteritems()), { "a": { "b": [1, 2] } })
+		storage.close()
+
+class OpenStorageTest(unittest.TestCase):
+	def test_importsShelve(self):
+		path = tempPath(self, "data.db")
+		oldStorage = shelve.open(path)
+		oldStorage["xlines"] = { "G": [] }
+		oldStorage.close()
+		storage = openStorage(path, "sqlite")
+		self.assertIsInstance(storage, SQLiteStorage)
+		self.assertEqual(storage["xlines"], { "G": [] })
+		storage.close()
+		self.assertTrue(os.path.exists("{}.sqlite".format(path)))
@@ -0,0 +1,90 @@
+from twisted.trial import unittest
+from txircd.timing import TimingRecorder, TimingStats
+
+class FakeTimer(object):
+	def __init__(self):
+		self.now = 0.0
+	
+	def __call__(self):
+		return self.now
+
+class TimingStatsTest(unittest.TestCase):
+	def test_empty(self):
+		stats = TimingStats()
+		self.assertEqual(stats.percentile(0.5), 0.0)
+		self.assertEqual(stats.describe(), "calls=0 total=0.000 avg=0.000 p50=0.000 p95=0.000 p99=0.000 max=0.000")
+	
+	def test_record(self):
+		stats = TimingStats()
+		for duration in (0.000001, 0.000003, 0.001):
+			stats.record(duration)
+		self.assertEqual(stats.count, 3)
+		self.assertAlmostEqual(stats.total, 0.001004)
+		self.assertEqual(stats.maximum, 0.001)
+		self.assertEqual(stats.buckets[1], 1) # 1 microsecond
+		self.assertEqual(stats.buckets[2], 1) # 2-3 microseconds
+		self.assertEqual(stats.buckets[10], 1) # 512-1023 microseconds
+	
+	def test_longDurationsGoInTheLastBucket(self):
+		stats = TimingStats()
+		stats.record(100000)
+		self.assertEqual(stats.buckets[-1], 1)
+	
+	def test_percentiles(self):
+		stats = TimingStats()
+		for i in xrange(90):
+			stats.record(0.000010) # Bucket upper bound 16 microseconds
+		for i in xrange(10):
+			stats.record(0.002) # Bucket upper bound 2048 microseconds
+		self.assertEqual(stats.percentile(0.5), 0.000016)
+		self.assertEqual(stats.percentile(0.9), 0.000016)
+		self.assertEqual(stats.percentile(0.95), 0.002) # Capped at the maximum
+		self.assertEqual(stats.percentile(1), 0.002)
+
+class TimingRecorderTest(unittest.TestCase):
+	def setUp(self):
+		self.recorder = TimingRecorder()
+		self.timer = FakeTimer()
+		self.recorder.timer = self.timer
+	
+	def takeTime(self, duration, result = None):
+		self.timer.now += duration
+		return result
+	
+	def test_timeHandler(self):
+		handler = self.recorder.timeHandler("join", "Module", lambda user: self.takeTime(0.5, user))
+		self.assertEqual(handler("user"), "user")
+		self.assertEqual(self.recorder.handlers["join/Module"].count, 1)
+		self.assertEqual(self.recorder.handlers["join/Module"].total, 0.5)
+	
+	def test_timeHandlerRecordsErrors(self):
+		def fail():
+			self.takeTime(0.25)
+			raise ValueError("Failed")
+		handler = self.recorder.timeHandler("join", "Module", fail)
+		self.assertRaises(ValueError, handler)
+		self.assertEqual(self.recorder.handlers["join/Module"].total, 0.25)
+	
+	def test_timeActionRunner(self):
+		runner = self.recorder.timeActionRunner(lambda actionName, value, users = None: self.takeTime(0.125, value))
+		self.assertEqual(runner("quit", "value", users=[]), "value")
+		runner("quit", "value")
+		self.assertEqual(self.recorder.actions["quit"].count, 2)
+		self.assertEqual(self.recorder.actions["quit"].total, 0.25)
+	
+	def test_timeComboActionRunner(self):
+		runner = self.recorder.timeComboActionRunner(lambda users, actionList: self.takeTime(0.5, True), 1)
+		self.assertTrue(runner([], (("first", 1), ("second", 2))))
+		self.assertEqual(self.recorder.actions["first+second"].count, 1)
+		self.assertNotIn("first", self.recorder.actions)
+	
+	def test_timeCommand(self):
+		self.assertEqual(self.recorder.timeCommand("user", "PRIVMSG", self.takeTime, 0.5, "sent"), "sent")
+		self.assertEqual(self.recorder.commands["user/PRIVMSG"].total, 0.5)
+	
+	def test_report(self):
+		for command, duration in (("A", 0.1), ("B", 0.3), ("C", 0.2)):
+			self.recorder.timeCommand("user", command, self.takeTime, duration)
+		report = self.recorder.report(self.recorder.commands, 2)
+		self.assertEqual(sorted(report), ["user/B", "user/C"])
+		self.assertTrue(report["user/B"].startswith("calls=1 total=300.000 "))
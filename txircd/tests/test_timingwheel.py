@@ -0,0 +1,108 @@
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+from txircd import timingwheel
+from txircd.timingwheel import TimingWheel
+
+class FakeLog(object):
+	def __init__(self):
+		self.failures = []
+	
+	def failure(self, message):
+		self.failures.append(message)
+
+class TimingWheelTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = Clock()
+		self.patch(timingwheel, "reactor", self.clock)
+		self.log = FakeLog()
+		self.wheel = TimingWheel(self.log, tickLength = 0.1, slotBits = 2, levels = 3) # Small levels so tests cascade
+		self.calls = []
+	
+	def advanceTo(self, seconds):
+		self.clock.advance(seconds - self.clock.seconds())
+		self.wheel._advance()
+	
+	def record(self, name):
+		self.calls.append((name, self.clock.seconds()))
+	
+	def test_runsWhenDue(self):
+		self.wheel.callLater(0.5, self.record, "a")
+		self.advanceTo(0.4)
+		self.assertEqual(self.calls, [])
+		self.advanceTo(0.5)
+		self.assertEqual(self.calls, [("a", 0.5)])
+		self.assertEqual(len(self.wheel), 0)
+	
+	def test_cascadesFromHigherLevels(self):
+		# With 4 slots per level, these are on the first, second, and third levels
+		for delay in (0.3, 1.0, 3.0, 6.3):
+			self.wheel.callLater(delay, self.record, delay)
+		for tick in xrange(1, 70):
+			self.advanceTo(tick / 10.0)
+		self.assertEqual([name for name, when in self.calls], [0.3, 1.0, 3.0, 6.3])
+		for name, when in self.calls:
+			self.assertTrue(name <= when < name + 0.1 + 1e-9, (name, when))
+	
+	def test_beyondTheWheel(self):
+		self.wheel.callLater(10, self.record, "far") # The wheel only covers 6.3 seconds
+		for tick in xrange(1, 105):
+			self.advanceTo(tick / 10.0)
+		self.assertEqual(len(self.calls), 1)
+		self.assertTrue(10 <= self.calls[0][1] <= 10.1 + 1e-9)
+	
+	def test_catchesUpAfterADelay(self):
+		self.wheel.callLater(0.2, self.record, "a")
+		self.wheel.callLater(2.5, self.record, "b")
+		self.advanceTo(5)
+		self.assertEqual([name for name, when in self.calls], ["a", "b"])
+	
+	def test_cancel(self):
+		timer = self.wheel.callLater(0.2, self.record, "a")
+		self.assertTrue(timer.active())
+		timer.cancel()
+		timer.cancel()
+		self.assertFalse(timer.active())
+		self.assertEqual(len(self.wheel), 0)
+		self.advanceTo(1)
+		self.assertEqual(self.calls, [])
+	
+	def test_reset(self):
+		timer = self.wheel.callLater(0.2, self.record, "a")
+		self.advanceTo(0.1)
+		timer.reset(0.5)
+		self.advanceTo(0.5)
+		self.assertEqual(self.calls, [])
+		self.advanceTo(0.7) # Calls can run up to a tick late
+		self.assertEqual([name for name, when in self.calls], ["a"])
+	
+	def test_callbackSchedulingCalls(self):
+		def reschedule():
+			self.record("first")
+			self.wheel.callLater(0.1, self.record, "second")
+		self.wheel.callLater(0.1, reschedule)
+		self.advanceTo(0.1)
+		self.advanceTo(0.2)
+		self.assertEqual([name for name, when in self.calls], ["first", "second"])
+	
+	def test_errorsAreLogged(self):
+		def fail():
+			raise ValueError("Failed")
+		self.wheel.callLater(0.1, fail)
+		self.wheel.callLater(0.1, self.record, "after")
+		self.advanceTo(0.1)
+		self.assertEqual(len(self.log.failures), 1)
+		self.assertEqual([name for name, when in self.calls], ["after"])
+		self.flushLoggedErrors(ValueError)
+	
+	def test_expireKey(self):
+		data = { "a": 1, "b": 2 }
+		self.wheel.expireKey(data, "a", 0.2)
+		self.wheel.expireKey(data, "b", 0.2)
+		self.wheel.cancelKeyExpiry(data, "b")
+		self.advanceTo(0.1)
+		self.wheel.expireKey(data, "a", 0.3) # Replaces the first expiry
+		self.advanceTo(0.3)
+		self.assertEqual(data, { "a": 1, "b": 2 })
+		self.advanceTo(0.4)
+		self.assertEqual(data, { "b": 2 })
+		self.assertEqual(len(self.wheel), 0)
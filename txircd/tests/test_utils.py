@@ -0,0 +1,20 @@
+from twisted.trial import unittest
+from txircd.utils import joinBulkEntry, splitBulkEntry
+
+class BulkEntryTest(unittest.TestCase):
+	def test_plainFields(self):
+		self.assertEqual(joinBulkEntry(["o", "0011AAAAA"]), "o,0011AAAAA")
+		self.assertEqual(splitBulkEntry("o,0011AAAAA"), ["o", "0011AAAAA"])
+	
+	def test_emptyFields(self):
+		self.assertEqual(splitBulkEntry(joinBulkEntry(["", "0011AAAAA"])), ["", "0011AAAAA"])
+		self.assertEqual(splitBulkEntry(joinBulkEntry([""])), [""])
+	
+	def test_escapedCharactersAreRemoved(self):
+		entry = joinBulkEntry(["a b", "c,d", "e\\f"])
+		self.assertNotIn(" ", entry)
+		self.assertEqual(entry.count(","), 2)
+	
+	def test_roundTrip(self):
+		for fields in (["a b", "c,d", "e\\f"], ["\\s", "\\c", "\\\\"], ["trailing\\", " ,\\"], ["Ask your question, and wait :)"]):
+			self.assertEqual(splitBulkEntry(joinBulkEntry(fields)), fields)
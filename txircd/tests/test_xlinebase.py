@@ -0,0 +1,103 @@
+from twisted.trial import unittest
+from txircd.modules.xlinebase import NetworkTree, XLineIndex, _addressBits
+import socket
+
+class AddressBitsTest(unittest.TestCase):
+	def test_ipv4(self):
+		self.assertEqual(_addressBits("192.0.2.1"), (socket.AF_INET, 0xc0000201, 32))
+	
+	def test_ipv6(self):
+		self.assertEqual(_addressBits("2001:db8::1"), (socket.AF_INET6, 0x20010db8000000000000000000000001, 128))
+	
+	def test_ipv4MappedIsIPv4(self):
+		self.assertEqual(_addressBits("::ffff:192.0.2.1"), _addressBits("192.0.2.1"))
+	
+	def test_invalid(self):
+		self.assertIsNone(_addressBits("host.example"))
+
+class NetworkTreeTest(unittest.TestCase):
+	def setUp(self):
+		self.tree = NetworkTree(32)
+	
+	def test_lookupFindsContainingRanges(self):
+		self.tree.add(0xc0000200, 24, "/24")
+		self.tree.add(0xc0000000, 16, "/16")
+		self.tree.add(0xc0000201, 32, "/32")
+		self.assertEqual(sorted(self.tree.lookup(0xc0000201)), ["/16", "/24", "/32"])
+		self.assertEqual(sorted(self.tree.lookup(0xc0000202)), ["/16", "/24"])
+		self.assertEqual(self.tree.lookup(0xc000ff01), ["/16"])
+		self.assertEqual(self.tree.lookup(0x0a000001), [])
+	
+	def test_zeroLengthPrefixMatchesEverything(self):
+		self.tree.add(0, 0, "all")
+		self.assertEqual(self.tree.lookup(0xffffffff), ["all"])
+	
+	def test_removePrunesEmptyBranches(self):
+		self.tree.add(0xc0000200, 24, "/24")
+		self.tree.remove(0xc0000200, 24, "/24")
+		self.assertEqual(self.tree.lookup(0xc0000201), [])
+		self.assertEqual(self.tree.root, [None, None, None])
+	
+	def test_removeKeepsOtherValues(self):
+		self.tree.add(0xc0000200, 24, "first")
+		self.tree.add(0xc0000200, 24, "second")
+		self.tree.remove(0xc0000200, 24, "first")
+		self.tree.remove(0xc0000300, 24, "missing")
+		self.assertEqual(self.tree.lookup(0xc0000201), ["second"])
+
+class XLineIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.index = XLineIndex(True)
+	
+	def add(self, mask):
+		lineData = { "mask": mask }
+		self.index.add(mask, lineData)
+		return lineData
+	
+	def test_exactMask(self):
+		line = self.add("nick")
+		self.assertEqual(self.index.match(["nick"], None), [line])
+		self.assertEqual(self.index.match(["nickname"], None), [])
+	
+	def test_wildcardMask(self):
+		line = self.add("*@*.example.net")
+		self.assertEqual(self.index.match(["ident@host.example.net"], None), [line])
+		self.assertEqual(self.index.match(["ident@host.example.org"], None), [])
+	
+	def test_wildcardMatchesAnyString(self):
+		line = self.add("*@192.0.2.*")
+		self.assertEqual(self.index.match(["ident@host.example", "ident@192.0.2.7"], None), [line])
+	
+	def test_networkMask(self):
+		line = self.add("198.51.100.0/24")
+		self.assertEqual(self.index.match([], "198.51.100.20"), [line])
+		self.assertEqual(self.index.match([], "198.51.101.20"), [])
+		self.assertEqual(self.index.match([], "::ffff:198.51.100.20"), [line])
+	
+	def test_networkMaskWithHostBitsSet(self):
+		line = self.add("2001:db8::1/32")
+		self.assertEqual(self.index.match([], "2001:db8:ffff::1"), [line])
+	
+	def test_networkMasksDisabled(self):
+		index = XLineIndex(False)
+		line = { "mask": "198.51.100.0/24" }
+		index.add("198.51.100.0/24", line)
+		self.assertEqual(index.match([], "198.51.100.20"), [])
+		self.assertEqual(index.match(["198.51.100.0/24"], None), [line])
+	
+	def test_matchesInOrderAdded(self):
+		lines = [self.add("*"), self.add("192.0.2.0/24"), self.add("nick"), self.add("n*")]
+		self.assertEqual(self.index.match(["nick"], "192.0.2.1"), lines)
+	
+	def test_eachLineOnce(self):
+		line = self.add("*")
+		self.assertEqual(self.index.match(["one", "two"], None), [line])
+	
+	def test_remove(self):
+		self.add("nick")
+		self.add("n*")
+		self.add("192.0.2.0/24")
+		for mask in ("nick", "n*", "192.0.2.0/24", "missing"):
+			self.index.remove(mask)
+		self.assertEqual(self.index.match(["nick"], "192.0.2.1"), [])
+		self.assertEqual(self.index.lines, {})
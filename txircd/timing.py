@@ -0,0 +1,161 @@
+from timeit import default_timer
+
+class TimingStats(object):
+	"""
+	Keeps the call count, total and maximum duration, and a histogram of
+	durations for one thing being timed. The histogram buckets are powers of
+	two in microseconds, so percentiles are estimated to within a factor of
+	two.
+	"""
+	__slots__ = ("count", "total", "maximum", "buckets")
+	bucketCount = 32
+	
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.maximum = 0.0
+		self.buckets = [0] * self.bucketCount
+	
+	def record(self, duration):
+		self.count += 1
+		self.total += duration
+		if duration > self.maximum:
+			self.maximum = duration
+		bucket = int(duration * 1000000).bit_length()
+		if bucket >= self.bucketCount:
+			bucket = self.bucketCount - 1
+		self.buckets[bucket] += 1
+	
+	def percentile(self, fraction):
+		"""
+		Returns an estimate (the upper bound of the histogram bucket) of the
+		duration in seconds that the given fraction of calls took at most.
+		"""
+		if not self.count:
+			return 0.0
+		threshold = self.count * fraction
+		seen = 0
+		for bucket, bucketCount in enumerate(self.buckets):
+			seen += bucketCount
+			if seen >= threshold:
+				return min((1 << bucket) / 1000000.0, self.maximum)
+		return self.maximum
+	
+	def describe(self):
+		"""
+		Returns a summary of the stats for STATS output. Times are in
+		milliseconds.
+		"""
+		average = self.total / self.count if self.count else 0.0
+		return "calls={} total={:.3f} avg={:.3f} p50={:.3f} p95={:.3f} p99={:.3f} max={:.3f}".format(self.count, self.total * 1000, average * 1000, self.percentile(0.5) * 1000, self.percentile(0.95) * 1000, self.percentile(0.99) * 1000, self.maximum * 1000)
+
+class TimingRecorder(object):
+	"""
+	Records how long actions, their handlers, and commands take. The IRCd
+	only has one of these while timing is enabled; when it's disabled, no
+	handlers are wrapped and nothing is timed.
+	Actions are timed once each time they're run, including any actions run
+	from their handlers, so an action's count is the number of times it was
+	run whether or not it has handlers. Combo actions are timed under their
+	action names joined with "+".
+	"""
+	timer = staticmethod(default_timer)
+	
+	def __init__(self):
+		self.actions = {}
+		self.handlers = {}
+		self.commands = {}
+	
+	def _stats(self, statsDict, key):
+		if key not in statsDict:
+			statsDict[key] = TimingStats()
+		return statsDict[key]
+	
+	def timeHandler(self, actionName, moduleName, function):
+		"""
+		Returns a function that calls the given action handler and records
+		how long it took.
+		"""
+		handlerStats = self._stats(self.handlers, "{}/{}".format(actionName, moduleName))
+		timer = self.timer
+		def timedHandler(*params):
+			startTime = timer()
+			try:
+				return function(*params)
+			finally:
+				handlerStats.record(timer() - startTime)
+		return timedHandler
+	
+	def timeActionRunner(self, runFunction):
+		"""
+		Returns a function that calls one of the IRCd's runAction functions and
+		records how long the action took.
+		"""
+		actions = self.actions
+		timer = self.timer
+		def timedRunner(actionName, *params, **kw):
+			startTime = timer()
+			try:
+				return runFunction(actionName, *params, **kw)
+			finally:
+				duration = timer() - startTime
+				if actionName not in actions:
+					actions[actionName] = TimingStats()
+				actions[actionName].record(duration)
+		return timedRunner
+	
+	def timeComboActionRunner(self, runFunction, actionListIndex):
+		"""
+		Returns a function that calls one of the IRCd's runComboAction
+		functions and records how long the actions took. The action list is
+		the positional parameter at actionListIndex.
+		"""
+		actions = self.actions
+		timer = self.timer
+		def timedRunner(*params, **kw):
+			startTime = timer()
+			try:
+				return runFunction(*params, **kw)
+			finally:
+				duration = timer() - startTime
+				actionName = "+".join([action[0] for action in params[actionListIndex]])
+				if actionName not in actions:
+					actions[actionName] = TimingStats()
+				actions[actionName].record(duration)
+		return timedRunner
+	
+	def timeMode(self, actionName, moduleName, modeObj):
+		"""
+		Returns an object that applies the given mode and records how long it
+		took, to use in place of the mode object when running an action.
+		"""
+		return TimedMode(self.timeHandler(actionName, moduleName, modeObj.apply))
+	
+	def timeCommand(self, commandType, command, function, *params):
+		"""
+		Calls the function that handles a command and records how long it
+		took. The commandType is "user" or "server". Unknown commands should
+		all be given under one name so that the stats don't grow without
+		limit.
+		"""
+		startTime = self.timer()
+		try:
+			return function(*params)
+		finally:
+			self._stats(self.commands, "{}/{}".format(commandType, command)).record(self.timer() - startTime)
+	
+	def report(self, statsDict, count = 30):
+		"""
+		Returns a dict of the summaries of the given number of entries from
+		the given stats dict that took the most total time.
+		"""
+		entries = sorted(statsDict.iteritems(), key=lambda entry: entry[1].total, reverse=True)
+		return dict((key, stats.describe()) for key, stats in entries[:count])
+
+class TimedMode(object):
+	"""
+	Stands in for a mode object in an action plan so that its apply calls are
+	timed.
+	"""
+	def __init__(self, timedApply):
+		self.apply = timedApply
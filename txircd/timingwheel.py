@@ -0,0 +1,168 @@
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from math import ceil
+
+class WheelTimer(object):
+	"""
+	A call scheduled on a TimingWheel.
+	"""
+	__slots__ = ("_wheel", "_slot", "expireTick", "func", "args", "kw")
+	
+	def __init__(self, wheel, func, args, kw):
+		self._wheel = wheel
+		self._slot = None
+		self.expireTick = None
+		self.func = func
+		self.args = args
+		self.kw = kw
+	
+	def active(self):
+		"""
+		Returns True if the call hasn't run or been cancelled yet.
+		"""
+		return self._slot is not None
+	
+	def cancel(self):
+		"""
+		Cancels the call. Does nothing if it already ran or was cancelled.
+		"""
+		if self._slot is None:
+			return
+		self._slot.discard(self)
+		self._slot = None
+		self._wheel._timerCount -= 1
+	
+	def reset(self, delay):
+		"""
+		Reschedules the call to run the given number of seconds from now.
+		"""
+		self.cancel()
+		self._wheel._schedule(self, delay)
+
+class TimingWheel(object):
+	"""
+	Schedules calls on a hierarchical timing wheel, which is advanced by a
+	single reactor timer. Scheduling and cancelling a call take constant
+	time however many calls are scheduled, so this is used for the timers
+	kept for every connection instead of giving each its own reactor timer.
+	Calls run on the first tick after they're due, so they can run up to one
+	tick length late.
+	"""
+	def __init__(self, log, tickLength = 0.1, slotBits = 8, levels = 4):
+		self._log = log
+		self.tickLength = tickLength
+		self._slotBits = slotBits
+		self._slotCount = 1 << slotBits
+		self._slotMask = self._slotCount - 1
+		self._wheels = [[set() for slot in xrange(self._slotCount)] for level in xrange(levels)]
+		self._maxDelta = (1 << (slotBits * levels)) - 1
+		self._startTime = reactor.seconds()
+		self._currentTick = 0 # The last tick that was processed
+		self._timerCount = 0
+		self._keyedTimers = {}
+		self._ticker = None
+	
+	def __len__(self):
+		return self._timerCount
+	
+	def start(self):
+		"""
+		Starts advancing the wheel. Calls can be scheduled before it starts,
+		and any that became due in the meantime run on the first tick.
+		"""
+		if self._ticker is not None:
+			return
+		self._ticker = LoopingCall(self._advance)
+		self._ticker.start(self.tickLength, now=False)
+	
+	def stop(self):
+		if self._ticker is None:
+			return
+		if self._ticker.running:
+			self._ticker.stop()
+		self._ticker = None
+	
+	def callLater(self, delay, func, *args, **kw):
+		"""
+		Schedules func to be called with the given arguments after the given
+		number of seconds. Returns a WheelTimer that can cancel or reschedule
+		the call.
+		"""
+		timer = WheelTimer(self, func, args, kw)
+		self._schedule(timer, delay)
+		return timer
+	
+	def expireKey(self, mapping, key, delay):
+		"""
+		Removes the key from the mapping after the given number of seconds.
+		Setting an expiry for a key that already has one replaces it.
+		"""
+		timerKey = (id(mapping), key)
+		if timerKey in self._keyedTimers:
+			self._keyedTimers[timerKey].reset(delay)
+			return
+		self._keyedTimers[timerKey] = self.callLater(delay, self._expireKey, mapping, key, timerKey)
+	
+	def cancelKeyExpiry(self, mapping, key):
+		"""
+		Cancels the expiry set for the key in the mapping, if there is one.
+		"""
+		timerKey = (id(mapping), key)
+		if timerKey in self._keyedTimers:
+			self._keyedTimers.pop(timerKey).cancel()
+	
+	def _expireKey(self, mapping, key, timerKey):
+		del self._keyedTimers[timerKey]
+		mapping.pop(key, None)
+	
+	def _schedule(self, timer, delay):
+		expireTick = int(ceil((reactor.seconds() + delay - self._startTime) / self.tickLength))
+		timer.expireTick = max(expireTick, self._currentTick + 1)
+		self._insert(timer)
+		self._timerCount += 1
+	
+	def _insert(self, timer):
+		"""
+		Puts a timer in the slot for its expiry tick on the lowest level that
+		covers it. Timers on higher levels are moved down as the lower levels
+		wrap around.
+		"""
+		expireTick = timer.expireTick
+		delta = expireTick - self._currentTick
+		if delta > self._maxDelta: # Too far out for the wheel; it'll be put back in when it gets to the top slot
+			expireTick = self._currentTick + self._maxDelta
+			delta = self._maxDelta
+		level = 0
+		while delta >> (self._slotBits * (level + 1)):
+			level += 1
+		slot = self._wheels[level][(expireTick >> (self._slotBits * level)) & self._slotMask]
+		slot.add(timer)
+		timer._slot = slot
+	
+	def _advance(self):
+		targetTick = int((reactor.seconds() - self._startTime) / self.tickLength)
+		if not self._timerCount:
+			self._currentTick = max(self._currentTick, targetTick)
+			return
+		while self._currentTick < targetTick:
+			self._processTick()
+	
+	def _processTick(self):
+		tick = self._currentTick + 1
+		self._currentTick = tick # Timers due on this tick are moved down into the slot that's run below
+		level = 1
+		while level < len(self._wheels) and not (tick & ((1 << (self._slotBits * level)) - 1)):
+			slot = self._wheels[level][(tick >> (self._slotBits * level)) & self._slotMask]
+			while slot:
+				timer = slot.pop()
+				self._insert(timer)
+			level += 1
+		slot = self._wheels[0][tick & self._slotMask]
+		while slot:
+			timer = slot.pop()
+			timer._slot = None
+			self._timerCount -= 1
+			try:
+				timer.func(*timer.args, **timer.kw)
+			except Exception:
+				self._log.failure("An error occurred in a scheduled call")
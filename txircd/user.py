@@ -1,16 +1,17 @@
-from twisted.internet import reactor
 from twisted.internet.defer import Deferred
 from twisted.internet.interfaces import ISSLTransport
-from twisted.internet.task import LoopingCall
 from twisted.names import client as dnsClient
 from twisted.words.protocols import irc
 from txircd import version
 from txircd.ircbase import IRCBase
-from txircd.utils import CaseInsensitiveDictionary, expandIPv6Address, ipIsV4, isValidHost, isValidMetadataKey, ModeType, now, splitMessage
+from txircd.utils import CaseInsensitiveDictionary, expandIPv6Address, ipIsV4, isValidHost, isValidMetadataKey, ModeType, splitMessage
+from weakref import WeakSet
 
 irc.ERR_ALREADYREGISTERED = "462"
 
 class IRCUser(IRCBase):
+	connectionType = "user"
+	
 	def __init__(self, ircd, ip, uuid = None, host = None):
 		self.ircd = ircd
 		self.uuid = ircd.createUUID() if uuid is None else uuid
@@ -31,11 +32,16 @@ class IRCUser(IRCBase):
 		self.gecos = None
 		self._metadata = CaseInsensitiveDictionary()
 		self.cache = {}
+		self.capabilityMask = 0
+		self.outgoingMessageModifiers = set() # Modules add their capability while their modifyoutgoingmessage handlers change messages to this user
 		self.channels = []
 		self.modes = {}
-		self.connectedSince = now()
-		self.nickSince = now()
-		self.idleSince = now()
+		self.connectedSince = self.ircd.clock.now()
+		self.nickSince = self.ircd.clock.now()
+		self.idleSince = self.ircd.clock.now()
+		self.lastPingTime = 0
+		self.lastPongTime = 0
+		self.pingIdleSince = self.idleSince
 		self._registerHolds = set(("connection", "dns", "NICK", "USER"))
 		self.disconnectedDeferred = Deferred()
 		self._messageBatches = {}
@@ -44,8 +50,7 @@ class IRCUser(IRCBase):
 		self.ircd.users[self.uuid] = self
 		self.localOnly = False
 		self.secureConnection = False
-		self._pinger = LoopingCall(self._ping)
-		self._registrationTimeoutTimer = reactor.callLater(registrationTimeout, self._timeoutRegistration)
+		self._registrationTimeoutTimer = self.ircd.timers.callLater(registrationTimeout, self._timeoutRegistration)
 		self._connectHandlerTimer = None
 		self._startDNSResolving(registrationTimeout)
 	
@@ -84,14 +89,17 @@ class IRCUser(IRCBase):
 		# when the connection is closed.
 		# The "connection" register hold is used basically solely for the purposes of this to prevent potential
 		# race conditions with registration.
-		self._connectHandlerTimer = reactor.callLater(0.1, self._callConnectAction)
+		IRCBase.connectionMade(self)
+		self.ircd.connectionsAccepted += 1
+		self._connectHandlerTimer = self.ircd.timers.callLater(0.1, self._callConnectAction)
 		if ISSLTransport.providedBy(self.transport):
 			self.secureConnection = True
 	
 	def _callConnectAction(self):
 		self._connectHandlerTimer = None
 		if self.ircd.runActionUntilFalse("userconnect", self, users=[self]):
-			self.transport.loseConnection()
+			self.ircd.connectionsRejected += 1
+			self.closeConnection()
 		else:
 			self.register("connection")
 	
@@ -108,6 +116,15 @@ class IRCUser(IRCBase):
 		self.ircd.runActionStandard("usersenddata", self, line, users=[self])
 		IRCBase.sendLine(self, line)
 	
+	def sendQueueLimit(self):
+		return self.ircd.config.get("user_sendq_limit", 1048576)
+	
+	def sendQueueExceeded(self):
+		if self.uuid in self.ircd.users:
+			self.disconnect("SendQ exceeded")
+		else:
+			self.transport.loseConnection()
+	
 	def sendMessage(self, command, *args, **kw):
 		"""
 		Sends the given message to this user.
@@ -122,6 +139,53 @@ class IRCUser(IRCBase):
 		    you might want some messages to always have the last parameter
 		    prefixed with a colon. To do that, pass this as True.
 		"""
+		args = self._prepareOutgoingMessage(command, args, kw)
+		IRCBase.sendMessage(self, command, *args, **kw)
+	
+	def sendSharedMessage(self, lineCache, command, *args, **kw):
+		"""
+		Sends the given message to this user, reusing an already-built line
+		from lineCache if an identical message has been built for another user.
+		Used when sending the same message to many users, such as when sending
+		to a channel; the caller should provide the same (initially empty) dict
+		as lineCache for each recipient. Recipients given the same tags dict
+		share it; it isn't changed.
+		The modifyoutgoingmessage action is only run for users with something
+		in outgoingMessageModifiers.
+		Accepts the same keyword arguments as sendMessage.
+		"""
+		tags = kw.get("tags")
+		tagsById = False
+		if self.outgoingMessageModifiers:
+			# The message may be changed for this recipient, so they get their own tags and the line is looked up
+			# by the message contents.
+			if tags:
+				kw["tags"] = tags.copy()
+			args = self._prepareOutgoingMessage(command, args, kw)
+			if "tags" in kw and kw["tags"]:
+				tagKey = tuple(sorted(kw["tags"].iteritems()))
+			else:
+				tagKey = None
+		else:
+			# Otherwise, the tags are as given, and recipients given the same tags dict get the same line.
+			args = self._prepareOutgoingMessage(command, args, kw, False)
+			if tags:
+				tagKey = id(tags)
+				tagsById = True
+			else:
+				tags = None
+				tagKey = None
+		lineKey = (command, tuple(args), kw.get("prefix", None), tagKey, kw.get("alwaysPrefixLastParam", False))
+		if lineKey in lineCache:
+			cachedTags, line = lineCache[lineKey]
+			if not tagsById or cachedTags is tags: # An ID can only be reused once its dict is gone
+				self.sendLine(line)
+				return
+		line = self._buildMessageLine(command, args, kw)
+		lineCache[lineKey] = (tags, line)
+		self.sendLine(line)
+	
+	def _prepareOutgoingMessage(self, command, args, kw, modifyMessage = True):
 		if "prefix" not in kw:
 			kw["prefix"] = self.ircd.name
 		if kw["prefix"] is None:
@@ -132,8 +196,11 @@ class IRCUser(IRCBase):
 			del kw["to"]
 		if to:
 			args = [to] + list(args)
-		self.ircd.runActionStandard("modifyoutgoingmessage", self, command, args, kw)
-		IRCBase.sendMessage(self, command, *args, **kw)
+		else:
+			args = list(args)
+		if modifyMessage and self.outgoingMessageModifiers:
+			self.ircd.runActionStandard("modifyoutgoingmessage", self, command, args, kw)
+		return args
 	
 	def handleCommand(self, command, params, prefix, tags):
 		if self.uuid not in self.ircd.users:
@@ -174,7 +241,7 @@ class IRCUser(IRCBase):
 			for handler in handlers:
 				if handler[0].execute(self, data):
 					if handler[0].resetsIdleTime:
-						self.idleSince = now()
+						self.idleSince = self.ircd.clock.now()
 					break # If the command executor returns True, it was handled
 			else:
 				return # Don't process commandextra if it wasn't handled
@@ -200,14 +267,16 @@ class IRCUser(IRCBase):
 	
 	def sendBatch(self, batchName):
 		"""
-		Sends the messages in the given batch to the user.
+		Sends the messages in the given batch to the user. The batch is
+		removed once it's sent.
 		"""
 		if batchName not in self._messageBatches:
 			return
-		batchType = self._messageBatches[batchName]["type"]
-		batchParameters = self._messageBatches[batchName]["parameters"]
+		batchData = self._messageBatches.pop(batchName)
+		batchType = batchData["type"]
+		batchParameters = batchData["parameters"]
 		self.ircd.runActionStandard("startbatchsend", self, batchName, batchType, batchParameters)
-		for messageData in self._messageBatches[batchName]["messages"]:
+		for messageData in batchData["messages"]:
 			self.sendMessage(messageData[0], *messageData[1], **messageData[2])
 		self.ircd.runActionStandard("endbatchsend", self, batchName, batchType, batchParameters)
 	
@@ -251,14 +320,40 @@ class IRCUser(IRCBase):
 		self._clearErrorBatch()
 	
 	def filterConditionalTags(self, conditionalTags):
+		"""
+		Returns the tags from conditionalTags that apply to this user. Each tag
+		maps to a (value, check) tuple; the check is either a function taking
+		the user or a capability bit the user must have.
+		"""
 		applyTags = {}
 		for tag, data in conditionalTags.iteritems():
 			value, check = data
-			if check(self):
+			if isinstance(check, (int, long)):
+				if self.capabilityMask & check:
+					applyTags[tag] = value
+			elif check(self):
 				applyTags[tag] = value
 		return applyTags
 	
+	def setCapabilityMask(self, capabilityMask):
+		"""
+		Sets the bits of the capabilities the user has enabled, keeping the
+		capability counts of the user's channels up to date.
+		"""
+		changedBits = self.capabilityMask ^ capabilityMask
+		if not changedBits:
+			return
+		addedBits = capabilityMask & changedBits
+		removedBits = self.capabilityMask & changedBits
+		self.capabilityMask = capabilityMask
+		if self.uuid[:3] != self.ircd.serverID:
+			return # Channels only count their local users' capabilities
+		for channel in self.channels:
+			channel._countCapabilities(addedBits, 1)
+			channel._countCapabilities(removedBits, -1)
+	
 	def connectionLost(self, reason):
+		IRCBase.connectionLost(self, reason)
 		if self.uuid in self.ircd.users:
 			self.disconnect("Connection reset")
 		self.disconnectedDeferred.callback(None)
@@ -272,41 +367,31 @@ class IRCUser(IRCBase):
 		# disconnection happens before registration completes. If the user is unregistered on disconnection, this prevents
 		# the user from completing registration.
 		self.addRegisterHold("QUIT")
-		if self._pinger:
-			if self._pinger.running:
-				self._pinger.stop()
-			self._pinger = None
+		self.ircd.pingService.removeUser(self)
 		if self._registrationTimeoutTimer:
-			if self._registrationTimeoutTimer.active():
-				self._registrationTimeoutTimer.cancel()
+			self._registrationTimeoutTimer.cancel()
 			self._registrationTimeoutTimer = None
-		if self._connectHandlerTimer and self._connectHandlerTimer.active():
+		if self._connectHandlerTimer:
 			self._connectHandlerTimer.cancel()
 			self._connectHandlerTimer = None
-		self.ircd.recentlyQuitUsers[self.uuid] = now()
+		self.ircd.markUserQuit(self.uuid)
 		del self.ircd.users[self.uuid]
+		self._unindexModes()
 		if self.isRegistered():
 			del self.ircd.userNicks[self.nick]
-		userSendList = [self]
+		userSendList = list(self.localNeighbors())
 		while self.channels:
-			channel = self.channels[0]
-			userSendList.extend(channel.users.keys())
-			self._leaveChannel(channel)
-		userSendList = [u for u in set(userSendList) if u.uuid[:3] == self.ircd.serverID]
-		userSendList.remove(self)
+			self._leaveChannel(self.channels[0])
 		self.ircd.runActionProcessing("quitmessage", userSendList, self, reason, users=[self] + userSendList)
 		self.ircd.runActionStandard("quit", self, reason, users=self)
-		self.transport.loseConnection()
+		self.closeConnection()
 	
 	def _timeoutRegistration(self):
 		if self.isRegistered():
-			self._pinger.start(self.ircd.config.get("user_ping_frequency", 60), False)
+			self.ircd.pingService.addUser(self)
 			return
 		self.disconnect("Registration timeout")
 	
-	def _ping(self):
-		self.ircd.runActionStandard("pinguser", self)
-	
 	def isRegistered(self):
 		"""
 		Returns True if this user session is fully registered.
@@ -330,7 +415,8 @@ class IRCUser(IRCBase):
 				return
 			self._registerHolds.add("registercheck") # The user shouldn't be considered registered until we complete these final checks
 			if self.ircd.runActionUntilFalse("register", self, users=[self]):
-				self.transport.loseConnection()
+				self.ircd.connectionsRejected += 1
+				self.closeConnection()
 				return
 			self._registerHolds.remove("registercheck")
 			self.ircd.userNicks[self.nick] = self.uuid
@@ -396,13 +482,10 @@ class IRCUser(IRCBase):
 		if oldNick and oldNick in self.ircd.userNicks:
 			del self.ircd.userNicks[self.nick]
 		self.nick = newNick
-		self.nickSince = now()
+		self.nickSince = self.ircd.clock.now()
 		if self.isRegistered():
 			self.ircd.userNicks[self.nick] = self.uuid
-			userSendList = [self]
-			for channel in self.channels:
-				userSendList.extend(channel.users.keys())
-			userSendList = [u for u in set(userSendList) if u.uuid[:3] == self.ircd.serverID]
+			userSendList = [self] + list(self.localNeighbors())
 			self.ircd.runActionProcessing("changenickmessage", userSendList, self, oldNick, users=userSendList)
 			self.ircd.runActionStandard("changenick", self, oldNick, fromServer, users=[self])
 	
@@ -588,6 +671,23 @@ class IRCUser(IRCBase):
 			return True
 		return self.ircd.runActionUntilValue("usercanseemetadata", self, visibility) is not False
 	
+	def localNeighbors(self, capabilityBit = None):
+		"""
+		Returns a set of the local users other than this one sharing at least
+		one channel with this user. Only each channel's local users are
+		checked, so large channels of remote users don't add to the cost.
+		If a capability bit is given, only users with that capability are
+		returned, and channels where no local user has it are skipped.
+		"""
+		neighbors = set()
+		for channel in self.channels:
+			if capabilityBit is None:
+				neighbors.update(channel.localUsers)
+			elif channel.capabilityUserCount(capabilityBit):
+				neighbors.update([user for user in channel.localUsers if user.capabilityMask & capabilityBit])
+		neighbors.discard(self)
+		return neighbors
+	
 	def joinChannel(self, channel, override = False):
 		"""
 		Joins the user to a channel. Specify the override parameter only if all
@@ -598,16 +698,16 @@ class IRCUser(IRCBase):
 		if not override:
 			if self.ircd.runActionUntilValue("joinpermission", channel, self, users=[self], channels=[channel]) is False:
 				return
-		channel.users[self] = { "status": "" }
+		channel.addUser(self)
 		self.channels.append(channel)
 		newChannel = False
 		if channel.name not in self.ircd.channels:
 			newChannel = True
 			self.ircd.channels[channel.name] = channel
-			self.ircd.recentlyDestroyedChannels[channel.name] = False
+			self.ircd.trackChannel(channel)
 		# We need to send the JOIN message before doing other processing, as chancreate will do things like
 		# mode defaulting, which will send messages about the channel before the JOIN message, which is bad.
-		messageUsers = [u for u in channel.users.iterkeys() if u.uuid[:3] == self.ircd.serverID]
+		messageUsers = list(channel.localUsers)
 		self.ircd.runActionProcessing("joinmessage", messageUsers, channel, self, users=messageUsers, channels=[channel])
 		if newChannel:
 			self.ircd.runActionStandard("channelcreate", channel, self, channels=[channel])
@@ -622,14 +722,14 @@ class IRCUser(IRCBase):
 		"""
 		if channel not in self.channels:
 			return
-		messageUsers = [u for u in channel.users.iterkeys() if u.uuid[:3] == self.ircd.serverID]
+		messageUsers = list(channel.localUsers)
 		self.ircd.runActionProcessing("leavemessage", messageUsers, channel, self, partType, typeData, fromServer, users=[self], channels=[channel])
 		self._leaveChannel(channel)
 	
 	def _leaveChannel(self, channel):
 		self.ircd.runActionStandard("leave", channel, self, users=[self], channels=[channel])
 		self.channels.remove(channel)
-		del channel.users[self]
+		channel.removeUser(self)
 	
 	def setModes(self, modes, defaultSource):
 		"""
@@ -656,7 +756,7 @@ class IRCUser(IRCBase):
 		defaultSourceName = self._sourceName(defaultSource)
 		if defaultSourceName is None:
 			raise ValueError ("Source must be a valid user or server ID.")
-		nowTime = now()
+		nowTime = self.ircd.clock.now()
 		for modeData in modes:
 			mode = modeData[1]
 			if mode not in self.ircd.userModeTypes:
@@ -703,7 +803,7 @@ class IRCUser(IRCBase):
 		adding = True
 		changes = []
 		setBy = self._sourceName(user.uuid)
-		setTime = now()
+		setTime = self.ircd.clock.now()
 		for mode in modes:
 			if len(changes) >= self.ircd.config.get("modes_per_line", 20):
 				break
@@ -764,10 +864,14 @@ class IRCUser(IRCBase):
 							return False
 				else:
 					self.modes[mode] = []
+					self._indexMode(mode)
 				self.modes[mode].append((parameter, setBy, setTime))
 				return True
-			if mode in self.modes and self.modes[mode] == parameter:
-				return False
+			if mode in self.modes:
+				if self.modes[mode] == parameter:
+					return False
+			else:
+				self._indexMode(mode)
 			self.modes[mode] = parameter
 			return True
 		
@@ -782,14 +886,36 @@ class IRCUser(IRCBase):
 				return False
 			if not self.modes[mode]:
 				del self.modes[mode]
+				self._unindexMode(mode)
 			return True
 		if mode not in self.modes:
 			return False
 		if modeType == ModeType.ParamOnUnset and parameter != self.modes[mode]:
 			return False
 		del self.modes[mode]
+		self._unindexMode(mode)
 		return True
 	
+	def _indexMode(self, mode):
+		"""
+		Adds the user to the ircd's usersByMode index, which maps each user
+		mode to the set of users that have it set.
+		"""
+		if mode not in self.ircd.usersByMode:
+			self.ircd.usersByMode[mode] = WeakSet()
+		self.ircd.usersByMode[mode].add(self)
+	
+	def _unindexMode(self, mode):
+		if mode not in self.ircd.usersByMode:
+			return
+		self.ircd.usersByMode[mode].discard(self)
+		if not self.ircd.usersByMode[mode]:
+			del self.ircd.usersByMode[mode]
+	
+	def _unindexModes(self):
+		for mode in self.modes:
+			self._unindexMode(mode)
+	
 	def _notifyModeChanges(self, modeChanges, source, sourceName):
 		if not modeChanges:
 			return 
@@ -843,6 +969,10 @@ class RemoteUser(IRCUser):
 	def __init__(self, ircd, ip, uuid = None, host = None):
 		IRCUser.__init__(self, ircd, ip, uuid, host)
 		self._registrationTimeoutTimer.cancel()
+		serverID = self.uuid[:3]
+		if serverID not in self.ircd.usersByServer:
+			self.ircd.usersByServer[serverID] = WeakSet()
+		self.ircd.usersByServer[serverID].add(self)
 	
 	def _startDNSResolving(self, timeout):
 		self.register("dns", True)
@@ -850,6 +980,9 @@ class RemoteUser(IRCUser):
 	def sendMessage(self, command, *params, **kw):
 		pass # Messages can't be sent directly to remote users.
 	
+	def sendSharedMessage(self, lineCache, command, *params, **kw):
+		pass
+	
 	def register(self, holdName, fromRemote = False):
 		"""
 		Handles registration of a remote user.
@@ -867,22 +1000,28 @@ class RemoteUser(IRCUser):
 	def addRegisterHold(self, holdName):
 		pass # We're just not going to allow this here.
 	
-	def disconnect(self, reason, fromRemote = False):
+	def disconnect(self, reason, fromRemote = False, sendQuitMessage = True):
 		"""
-		Disconnects the remote user from the remote server.
+		Disconnects the remote user from the remote server. When removing the
+		user because of a netsplit, sendQuitMessage is False, and the QUIT
+		messages are sent together for all the split users instead.
 		"""
 		if fromRemote:
 			if self.isRegistered():
 				del self.ircd.userNicks[self.nick]
-			self.ircd.recentlyQuitUsers[self.uuid] = now()
+			self.ircd.markUserQuit(self.uuid)
 			del self.ircd.users[self.uuid]
-			userSendList = []
+			self._unindexModes()
+			serverID = self.uuid[:3]
+			if serverID in self.ircd.usersByServer:
+				self.ircd.usersByServer[serverID].discard(self)
+				if not self.ircd.usersByServer[serverID]:
+					del self.ircd.usersByServer[serverID]
+			userSendList = list(self.localNeighbors()) if sendQuitMessage else []
 			while self.channels:
-				channel = self.channels[0]
-				userSendList.extend(channel.users.keys())
-				self._leaveChannel(channel)
-			userSendList = [u for u in set(userSendList) if u.uuid[:3] == self.ircd.serverID]
-			self.ircd.runActionProcessing("quitmessage", userSendList, self, reason, users=userSendList)
+				self._leaveChannel(self.channels[0])
+			if userSendList:
+				self.ircd.runActionProcessing("quitmessage", userSendList, self, reason, users=userSendList)
 			self.ircd.runActionStandard("remotequit", self, reason, users=[self])
 		else:
 			self.ircd.runActionUntilTrue("remotequitrequest", self, reason, users=[self])
@@ -893,16 +1032,15 @@ class RemoteUser(IRCUser):
 		remote server, that server should be specified as the fromServer
 		parameter.
 		"""
+		if newNick == self.nick:
+			return
 		oldNick = self.nick
 		if self.nick and self.nick in self.ircd.userNicks and self.ircd.userNicks[self.nick] == self.uuid:
 			del self.ircd.userNicks[self.nick]
 		self.nick = newNick
 		self.ircd.userNicks[self.nick] = self.uuid
 		if self.isRegistered():
-			userSendList = [self]
-			for channel in self.channels:
-				userSendList.extend(channel.users.keys())
-			userSendList = [u for u in set(userSendList) if u.uuid[:3] == self.ircd.serverID]
+			userSendList = list(self.localNeighbors())
 			self.ircd.runActionProcessing("changenickmessage", userSendList, self, oldNick, users=userSendList)
 			self.ircd.runActionStandard("remotechangenick", self, oldNick, fromServer, users=[self])
 	
@@ -940,9 +1078,9 @@ class RemoteUser(IRCUser):
 			if channel.name not in self.ircd.channels:
 				newChannel = True
 				self.ircd.channels[channel.name] = channel
-			channel.users[self] = { "status": "" }
+			channel.addUser(self)
 			self.channels.append(channel)
-			messageUsers = [u for u in channel.users.iterkeys() if u.uuid[:3] == self.ircd.serverID]
+			messageUsers = list(channel.localUsers)
 			self.ircd.runActionProcessing("joinmessage", messageUsers, channel, self, users=[self], channels=[channel])
 			if newChannel:
 				self.ircd.runActionStandard("channelcreate", channel, self, channels=[channel])
@@ -953,7 +1091,7 @@ class RemoteUser(IRCUser):
 	def _leaveChannel(self, channel):
 		self.ircd.runActionStandard("remoteleave", channel, self, users=[self], channels=[channel])
 		self.channels.remove(channel)
-		del channel.users[self]
+		channel.removeUser(self)
 
 class LocalUser(IRCUser):
 	"""
@@ -966,7 +1104,6 @@ class LocalUser(IRCUser):
 		self._sendMsgFunc = lambda self, command, *args, **kw: None
 		self._registrationTimeoutTimer.cancel()
 		del self._registerHolds
-		self._pinger = None
 		self.nick = nick
 		self.ident = ident
 		self.gecos = gecos
@@ -989,20 +1126,28 @@ class LocalUser(IRCUser):
 		"""
 		self._sendMsgFunc(self, command, *args, **kw)
 	
+	def sendSharedMessage(self, lineCache, command, *args, **kw):
+		"""
+		Sends a message to this user. Local users don't have a connection to
+		which to send a built line, so the line cache is ignored.
+		"""
+		if "tags" in kw and kw["tags"]:
+			kw["tags"] = kw["tags"].copy() # The tags dict may be shared with other recipients
+		self.sendMessage(command, *args, **kw)
+	
 	def disconnect(self, reason):
 		"""
 		Cleans up and removes the user.
 		"""
 		del self.ircd.users[self.uuid]
+		self._unindexModes()
 		del self.ircd.userNicks[self.nick]
-		userSendList = [self]
-		for channel in self.channels:
-			userSendList.extend(channel.users.keys())
-		userSendList = [u for u in set(userSendList) if u.uuid[:3] == self.ircd.serverID]
-		userSendList.remove(self)
+		userSendList = list(self.localNeighbors())
 		self.ircd.log.debug("Removing local user {user.uuid} ({user.hostmask()}): {reason}", user=self, reason=reason)
 		self.ircd.runActionProcessing("quitmessage", userSendList, self, reason, users=userSendList)
 		self.ircd.runActionStandard("localquit", self, reason, users=[self])
+		while self.channels:
+			self._leaveChannel(self.channels[0])
 	
 	def joinChannel(self, channel, override = False):
 		"""
@@ -47,6 +47,15 @@ def ircLower(string):
 	"""
 	return string.lower().replace("[", "{").replace("]", "}").replace("\\", "|")
 
+def wildcardPattern(mask):
+	"""
+	Converts a mask using * and ? wildcards into a regular expression pattern
+	matching the same strings.
+	"""
+	# Masks should be lowercased with ircLower first, which removes any square brackets, so * and ? are the only
+	# special characters left.
+	return ".*".join([".".join([re.escape(part) for part in chunk.split("?")]) for chunk in mask.split("*")])
+
 class CaseInsensitiveDictionary(MutableMapping):
 	"""
 	It's a dictionary with RFC-case-insensitive keys.
@@ -204,6 +213,30 @@ def splitMessage(message, maxLength, splitOnCharacter = " "):
 			message = message[maxLength:]
 	return msgList
 
+def joinBulkEntry(fields):
+	"""
+	Joins a list of fields into a single token with no spaces in it, for
+	sending several entries in one parameter of a bulk server command. The
+	fields may contain spaces and commas; splitBulkEntry reverses this.
+	"""
+	return ",".join([field.replace("\\", "\\\\").replace(" ", "\\s").replace(",", "\\c") for field in fields])
+
+_bulkEscapeSequence = re.compile(r"\\(.)")
+_bulkEscapeValues = {
+	"\\": "\\",
+	"s": " ",
+	"c": ","
+}
+def _unescapeBulkChar(match):
+	char = match.group(1)
+	return _bulkEscapeValues.get(char, char)
+
+def splitBulkEntry(entry):
+	"""
+	Splits a token made by joinBulkEntry back into its list of fields.
+	"""
+	return [_bulkEscapeSequence.sub(_unescapeBulkChar, field) for field in entry.split(",")]
+
 # \x02: bold
 # \x1f: underline
 # \x16: reverse